@@ -0,0 +1,203 @@
+"""
+Benchmark the product, tag and validation APIs
+
+    python -m benchmarks.bench_api --scales 1000 100000 --backend memory \
+        --latency-ms 1 --output results.json
+
+Each scale loads "scale" synthetic products and measures per-operation
+latency for a sample of operations ("--sample" operations per benchmark).
+"""
+import argparse
+import contextlib
+import random
+
+from benchmarks.common import (
+    generate_products,
+    measure,
+    print_results,
+    setup_environment,
+    write_results,
+)
+
+
+BACKENDS = ['memory', 'sqlite', 'moto']
+
+
+@contextlib.contextmanager
+def dynamodb_resource(backend, latency):
+    from charm_product.backends import MemoryDynamoDB, SQLiteDynamoDB
+    from charm_product.schema import (
+        migrate_0001_create_product_tables,
+        migrate_0002_replace_product_tag_image_index,
+        migrate_0003_replace_product_tag_meta_index,
+        migrate_0004_delete_visual_features_table,
+        migrate_0005_create_product_tag_queue_index,
+        migrate_0006_replace_product_list_view_indexes,
+        migrate_0007_create_product_top_rank_indexes,
+        migrate_0008_create_product_counter_table,
+        migrate_0009_replace_product_store_index,
+        migrate_0010_create_product_modified_index,
+    )
+    migrations = [
+        migrate_0001_create_product_tables,
+        migrate_0002_replace_product_tag_image_index,
+        migrate_0003_replace_product_tag_meta_index,
+        migrate_0004_delete_visual_features_table,
+        migrate_0005_create_product_tag_queue_index,
+        migrate_0006_replace_product_list_view_indexes,
+        migrate_0007_create_product_top_rank_indexes,
+        migrate_0008_create_product_counter_table,
+        migrate_0009_replace_product_store_index,
+        migrate_0010_create_product_modified_index,
+    ]
+
+    if backend == 'moto':
+        if latency:
+            raise ValueError('Injected latency is only supported by local backends')
+        import boto3
+        import moto
+        with moto.mock_dynamodb2():
+            dynamodb = boto3.resource('dynamodb')
+            for migration in migrations:
+                migration.migrate(dynamodb)
+            yield dynamodb
+        return
+
+    if backend == 'memory':
+        dynamodb = MemoryDynamoDB()
+    else:
+        dynamodb = SQLiteDynamoDB()
+    for migration in migrations:
+        migration.migrate(dynamodb)
+    # only inject latency once tables are created
+    dynamodb.meta.client.latency = latency
+    yield dynamodb
+
+
+def run(scale, backend, latency_ms, sample, seed=0):
+    from charm_product.product import (
+        add_store_product,
+        delete_store_products,
+        fetch_products_by_brand,
+        fetch_products_by_product_uuid,
+        fetch_products_by_store,
+        get_store_product,
+        update_store_product,
+    )
+    from charm_product.util import clean_product_url
+    from charm_product.validation import parse_store_product_data
+
+    params = dict(scale=scale, backend=backend, latency_ms=latency_ms)
+    rng = random.Random(seed)
+    products = list(generate_products(scale, seed=seed))
+    sampled = rng.sample(products, min(sample, len(products)))
+    results = []
+
+    results.append(measure(
+        'parse_store_product_data',
+        lambda p: parse_store_product_data(dict(
+            store_product_url=clean_product_url(p['product_url']),
+            full_store_product_url=p['product_url'],
+            **{k: v for k, v in p.items() if k != 'product_url'}
+        )),
+        [(p,) for p in sampled],
+        **params
+    ))
+
+    with dynamodb_resource(backend, latency_ms / 1000) as dynamodb:
+        # load all products, measuring only the sampled adds
+        sampled_urls = {p['product_url'] for p in sampled}
+        for p in products:
+            if p['product_url'] not in sampled_urls:
+                add_store_product(dynamodb, **p)
+        results.append(measure(
+            'add_store_product',
+            lambda p: add_store_product(dynamodb, **p),
+            [(p,) for p in sampled],
+            **params
+        ))
+
+        results.append(measure(
+            'get_store_product',
+            lambda url: get_store_product(dynamodb, url),
+            [(p['product_url'],) for p in sampled],
+            **params
+        ))
+
+        results.append(measure(
+            'update_store_product',
+            lambda p: update_store_product(
+                dynamodb, p['product_url'],
+                title=p['title'] + ' Updated',
+                primary_price='9.99',
+                image_urls=[p['image_urls'][0] + '?v=2'],
+            ),
+            [(p,) for p in sampled],
+            **params
+        ))
+
+        stores = sorted({p['store_domain'] for p in sampled})
+        results.append(measure(
+            'fetch_products_by_store',
+            lambda store: list(fetch_products_by_store(dynamodb, store)),
+            [(s,) for s in stores[:sample]],
+            **params
+        ))
+
+        brands = sorted({p['store_product_brand_domain'] for p in sampled})
+        results.append(measure(
+            'fetch_products_by_brand',
+            lambda brand: list(fetch_products_by_brand(dynamodb, brand)),
+            [(b,) for b in brands[:sample]],
+            **params
+        ))
+
+        product_uuids = [
+            get_store_product(dynamodb, p['product_url'])['product_uuid']
+            for p in sampled
+        ]
+        results.append(measure(
+            'fetch_products_by_product_uuid',
+            lambda product_uuid: list(fetch_products_by_product_uuid(dynamodb, product_uuid)),
+            [(u,) for u in product_uuids],
+            **params
+        ))
+
+        batch_size = 25
+        urls = [clean_product_url(p['product_url']) for p in sampled]
+        results.append(measure(
+            'delete_store_products',
+            lambda batch: delete_store_products(dynamodb, batch),
+            [(urls[i:i + batch_size],) for i in range(0, len(urls), batch_size)],
+            n_items=len(urls),
+            **params
+        ))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--backend', choices=BACKENDS, default='memory')
+    parser.add_argument(
+        '--latency-ms', type=float, default=0,
+        help='latency injected per DynamoDB request (local backends only)',
+    )
+    parser.add_argument('--sample', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = []
+    for scale in args.scales:
+        results.extend(run(scale, args.backend, args.latency_ms, args.sample, args.seed))
+    print_results(results)
+
+    if args.output:
+        write_results(args.output, results, suite='api', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
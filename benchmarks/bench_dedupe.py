@@ -0,0 +1,136 @@
+"""
+Benchmark duplicate candidate generation (MinHash/LSH vs pairwise titles)
+
+    python -m benchmarks.bench_dedupe --scales 100000 1000000 --output results.json
+
+Synthetic titles are assigned to brands of about "--brand-size" products,
+with "--duplicate-rate" of products copying (and slightly changing) the
+title of another product of the same brand. Pairwise comparison (quadratic
+in brand size) is only timed up to "--pairwise-max-scale" products.
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.common import TITLE_WORDS, random_title, setup_environment, write_results
+
+
+def generate_titles(n_products, brand_size, duplicate_rate, seed=0):
+    rng = random.Random(seed)
+    n_brands = max(1, n_products // brand_size)
+    brand_titles = defaultdict(list)
+    products = []
+    for i in range(n_products):
+        brand_domain = f'brand-{rng.randrange(n_brands)}.com'
+        titles = brand_titles[brand_domain]
+        if titles and rng.random() < duplicate_rate:
+            words = rng.choice(titles).split()
+            if rng.random() < 0.5:
+                words.append(rng.choice(TITLE_WORDS).title())
+            title = ' '.join(words)
+        else:
+            title = random_title(rng, min_words=4, max_words=8)
+        titles.append(title)
+        products.append(dict(
+            store_product_url=f'store-{i % 1000}.com/products/{i}',
+            title=title,
+            brand_domain=brand_domain,
+        ))
+    return products
+
+
+def pairwise_candidates(products, threshold):
+    from charm_product.dedupe import title_tokens
+
+    groups = defaultdict(list)
+    for product in products:
+        groups[product['brand_domain']].append(
+            (product['store_product_url'], title_tokens(product['title']))
+        )
+    n_pairs = 0
+    for group in groups.values():
+        for n, (_, a) in enumerate(group):
+            for _, b in group[n + 1:]:
+                if len(a & b) / len(a | b) >= threshold:
+                    n_pairs += 1
+    return n_pairs
+
+
+def run(scale, brand_size, duplicate_rate, threshold, num_perm, pairwise_max_scale, seed=0):
+    from charm_product.dedupe import find_duplicate_candidates
+
+    products = generate_titles(scale, brand_size, duplicate_rate, seed)
+    n_brand_pairs = sum(
+        n * (n - 1) // 2 for n in _group_sizes(products).values()
+    )
+
+    results = []
+    start = time.perf_counter()
+    n_candidates = sum(
+        1 for _ in find_duplicate_candidates(products, threshold=threshold, num_perm=num_perm)
+    )
+    elapsed = time.perf_counter() - start
+    results.append(dict(
+        benchmark='dedupe minhash_lsh',
+        scale=scale,
+        seconds=elapsed,
+        titles_per_sec=scale / elapsed,
+        candidate_pairs=n_candidates,
+        brand_pairs=n_brand_pairs,
+    ))
+
+    if scale <= pairwise_max_scale:
+        start = time.perf_counter()
+        n_pairs = pairwise_candidates(products, threshold)
+        elapsed = time.perf_counter() - start
+        results.append(dict(
+            benchmark='dedupe pairwise',
+            scale=scale,
+            seconds=elapsed,
+            titles_per_sec=scale / elapsed,
+            candidate_pairs=n_pairs,
+            brand_pairs=n_brand_pairs,
+        ))
+    return results
+
+
+def _group_sizes(products):
+    sizes = defaultdict(int)
+    for product in products:
+        sizes[product['brand_domain']] += 1
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--brand-size', type=int, default=500)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--num-perm', type=int, default=64)
+    parser.add_argument('--pairwise-max-scale', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = []
+    for scale in args.scales:
+        results.extend(run(
+            scale, args.brand_size, args.duplicate_rate, args.threshold, args.num_perm,
+            args.pairwise_max_scale, args.seed,
+        ))
+    for r in results:
+        print(
+            f'{r["benchmark"]:<24} scale={r["scale"]:<8} {r["seconds"]:8.2f}s '
+            f'{r["titles_per_sec"]:12,.0f} titles/s {r["candidate_pairs"]:>10,} pairs '
+            f'(of {r["brand_pairs"]:,} brand pairs)'
+        )
+
+    if args.output:
+        write_results(args.output, results, suite='dedupe', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark product item deserialization (resource layer vs "lowlevel")
+
+    python -m benchmarks.bench_deserialize --scales 10000 --output results.json
+
+Items are serialized to DynamoDB "AttributeValue" JSON (as returned by the
+low-level client) and decoded per query page of 100 items with the boto3
+"TypeDeserializer" (as the resource layer does, followed by the
+"is_available" conversion of "product._fetch_products") and with the
+"lowlevel" product deserializer.
+"""
+import argparse
+import time
+import uuid
+
+from benchmarks.common import (
+    generate_products,
+    print_results,
+    setup_environment,
+    summarize,
+    write_results,
+)
+
+
+PAGE_SIZE = 100
+
+
+def serialized_items(n_products, seed=0):
+    from boto3.dynamodb.types import TypeSerializer
+    from charm_product.util import clean_product_url
+    from charm_product.validation import parse_store_product_data
+
+    serializer = TypeSerializer()
+    items = []
+    for p in generate_products(n_products, seed=seed):
+        item = parse_store_product_data(dict(
+            store_product_url=clean_product_url(p['product_url']),
+            full_store_product_url=p['product_url'],
+            **{k: v for k, v in p.items() if k != 'product_url'}
+        ))
+        item['product_uuid'] = uuid.uuid4().hex
+        item['brand_domain'] = item['store_product_brand_domain']
+        items.append({k: serializer.serialize(v) for k, v in item.items()})
+    return items
+
+
+def resource_deserialize(deserializer, page):
+    results = []
+    for item in page:
+        item = {k: deserializer.deserialize(v) for k, v in item.items()}
+        if 'is_available' in item:
+            item['is_available'] = bool(item['is_available'])
+        results.append(item)
+    return results
+
+
+def lowlevel_deserialize(deserialize, page):
+    return [deserialize(item) for item in page]
+
+
+def run(scale, seed=0):
+    from boto3.dynamodb.types import TypeDeserializer
+    from charm_product.lowlevel import make_product_deserializer
+
+    items = serialized_items(scale, seed)
+    pages = [(items[i:i + PAGE_SIZE],) for i in range(0, len(items), PAGE_SIZE)]
+    only_attributes = ['store_product_url', 'primary_price', 'is_available']
+
+    benchmarks = [
+        ('deserialize resource', resource_deserialize, TypeDeserializer()),
+        ('deserialize lowlevel', lowlevel_deserialize, make_product_deserializer()),
+        (
+            'deserialize lowlevel decimal',
+            lowlevel_deserialize, make_product_deserializer(numbers='decimal'),
+        ),
+        (
+            'deserialize lowlevel 3 attrs',
+            lowlevel_deserialize, make_product_deserializer(only_attributes),
+        ),
+    ]
+
+    results = []
+    for name, func, deserializer in benchmarks:
+        latencies = []
+        for page, in pages:
+            start = time.perf_counter()
+            func(deserializer, page)
+            latencies.append(time.perf_counter() - start)
+        results.append(summarize(name, latencies, n_items=scale, scale=scale))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = []
+    for scale in args.scales:
+        results.extend(run(scale, args.seed))
+    print_results(results)
+    for r in results:
+        print(f'{r["benchmark"]:<32} {r["items_per_sec"]:>12,.0f} items/s')
+
+    if args.output:
+        write_results(args.output, results, suite='deserialize', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the import time of "charm_product" modules
+
+    python -m benchmarks.bench_import --repeat 20 --output results.json
+
+Each import is timed in a fresh interpreter (cold start, including the
+modules pulled in by the import).
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.common import (
+    print_results,
+    setup_environment,
+    summarize,
+    write_results,
+)
+
+
+MODULES = [
+    'charm_product.util',
+    'charm_product.validation',
+    'charm_product.tag',
+    'charm_product.product',
+    'charm_product.session',
+    'charm_product.backends',
+]
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(
+    seconds=elapsed,
+    boto3_imported='boto3' in sys.modules,
+    n_modules=len(sys.modules),
+)))
+'''
+
+
+def time_import(module):
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def run(modules, repeat):
+    results = []
+    for module in modules:
+        timings = [time_import(module) for _ in range(repeat)]
+        results.append(summarize(
+            f'import {module}',
+            [t['seconds'] for t in timings],
+            boto3_imported=timings[0]['boto3_imported'],
+            n_modules=timings[0]['n_modules'],
+        ))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = run(args.modules, args.repeat)
+    print_results(results)
+    for r in results:
+        if r['boto3_imported']:
+            print(f'{r["benchmark"]} imports boto3')
+
+    if args.output:
+        write_results(args.output, results, suite='import', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark the memory used by fetched products (dicts vs "StoreProduct" vs a
+memory-mapped "ProductSnapshot")
+
+    python -m benchmarks.bench_memory --scales 10000 100000 --output results.json
+
+Products are shaped like items returned by DynamoDB queries (numbers as
+"Decimal", distinct string objects per item) and measured with "tracemalloc".
+Snapshot pages are shared through the OS page cache and not counted.
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+from benchmarks.common import generate_products, setup_environment, write_results
+
+
+def dynamodb_items(n_products, seed=0):
+    from charm_product.util import clean_product_url
+    from charm_product.validation import parse_store_product_data
+
+    for p in generate_products(n_products, seed=seed):
+        item = parse_store_product_data(dict(
+            store_product_url=clean_product_url(p['product_url']),
+            full_store_product_url=p['product_url'],
+            **{k: v for k, v in p.items() if k != 'product_url'}
+        ))
+        item['product_uuid'] = uuid.uuid4().hex
+        item['brand_domain'] = item['store_product_brand_domain']
+        yield {k: deserialized_copy(v) for k, v in item.items()}
+
+
+def deserialized_copy(value):
+    # deserialized items have their own copy of each value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, str):
+        return ''.join(list(value))
+    if isinstance(value, list):
+        return [deserialized_copy(v) for v in value]
+    return value
+
+
+def measure_memory(func):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, result
+
+
+def run(scale, seed=0):
+    from charm_product.record import StoreProduct
+    from charm_product.snapshot import ProductSnapshot, write_snapshot
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    snapshot_path = os.path.join(tmp_dir.name, 'products.snap')
+    write_snapshot(snapshot_path, dynamodb_items(scale, seed))
+
+    results = []
+    for name, load in [
+        ('dict', lambda: list(dynamodb_items(scale, seed))),
+        ('StoreProduct', lambda: [
+            StoreProduct.from_item(item) for item in dynamodb_items(scale, seed)
+        ]),
+        ('ProductSnapshot', lambda: ProductSnapshot(snapshot_path)),
+    ]:
+        n_bytes, products = measure_memory(load)
+        results.append(dict(
+            benchmark=f'memory {name}',
+            scale=scale,
+            total_mb=n_bytes / 2 ** 20,
+            bytes_per_product=n_bytes / scale,
+        ))
+        if isinstance(products, ProductSnapshot):
+            products.close()
+        del products
+    tmp_dir.cleanup()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = []
+    for scale in args.scales:
+        results.extend(run(scale, args.seed))
+    for r in results:
+        print(
+            f'{r["benchmark"]:<24} scale={r["scale"]:<8} '
+            f'{r["total_mb"]:10.1f} MB {r["bytes_per_product"]:10.0f} bytes/product'
+        )
+
+    if args.output:
+        write_results(args.output, results, suite='memory', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark token group search (inverted index vs regex over every title)
+
+    python -m benchmarks.bench_search --scales 100000 1000000 --output results.json
+
+Synthetic titles are indexed into a temporary SQLite search index, then the
+product title blacklist token groups are queried with the index and by
+matching each title as "contains_blacklist_tokens" does.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import TITLE_WORDS, random_title, setup_environment, write_results
+
+
+def generate_products(n_products, seed=0):
+    rng = random.Random(seed)
+    for i in range(n_products):
+        title = random_title(rng, min_words=3, max_words=8)
+        if rng.random() < 0.001:
+            title = f'{title} Gift Card'
+        yield dict(
+            store_product_url=f'store-{i % 1000}.com/products/{i}',
+            title=title,
+            vendor_name=rng.choice(TITLE_WORDS).title(),
+        )
+
+
+def run(scale, seed=0):
+    from charm_product.search import SearchIndex
+    from charm_product.validation import (
+        PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS,
+        PRODUCT_TITLE_BLACKLIST_TOKENS,
+        contains_blacklist_tokens,
+    )
+
+    token_groups = PRODUCT_TITLE_BLACKLIST_TOKENS
+    products = list(generate_products(scale, seed))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'search.db')
+        with SearchIndex(path) as index:
+            start = time.perf_counter()
+            index.update(products)
+            elapsed = time.perf_counter() - start
+            results.append(dict(
+                benchmark='search build', scale=scale, seconds=elapsed,
+                index_bytes=os.path.getsize(path),
+            ))
+
+            start = time.perf_counter()
+            report = index.update(products, complete=True)
+            elapsed = time.perf_counter() - start
+            results.append(dict(
+                benchmark='search rebuild unchanged', scale=scale, seconds=elapsed,
+                unchanged=report['unchanged'],
+            ))
+
+            start = time.perf_counter()
+            n_matches = sum(len(urls) for urls in index.search_token_groups(token_groups).values())
+            elapsed = time.perf_counter() - start
+            results.append(dict(
+                benchmark='search index query', scale=scale, seconds=elapsed,
+                ms_per_query=elapsed * 1000 / len(token_groups), matches=n_matches,
+            ))
+
+    start = time.perf_counter()
+    n_matches = sum(
+        1 for regex in PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS for product in products
+        if contains_blacklist_tokens(product['title'], [regex])[0]
+    )
+    elapsed = time.perf_counter() - start
+    results.append(dict(
+        benchmark='search regex scan', scale=scale, seconds=elapsed,
+        ms_per_query=elapsed * 1000 / len(token_groups), matches=n_matches,
+    ))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    results = []
+    for scale in args.scales:
+        results.extend(run(scale, args.seed))
+    for r in results:
+        extra = ', '.join(
+            f'{k}={r[k]:,.3f}' if isinstance(r[k], float) else f'{k}={r[k]:,}'
+            for k in ['ms_per_query', 'matches', 'index_bytes', 'unchanged'] if k in r
+        )
+        print(f'{r["benchmark"]:<26} scale={r["scale"]:<8} {r["seconds"]:8.2f}s {extra}')
+
+    if args.output:
+        write_results(args.output, results, suite='search', argv=argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Shared helpers for "charm_product" benchmarks
+"""
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+
+TITLE_WORDS = [
+    'organic', 'cotton', 'classic', 'slim', 'fit', 'leather', 'wallet', 'ceramic',
+    'mug', 'linen', 'shirt', 'wool', 'sweater', 'canvas', 'tote', 'bag', 'vintage',
+    'denim', 'jacket', 'silver', 'ring', 'gold', 'necklace', 'candle', 'soy', 'lavender',
+    'bamboo', 'toothbrush', 'recycled', 'bottle', 'glass', 'jar', 'oak', 'cutting', 'board',
+    'stainless', 'steel', 'kettle', 'cast', 'iron', 'pan', 'merino', 'socks', 'running',
+    'shoes', 'yoga', 'mat', 'hemp', 'hat', 'black', 'white', 'blue', 'green', 'large', 'small',
+]
+PRODUCT_TYPES = ['apparel', 'home', 'kitchen', 'beauty', 'accessories', 'footwear']
+
+
+def setup_environment():
+    """
+    Configure the environment required to import and call the API
+    """
+    os.environ.setdefault('CHARM_PRODUCT_ENV', 'dev')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIA0000000000000000')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', '0' * 40)
+
+
+def random_title(rng, min_words=2, max_words=6):
+    return ' '.join(
+        rng.choice(TITLE_WORDS) for _ in range(rng.randint(min_words, max_words))
+    ).title()
+
+
+def generate_products(n_products, n_stores=None, n_brands=None, seed=0):
+    """
+    Generate synthetic "add_store_product" keyword arguments
+    """
+    rng = random.Random(seed)
+    n_stores = n_stores or max(1, n_products // 1000)
+    n_brands = n_brands or max(1, n_products // 200)
+    scraped_at = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
+
+    for i in range(n_products):
+        store_domain = f'store-{i % n_stores}.com'
+        brand_domain = f'brand-{rng.randrange(n_brands)}.com'
+        title = random_title(rng)
+        slug = title.lower().replace(' ', '-')
+        yield dict(
+            product_url=f'https://www.{store_domain}/products/{slug}-{i}',
+            store_domain=store_domain,
+            is_available=rng.random() < 0.9,
+            title=title,
+            description=' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(20, 200))),
+            image_urls=[
+                f'https://cdn.{store_domain}/images/{i}-{j}.jpg'
+                for j in range(rng.randint(1, 5))
+            ],
+            product_type=rng.choice(PRODUCT_TYPES),
+            primary_currency='USD',
+            primary_price=f'{rng.uniform(1, 500):.2f}',
+            best_selling_position=rng.randint(1, 10000),
+            vendor_name=brand_domain.split('.')[0].replace('-', ' '),
+            store_product_brand_domain=brand_domain,
+            store_platform='shopify',
+            first_scraped_at=scraped_at,
+            last_scraped_at=scraped_at,
+            scraper_type='shopify_scraper',
+            json_data=json.dumps({'variants': [
+                {'sku': f'{i}-{j}', 'price': f'{rng.uniform(1, 500):.2f}'}
+                for j in range(rng.randint(1, 8))
+            ]}),
+        )
+
+
+def summarize(name, latencies, n_items=None, **params):
+    """
+    Summarize per-operation latencies (in seconds)
+    """
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    result = dict(
+        benchmark=name,
+        n_ops=len(latencies),
+        ops_per_sec=len(latencies) / total if total else None,
+        mean_ms=1000 * statistics.mean(latencies),
+        p50_ms=1000 * percentile(latencies, 50),
+        p99_ms=1000 * percentile(latencies, 99),
+        **params
+    )
+    if n_items is not None:
+        result['items_per_sec'] = n_items / total if total else None
+    return result
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, func, args_list, **params):
+    """
+    Time "func" for each argument tuple in "args_list"
+    """
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return summarize(name, latencies, **params)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results, **metadata):
+    """
+    Write benchmark results as JSON (compare results using "benchmarks.compare")
+    """
+    output = dict(
+        metadata=dict(
+            git_revision=git_revision(),
+            python_version=sys.version.split()[0],
+            platform=platform.platform(),
+            created_at=datetime.datetime.utcnow().isoformat(),
+            **metadata
+        ),
+        results=results,
+    )
+    with open(path, 'w') as fh:
+        json.dump(output, fh, indent=2)
+
+
+def print_results(results):
+    for r in results:
+        params = ', '.join(
+            f'{k}={r[k]}' for k in ['backend', 'scale', 'latency_ms'] if k in r
+        )
+        ops = f'{r["ops_per_sec"]:>12,.1f} ops/s' if r.get('ops_per_sec') else ' ' * 18
+        print(
+            f'{r["benchmark"]:<32} {ops} '
+            f'p50={r["p50_ms"]:8.3f}ms p99={r["p99_ms"]:8.3f}ms  ({params})'
+        )
@@ -0,0 +1,52 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import json
+
+
+KEY_FIELDS = ['benchmark', 'backend', 'scale', 'latency_ms']
+
+
+def result_key(result):
+    return tuple(result.get(k) for k in KEY_FIELDS)
+
+
+def compare(baseline, results, metric='p50_ms'):
+    baseline_by_key = {result_key(r): r for r in baseline['results']}
+    rows = []
+    for result in results['results']:
+        base = baseline_by_key.get(result_key(result))
+        if base is None or base.get(metric) in (None, 0) or result.get(metric) is None:
+            continue
+        rows.append((
+            result_key(result), base[metric], result[metric], result[metric] / base[metric]
+        ))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    parser.add_argument('--metric', default='p50_ms')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.results) as fh:
+        results = json.load(fh)
+
+    print(
+        f'baseline: {baseline["metadata"].get("git_revision")}  '
+        f'results: {results["metadata"].get("git_revision")}  ({args.metric})'
+    )
+    for key, base, new, ratio in compare(baseline, results, args.metric):
+        name = ' '.join(str(k) for k in key if k is not None)
+        print(f'{name:<48} {base:>12.3f} {new:>12.3f} {ratio:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
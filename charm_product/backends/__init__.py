@@ -0,0 +1,11 @@
+from charm_product.backends.base import LocalDynamoDB, LocalTable, Storage
+from charm_product.backends.memory import MemoryDynamoDB
+from charm_product.backends.sqlite import SQLiteDynamoDB
+
+__all__ = [
+    'LocalDynamoDB',
+    'LocalTable',
+    'MemoryDynamoDB',
+    'SQLiteDynamoDB',
+    'Storage',
+]
@@ -0,0 +1,927 @@
+import abc
+import contextlib
+import math
+import threading
+import time
+import zlib
+from boto3.dynamodb.table import BatchWriter
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from decimal import Decimal
+
+from charm_product.backends.expressions import (
+    ExpressionError,
+    apply_update,
+    condition_attribute_values,
+    evaluate_condition,
+    parse_projection,
+    project,
+)
+
+
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_GET_MAX_KEYS = 100
+# Number of index entries read from storage at a time by queries and scans
+READ_CHUNK_SIZE = 256
+
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _client_error_class(name):
+    return type(name, (ClientError,), {})
+
+
+class LocalDynamoDBExceptions:
+    ClientError = ClientError
+    ConditionalCheckFailedException = _client_error_class('ConditionalCheckFailedException')
+    LimitExceededException = _client_error_class('LimitExceededException')
+    ProvisionedThroughputExceededException = _client_error_class(
+        'ProvisionedThroughputExceededException'
+    )
+    ResourceInUseException = _client_error_class('ResourceInUseException')
+    ResourceNotFoundException = _client_error_class('ResourceNotFoundException')
+
+
+def _error(operation_name, code, message):
+    error_class = getattr(LocalDynamoDBExceptions, code, ClientError)
+    return error_class({'Error': {'Code': code, 'Message': message}}, operation_name)
+
+
+def normalize_item(item):
+    """
+    Convert an item to the values returned by the boto3 resource layer
+    (ints to Decimal, bytes to Binary etc.)
+    """
+    try:
+        return _deserializer.deserialize(_serializer.serialize(item))
+    except TypeError as e:
+        raise ExpressionError(str(e))
+
+
+def copy_value(value):
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def encode_key_value(value):
+    if isinstance(value, str):
+        return 'S' + value
+    if isinstance(value, Decimal):
+        return 'N' + str(value.normalize())
+    if isinstance(value, Binary):
+        return 'B' + value.value.hex()
+    raise ExpressionError(f'Invalid key value: {value!r}')
+
+
+def _encode_number(value):
+    """
+    Encode a number so that encoded numbers sort in numeric order
+    """
+    if value == 0:
+        return b'\x02'
+    sign, digits, exponent = value.normalize().as_tuple()
+    magnitude = len(digits) + exponent
+    if sign:
+        # larger magnitudes sort first, and a shorter mantissa sorts after
+        # any longer mantissa it prefixes
+        return (
+            b'\x01' + (0x8000 - magnitude).to_bytes(2, 'big') +
+            bytes(ord('9') - d for d in digits) + b'~'
+        )
+    return b'\x03' + (0x8000 + magnitude).to_bytes(2, 'big') + bytes(ord('0') + d for d in digits)
+
+
+def _encode_sort_value(value):
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+    elif isinstance(value, Decimal):
+        data = _encode_number(value)
+    elif isinstance(value, Binary):
+        data = value.value
+    else:
+        raise ExpressionError(f'Invalid key value: {value!r}')
+    # escape NUL bytes and terminate each value so that concatenated values
+    # sort as tuples
+    return data.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+
+def encode_sort_key(values):
+    """
+    Encode key values as bytes sorting in the order DynamoDB returns items
+    (strings and binary values by their bytes, numbers numerically)
+    """
+    return b''.join(_encode_sort_value(value) for value in values)
+
+
+def attribute_size(value):
+    """
+    Estimate the size of an attribute value (in bytes) as used by DynamoDB
+    to calculate consumed capacity
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Decimal):
+        return (len(value.as_tuple().digits) + 1) // 2 + 1
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return 3 + item_size(value)
+    if isinstance(value, list):
+        return 3 + sum(attribute_size(v) + 1 for v in value)
+    if isinstance(value, set):
+        return sum(attribute_size(v) for v in value)
+    raise ExpressionError(f'Unsupported value type: {type(value)}')
+
+
+def item_size(item):
+    return sum(len(k.encode('utf-8')) + attribute_size(v) for k, v in item.items())
+
+
+def _write_units(item):
+    if item is None:
+        return 0
+    return max(1, math.ceil(item_size(item) / 1024))
+
+
+def _read_units(size, consistent_read=False):
+    units = max(1, math.ceil(size / 4096))
+    return float(units if consistent_read else units / 2)
+
+
+def _consumed_capacity(table_name, mode, table_units, index_units=None, write=False):
+    units_name = 'WriteCapacityUnits' if write else 'ReadCapacityUnits'
+    index_units = index_units or {}
+    total = float(table_units + sum(index_units.values()))
+    consumed = {'TableName': table_name, 'CapacityUnits': total, units_name: total}
+    if mode == 'INDEXES':
+        consumed['Table'] = {'CapacityUnits': float(table_units), units_name: float(table_units)}
+        if index_units:
+            consumed['GlobalSecondaryIndexes'] = {
+                index_name: {'CapacityUnits': float(units), units_name: float(units)}
+                for index_name, units in index_units.items()
+            }
+    return consumed
+
+
+def _returns_capacity(mode):
+    return mode in ('TOTAL', 'INDEXES')
+
+
+class IndexSchema:
+
+    def __init__(self, description):
+        self.name = description['IndexName']
+        self.hash_key, self.range_key = _key_names(description['KeySchema'])
+        projection = description.get('Projection', {'ProjectionType': 'ALL'})
+        self.projection_type = projection['ProjectionType']
+        self.non_key_attributes = list(projection.get('NonKeyAttributes', []))
+
+    @property
+    def key_names(self):
+        return [k for k in [self.hash_key, self.range_key] if k is not None]
+
+
+class TableSchema:
+
+    def __init__(self, description):
+        self.description = description
+        self.name = description['TableName']
+        self.attribute_types = {
+            a['AttributeName']: a['AttributeType']
+            for a in description['AttributeDefinitions']
+        }
+        self.hash_key, self.range_key = _key_names(description['KeySchema'])
+        self.indexes = {
+            gsi['IndexName']: IndexSchema(gsi)
+            for gsi in description.get('GlobalSecondaryIndexes', [])
+        }
+        key_names = set(self.key_names)
+        for index in self.indexes.values():
+            key_names.update(index.key_names)
+        self.key_attribute_types = {
+            name: attr_type for name, attr_type in self.attribute_types.items()
+            if name in key_names
+        }
+
+    @property
+    def key_names(self):
+        return [k for k in [self.hash_key, self.range_key] if k is not None]
+
+    def primary_key(self, item):
+        return '\x00'.join(encode_key_value(item[k]) for k in self.key_names)
+
+    def sort_key(self, item, index_name=None):
+        """
+        Get the encoded sort key of an item within its base table or index
+        partition (the index range key followed by the primary key)
+        """
+        values = [item[k] for k in self.key_names]
+        if index_name:
+            index = self.indexes[index_name]
+            if index.range_key is not None:
+                values.insert(0, item[index.range_key])
+        return encode_sort_key(values)
+
+    def index_keys(self, item):
+        """
+        Get the encoded hash key and sort key of the item for the base table
+        and each index containing it (items missing an index key attribute
+        are not indexed)
+        """
+        keys = {'': (encode_key_value(item[self.hash_key]), self.sort_key(item))}
+        for index in self.indexes.values():
+            if all(k in item for k in index.key_names):
+                keys[index.name] = (
+                    encode_key_value(item[index.hash_key]), self.sort_key(item, index.name)
+                )
+        return keys
+
+    def project(self, item, index_name):
+        if not index_name:
+            return item
+        index = self.indexes[index_name]
+        if index.projection_type == 'ALL':
+            return item
+        attributes = set(self.key_names) | set(index.key_names)
+        if index.projection_type == 'INCLUDE':
+            attributes |= set(index.non_key_attributes)
+        return {k: v for k, v in item.items() if k in attributes}
+
+
+def _key_names(key_schema):
+    hash_key = range_key = None
+    for key in key_schema:
+        if key['KeyType'] == 'HASH':
+            hash_key = key['AttributeName']
+        else:
+            range_key = key['AttributeName']
+    return hash_key, range_key
+
+
+class Storage(abc.ABC):
+    """
+    Storage interface for local backends
+
+    Items are stored by table name and encoded primary key. Each item is
+    associated with an encoded hash key and sort key per index containing it
+    (the base table keys are stored under the index name ""). Scans and
+    queries return "(sort key, item)" pairs in sort key order, starting after
+    the "start" sort key, so that pages are read without loading the whole
+    table or partition.
+    """
+
+    @abc.abstractmethod
+    def load_schemas(self):
+        pass
+
+    @abc.abstractmethod
+    def save_schema(self, table_name, description):
+        pass
+
+    @abc.abstractmethod
+    def delete_table(self, table_name):
+        pass
+
+    @abc.abstractmethod
+    def get(self, table_name, pk):
+        pass
+
+    @abc.abstractmethod
+    def put(self, table_name, pk, item, index_keys):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, table_name, pk):
+        pass
+
+    @abc.abstractmethod
+    def scan(self, table_name, start=None, limit=None):
+        pass
+
+    @abc.abstractmethod
+    def query(self, table_name, index_name, hash_value, start=None, reverse=False, limit=None):
+        pass
+
+    def count(self, table_name):
+        return len(self.scan(table_name))
+
+    def transaction(self):
+        """
+        Context in which writes are applied together (used for batch writes)
+        """
+        return contextlib.nullcontext()
+
+
+class LocalDynamoDBClient:
+    """
+    Local stand-in for the DynamoDB client of a boto3 DynamoDB resource
+
+    Accepts and returns python values (as the resource client does) rather
+    than DynamoDB "AttributeValue" types. "latency" seconds are slept per
+    request to simulate network round trips.
+    """
+
+    exceptions = LocalDynamoDBExceptions
+
+    # items are python values (see "charm_product.lowlevel")
+    native_types = True
+
+    def __init__(self, storage, latency=0):
+        self._storage = storage
+        self.latency = latency
+        # serializes storage access so one client can be shared between threads
+        self._lock = threading.RLock()
+        self._schemas = {
+            name: TableSchema(description)
+            for name, description in storage.load_schemas().items()
+        }
+
+    def _request(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _schema(self, operation_name, table_name):
+        try:
+            return self._schemas[table_name]
+        except KeyError:
+            raise _error(
+                operation_name, 'ResourceNotFoundException',
+                f'Requested resource not found: Table: {table_name} not found'
+            )
+
+    def _key(self, operation_name, schema, key):
+        if set(key) != set(schema.key_names):
+            raise _error(
+                operation_name, 'ValidationException',
+                'The provided key element does not match the schema'
+            )
+        return normalize_item(key)
+
+    def _validate_item(self, operation_name, schema, item):
+        for name, attr_type in schema.key_attribute_types.items():
+            if name not in item:
+                if name in schema.key_names:
+                    raise _error(
+                        operation_name, 'ValidationException',
+                        f'One or more parameter values were invalid: Missing the key {name} '
+                        'in the item'
+                    )
+                continue
+            value = item[name]
+            valid_type = {
+                'S': isinstance(value, str) and value != '',
+                'N': isinstance(value, Decimal),
+                'B': isinstance(value, Binary),
+            }[attr_type]
+            if not valid_type:
+                raise _error(
+                    operation_name, 'ValidationException',
+                    'One or more parameter values were invalid: Type mismatch for key '
+                    f'{name} expected: {attr_type}'
+                )
+
+    def _check_condition(self, operation_name, condition, item):
+        try:
+            if not evaluate_condition(condition, item or {}):
+                raise _error(
+                    operation_name, 'ConditionalCheckFailedException',
+                    'The conditional request failed'
+                )
+        except ExpressionError as e:
+            raise _error(operation_name, 'ValidationException', str(e))
+
+    def _write_capacity(self, schema, mode, old_item, new_item):
+        """
+        Estimate write capacity for replacing "old_item" with "new_item" in the
+        table and each index (index entries are only written if the projected
+        item changes)
+        """
+        index_units = {}
+        for index in schema.indexes.values():
+            old_entry = new_entry = None
+            if old_item is not None and all(k in old_item for k in index.key_names):
+                old_entry = schema.project(old_item, index.name)
+            if new_item is not None and all(k in new_item for k in index.key_names):
+                new_entry = schema.project(new_item, index.name)
+            if old_entry == new_entry:
+                continue
+
+            units = _write_units(new_entry)
+            if old_entry is not None and (
+                new_entry is None or
+                any(old_entry[k] != new_entry[k] for k in index.key_names)
+            ):
+                # index entry is moved (deleted and re-written)
+                units += _write_units(old_entry)
+            index_units[index.name] = units
+
+        table_units = max(1, _write_units(old_item), _write_units(new_item))
+        return _consumed_capacity(schema.name, mode, table_units, index_units, write=True)
+
+    def _put(self, operation_name, schema, item):
+        self._validate_item(operation_name, schema, item)
+        self._storage.put(
+            schema.name, schema.primary_key(item), item, schema.index_keys(item)
+        )
+
+    # Table operations
+
+    def create_table(
+        self, TableName, AttributeDefinitions, KeySchema,
+        GlobalSecondaryIndexes=None, **kwargs
+    ):
+        with self._lock:
+            if TableName in self._schemas:
+                raise _error(
+                    'CreateTable', 'ResourceInUseException', f'Table already exists: {TableName}'
+                )
+            description = dict(
+                TableName=TableName,
+                AttributeDefinitions=AttributeDefinitions,
+                KeySchema=KeySchema,
+                GlobalSecondaryIndexes=GlobalSecondaryIndexes or [],
+            )
+            self._storage.save_schema(TableName, description)
+            self._schemas[TableName] = TableSchema(description)
+        return {'TableDescription': self._table_description(TableName)}
+
+    def update_table(
+        self, TableName, AttributeDefinitions=None, GlobalSecondaryIndexUpdates=None, **kwargs
+    ):
+        with self._lock:
+            schema = self._schema('UpdateTable', TableName)
+            description = dict(schema.description)
+
+            attribute_definitions = {
+                a['AttributeName']: a for a in description['AttributeDefinitions']
+            }
+            for attr in AttributeDefinitions or []:
+                attribute_definitions[attr['AttributeName']] = attr
+            description['AttributeDefinitions'] = list(attribute_definitions.values())
+
+            indexes = {gsi['IndexName']: gsi for gsi in description['GlobalSecondaryIndexes']}
+            for update in GlobalSecondaryIndexUpdates or []:
+                if 'Create' in update:
+                    indexes[update['Create']['IndexName']] = update['Create']
+                elif 'Delete' in update:
+                    index_name = update['Delete']['IndexName']
+                    if index_name not in indexes:
+                        raise _error(
+                            'UpdateTable', 'ResourceNotFoundException',
+                            f'Requested resource not found: Index: {index_name} not found'
+                        )
+                    del indexes[index_name]
+            description['GlobalSecondaryIndexes'] = list(indexes.values())
+
+            self._storage.save_schema(TableName, description)
+            schema = self._schemas[TableName] = TableSchema(description)
+            # re-index existing items
+            for _, item in self._storage.scan(TableName):
+                self._put('UpdateTable', schema, item)
+        return {'TableDescription': self._table_description(TableName)}
+
+    def delete_table(self, TableName):
+        with self._lock:
+            description = self._table_description(TableName)
+            self._storage.delete_table(TableName)
+            del self._schemas[TableName]
+        return {'TableDescription': description}
+
+    def describe_table(self, TableName):
+        return {'Table': self._table_description(TableName)}
+
+    def list_tables(self, **kwargs):
+        return {'TableNames': sorted(self._schemas)}
+
+    def _table_description(self, table_name):
+        schema = self._schema('DescribeTable', table_name)
+        description = dict(schema.description)
+        description['TableStatus'] = 'ACTIVE'
+        description['ItemCount'] = self._storage.count(table_name)
+        description['GlobalSecondaryIndexes'] = [
+            dict(gsi, IndexStatus='ACTIVE') for gsi in description['GlobalSecondaryIndexes']
+        ]
+        return description
+
+    # Item operations
+
+    def put_item(self, **kwargs):
+        self._request()
+        return self._put_item(**kwargs)
+
+    def _put_item(
+        self, TableName, Item, ConditionExpression=None, ReturnValues='NONE',
+        ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        schema = self._schema('PutItem', TableName)
+        item = normalize_item(Item)
+        with self._lock:
+            old_item = self._storage.get(TableName, schema.primary_key(item))
+            self._check_condition('PutItem', ConditionExpression, old_item)
+            self._put('PutItem', schema, item)
+
+        response = {}
+        if ReturnValues == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        if _returns_capacity(ReturnConsumedCapacity):
+            response['ConsumedCapacity'] = self._write_capacity(
+                schema, ReturnConsumedCapacity, old_item, item
+            )
+        return response
+
+    def get_item(self, **kwargs):
+        self._request()
+        return self._get_item(**kwargs)
+
+    def _get_item(
+        self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None,
+        ConsistentRead=False, ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        schema = self._schema('GetItem', TableName)
+        key = self._key('GetItem', schema, Key)
+        with self._lock:
+            item = self._storage.get(TableName, schema.primary_key(key))
+
+        response = {}
+        if item is not None:
+            response['Item'] = project(
+                item, parse_projection(ProjectionExpression, ExpressionAttributeNames)
+            )
+        if _returns_capacity(ReturnConsumedCapacity):
+            response['ConsumedCapacity'] = _consumed_capacity(
+                TableName, ReturnConsumedCapacity,
+                _read_units(item_size(item) if item else 0, ConsistentRead),
+            )
+        return response
+
+    def update_item(
+        self, TableName, Key, UpdateExpression, ConditionExpression=None,
+        ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+        ReturnValues='NONE', ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        self._request()
+        schema = self._schema('UpdateItem', TableName)
+        key = self._key('UpdateItem', schema, Key)
+        attribute_values = normalize_item(ExpressionAttributeValues or {})
+
+        with self._lock:
+            old_item = self._storage.get(TableName, schema.primary_key(key))
+            self._check_condition('UpdateItem', ConditionExpression, old_item)
+            try:
+                new_item, updated_attributes = apply_update(
+                    old_item or key, UpdateExpression,
+                    ExpressionAttributeNames, attribute_values,
+                )
+            except ExpressionError as e:
+                raise _error('UpdateItem', 'ValidationException', str(e))
+            if set(updated_attributes) & set(schema.key_names):
+                raise _error(
+                    'UpdateItem', 'ValidationException',
+                    'One or more parameter values were invalid: Cannot update attribute '
+                    'which is part of the key'
+                )
+            new_item = normalize_item(new_item)
+            self._put('UpdateItem', schema, new_item)
+
+        response = {}
+        if ReturnValues == 'ALL_NEW':
+            response['Attributes'] = new_item
+        elif ReturnValues == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        elif ReturnValues == 'UPDATED_NEW':
+            response['Attributes'] = project(new_item, updated_attributes)
+        elif ReturnValues == 'UPDATED_OLD' and old_item:
+            response['Attributes'] = project(old_item, updated_attributes)
+        if _returns_capacity(ReturnConsumedCapacity):
+            response['ConsumedCapacity'] = self._write_capacity(
+                schema, ReturnConsumedCapacity, old_item, new_item
+            )
+        return response
+
+    def delete_item(self, **kwargs):
+        self._request()
+        return self._delete_item(**kwargs)
+
+    def _delete_item(
+        self, TableName, Key, ConditionExpression=None, ReturnValues='NONE',
+        ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        schema = self._schema('DeleteItem', TableName)
+        key = self._key('DeleteItem', schema, Key)
+        pk = schema.primary_key(key)
+
+        with self._lock:
+            old_item = self._storage.get(TableName, pk)
+            self._check_condition('DeleteItem', ConditionExpression, old_item)
+            if old_item is not None:
+                self._storage.delete(TableName, pk)
+
+        response = {}
+        if ReturnValues == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        if _returns_capacity(ReturnConsumedCapacity):
+            response['ConsumedCapacity'] = self._write_capacity(
+                schema, ReturnConsumedCapacity, old_item, None
+            )
+        return response
+
+    def query(
+        self, TableName, KeyConditionExpression, IndexName=None, FilterExpression=None,
+        ProjectionExpression=None, ExpressionAttributeNames=None, Limit=None,
+        ExclusiveStartKey=None, ScanIndexForward=True, Select=None,
+        ConsistentRead=False, ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        self._request()
+        schema = self._schema('Query', TableName)
+        if IndexName:
+            if IndexName not in schema.indexes:
+                raise _error(
+                    'Query', 'ValidationException',
+                    f'The table does not have the specified index: {IndexName}'
+                )
+            if ConsistentRead:
+                raise _error(
+                    'Query', 'ValidationException',
+                    'Consistent reads are not supported on global secondary indexes'
+                )
+            key_schema = schema.indexes[IndexName]
+        else:
+            key_schema = schema
+
+        hash_values = condition_attribute_values(KeyConditionExpression, key_schema.hash_key)
+        if len(hash_values) != 1:
+            raise _error(
+                'Query', 'ValidationException',
+                'Query condition missed key schema element: ' + key_schema.hash_key
+            )
+        hash_value = normalize_item(hash_values[0])
+
+        def read(start, limit):
+            return self._storage.query(
+                TableName, IndexName or '', encode_key_value(hash_value),
+                start=start, reverse=not ScanIndexForward, limit=limit,
+            )
+
+        start = None
+        if ExclusiveStartKey is not None:
+            start = schema.sort_key(normalize_item(ExclusiveStartKey), IndexName)
+        items = self._read(
+            read, start, Limit, lambda item: evaluate_condition(KeyConditionExpression, item)
+        )
+        return self._page(
+            'Query', schema, IndexName, items, list(key_schema.key_names),
+            FilterExpression, ProjectionExpression, ExpressionAttributeNames,
+            Limit, Select, ReturnConsumedCapacity, ConsistentRead,
+        )
+
+    def scan(
+        self, TableName, FilterExpression=None, ProjectionExpression=None,
+        ExpressionAttributeNames=None, Limit=None, ExclusiveStartKey=None,
+        Segment=None, TotalSegments=None, Select=None, ConsistentRead=False,
+        ReturnConsumedCapacity='NONE', **kwargs
+    ):
+        self._request()
+        schema = self._schema('Scan', TableName)
+
+        def read(start, limit):
+            return self._storage.scan(TableName, start=start, limit=limit)
+
+        def in_segment(item):
+            return (
+                TotalSegments is None or
+                zlib.crc32(schema.primary_key(item).encode('utf-8')) % TotalSegments == Segment
+            )
+
+        start = None
+        if ExclusiveStartKey is not None:
+            start = schema.sort_key(normalize_item(ExclusiveStartKey))
+        items = self._read(read, start, Limit, in_segment)
+        return self._page(
+            'Scan', schema, None, items, [], FilterExpression,
+            ProjectionExpression, ExpressionAttributeNames,
+            Limit, Select, ReturnConsumedCapacity, ConsistentRead,
+        )
+
+    def _read(self, read, start, limit, predicate):
+        """
+        Read items matching "predicate" in sort key order after the "start"
+        sort key, stopping once more than "limit" items are found (so the
+        caller knows whether a "LastEvaluatedKey" is needed)
+        """
+        items = []
+        while True:
+            chunk_size = READ_CHUNK_SIZE
+            if limit is not None:
+                chunk_size = min(chunk_size, limit + 1 - len(items))
+            with self._lock:
+                entries = read(start, chunk_size)
+            for _, item in entries:
+                if predicate(item):
+                    items.append(item)
+                    if limit is not None and len(items) > limit:
+                        return items
+            if len(entries) < chunk_size:
+                return items
+            start = entries[-1][0]
+
+    def _page(
+        self, operation_name, schema, index_name, items, index_key_names,
+        filter_expression, projection_expression, attribute_names,
+        limit, select, capacity_mode, consistent_read,
+    ):
+        last_evaluated_key = None
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            last_item = items[-1]
+            last_evaluated_key = {
+                k: last_item[k] for k in schema.key_names + index_key_names
+            }
+
+        scanned_count = len(items)
+        if _returns_capacity(capacity_mode):
+            # capacity is consumed for all items read (before filtering)
+            units = _read_units(
+                sum(item_size(schema.project(item, index_name)) for item in items),
+                consistent_read,
+            )
+        if filter_expression is not None:
+            try:
+                items = [i for i in items if evaluate_condition(filter_expression, i)]
+            except ExpressionError as e:
+                raise _error(operation_name, 'ValidationException', str(e))
+
+        response = {'Count': len(items), 'ScannedCount': scanned_count}
+        if select != 'COUNT':
+            attributes = parse_projection(projection_expression, attribute_names)
+            response['Items'] = [
+                project(schema.project(item, index_name), attributes)
+                for item in items
+            ]
+        if last_evaluated_key is not None:
+            response['LastEvaluatedKey'] = last_evaluated_key
+        if _returns_capacity(capacity_mode):
+            if index_name:
+                response['ConsumedCapacity'] = _consumed_capacity(
+                    schema.name, capacity_mode, 0, {index_name: units}
+                )
+            else:
+                response['ConsumedCapacity'] = _consumed_capacity(
+                    schema.name, capacity_mode, units
+                )
+        return response
+
+    # Batch operations
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity='NONE', **kwargs):
+        self._request()
+        n_requests = sum(len(requests) for requests in RequestItems.values())
+        if n_requests > BATCH_WRITE_MAX_ITEMS:
+            raise _error(
+                'BatchWriteItem', 'ValidationException',
+                f'Too many items requested for the BatchWriteItem call ({n_requests})'
+            )
+        consumed_capacity = []
+        for table_name, requests in RequestItems.items():
+            responses = []
+            # (client lock first, as for single writes)
+            with self._lock, self._storage.transaction():
+                for request in requests:
+                    if 'PutRequest' in request:
+                        responses.append(self._put_item(
+                            TableName=table_name, Item=request['PutRequest']['Item'],
+                            ReturnConsumedCapacity=ReturnConsumedCapacity,
+                        ))
+                    else:
+                        responses.append(self._delete_item(
+                            TableName=table_name, Key=request['DeleteRequest']['Key'],
+                            ReturnConsumedCapacity=ReturnConsumedCapacity,
+                        ))
+            if _returns_capacity(ReturnConsumedCapacity):
+                consumed_capacity.append(_sum_capacity(
+                    table_name, ReturnConsumedCapacity,
+                    [r['ConsumedCapacity'] for r in responses], write=True,
+                ))
+
+        response = {'UnprocessedItems': {}}
+        if consumed_capacity:
+            response['ConsumedCapacity'] = consumed_capacity
+        return response
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity='NONE', **kwargs):
+        self._request()
+        n_keys = sum(len(request['Keys']) for request in RequestItems.values())
+        if n_keys > BATCH_GET_MAX_KEYS:
+            raise _error(
+                'BatchGetItem', 'ValidationException',
+                f'Too many items requested for the BatchGetItem call ({n_keys})'
+            )
+        responses = {}
+        consumed_capacity = []
+        for table_name, request in RequestItems.items():
+            responses[table_name] = []
+            get_responses = [
+                self._get_item(
+                    TableName=table_name, Key=key,
+                    ProjectionExpression=request.get('ProjectionExpression'),
+                    ExpressionAttributeNames=request.get('ExpressionAttributeNames'),
+                    ConsistentRead=request.get('ConsistentRead', False),
+                    ReturnConsumedCapacity=ReturnConsumedCapacity,
+                )
+                for key in request['Keys']
+            ]
+            responses[table_name] = [r['Item'] for r in get_responses if 'Item' in r]
+            if _returns_capacity(ReturnConsumedCapacity):
+                consumed_capacity.append(_sum_capacity(
+                    table_name, ReturnConsumedCapacity,
+                    [r['ConsumedCapacity'] for r in get_responses],
+                ))
+
+        response = {'Responses': responses, 'UnprocessedKeys': {}}
+        if consumed_capacity:
+            response['ConsumedCapacity'] = consumed_capacity
+        return response
+
+
+def _sum_capacity(table_name, mode, consumed_capacity, write=False):
+    table_units = sum(c.get('Table', c)['CapacityUnits'] for c in consumed_capacity)
+    index_units = {}
+    for c in consumed_capacity:
+        for index_name, index_capacity in c.get('GlobalSecondaryIndexes', {}).items():
+            index_units[index_name] = (
+                index_units.get(index_name, 0) + index_capacity['CapacityUnits']
+            )
+    return _consumed_capacity(table_name, mode, table_units, index_units, write=write)
+
+
+class _Meta:
+
+    def __init__(self, client):
+        self.client = client
+
+
+class LocalTable:
+    """
+    Local stand-in for a boto3 DynamoDB "Table" resource
+    """
+
+    def __init__(self, name, client):
+        self.name = name
+        self.table_name = name
+        self.meta = _Meta(client)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(name={self.name!r})'
+
+    def put_item(self, **kwargs):
+        return self.meta.client.put_item(TableName=self.name, **kwargs)
+
+    def get_item(self, **kwargs):
+        return self.meta.client.get_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.meta.client.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.meta.client.delete_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.meta.client.query(TableName=self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        return self.meta.client.scan(TableName=self.name, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriter(self.name, self.meta.client, overwrite_by_pkeys=overwrite_by_pkeys)
+
+
+class LocalDynamoDB:
+    """
+    Local stand-in for a boto3 DynamoDB service resource
+
+    May be passed as the "dynamodb" argument to any "charm_product" API.
+    Tables are created by running the schema migrations against the
+    resource (e.g. "migrate(dynamodb)").
+    """
+
+    def __init__(self, storage, latency=0):
+        self.meta = _Meta(LocalDynamoDBClient(storage, latency=latency))
+
+    def Table(self, name):
+        return LocalTable(name, self.meta.client)
+
+    def batch_write_item(self, **kwargs):
+        return self.meta.client.batch_write_item(**kwargs)
+
+    def batch_get_item(self, **kwargs):
+        return self.meta.client.batch_get_item(**kwargs)
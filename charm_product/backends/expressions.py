@@ -0,0 +1,383 @@
+"""
+Evaluation of DynamoDB expressions for local backends
+
+Condition, filter and key condition expressions must be given as
+"boto3.dynamodb.conditions" objects (as used throughout "charm_product").
+Update and projection expressions are parsed from strings.
+"""
+import re
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase, Size
+from boto3.dynamodb.types import DYNAMODB_CONTEXT, Binary
+from decimal import Decimal
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def _resolve_name(name, attribute_names):
+    if name.startswith('#'):
+        try:
+            return attribute_names[name]
+        except (KeyError, TypeError):
+            raise ExpressionError(f'Undefined expression attribute name: {name}')
+    return name
+
+
+def _resolve_value(placeholder, attribute_values):
+    try:
+        return attribute_values[placeholder]
+    except (KeyError, TypeError):
+        raise ExpressionError(f'Undefined expression attribute value: {placeholder}')
+
+
+def _size(value):
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, bytes):
+        return len(value)
+    return len(value)
+
+
+def _dynamodb_type(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, (Decimal, int)):
+        return 'N'
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, (Binary, bytes, bytearray)):
+        return 'B'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, (list, tuple)):
+        return 'L'
+    if isinstance(value, set):
+        elem = next(iter(value))
+        return {'N': 'NS', 'S': 'SS', 'B': 'BS'}[_dynamodb_type(elem)]
+    raise ExpressionError(f'Unsupported value type: {type(value)}')
+
+
+def _sort_value(value):
+    if isinstance(value, Binary):
+        return value.value
+    return value
+
+
+_MISSING = object()
+
+
+def _compare(operator, left, right):
+    if left is _MISSING or right is _MISSING:
+        # comparisons against missing attributes are false
+        # (except for "not equal")
+        return operator == '<>'
+    if operator == '=':
+        return left == right
+    if operator == '<>':
+        return left != right
+
+    if _dynamodb_type(left) != _dynamodb_type(right) or \
+            _dynamodb_type(left) not in ('N', 'S', 'B'):
+        return False
+    left, right = _sort_value(left), _sort_value(right)
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    if operator == '>=':
+        return left >= right
+    raise ExpressionError(f'Unsupported operator: {operator}')
+
+
+def _operand(value, item):
+    if isinstance(value, Size):
+        attr = item.get(value.name, _MISSING)
+        return _MISSING if attr is _MISSING else Decimal(_size(attr))
+    if isinstance(value, AttributeBase):
+        return item.get(value.name, _MISSING)
+    return value
+
+
+def evaluate_condition(condition, item):
+    """
+    Evaluate a boto3 condition object against an item
+    """
+    if condition is None:
+        return True
+    if not isinstance(condition, ConditionBase):
+        raise ExpressionError(
+            'String condition expressions are not supported by local backends '
+            '(use "boto3.dynamodb.conditions" objects)'
+        )
+
+    operator = condition.expression_operator
+    values = condition.get_expression()['values']
+
+    if operator == 'AND':
+        return all(evaluate_condition(v, item) for v in values)
+    if operator == 'OR':
+        return any(evaluate_condition(v, item) for v in values)
+    if operator == 'NOT':
+        return not evaluate_condition(values[0], item)
+    if operator == 'attribute_exists':
+        return values[0].name in item
+    if operator == 'attribute_not_exists':
+        return values[0].name not in item
+
+    operands = [_operand(v, item) for v in values]
+    if operator in ('=', '<>', '<', '<=', '>', '>='):
+        return _compare(operator, operands[0], operands[1])
+    if operator == 'BETWEEN':
+        return (
+            _compare('>=', operands[0], operands[1]) and
+            _compare('<=', operands[0], operands[2])
+        )
+    if operator == 'IN':
+        return operands[0] is not _MISSING and operands[0] in operands[1:]
+    if operator == 'begins_with':
+        value, prefix = operands
+        if isinstance(value, str) and isinstance(prefix, str):
+            return value.startswith(prefix)
+        if isinstance(value, Binary) and isinstance(prefix, (Binary, bytes)):
+            return value.value.startswith(bytes(prefix))
+        return False
+    if operator == 'contains':
+        value, elem = operands
+        if value is _MISSING:
+            return False
+        if isinstance(value, str):
+            return isinstance(elem, str) and elem in value
+        return elem in value
+    if operator == 'attribute_type':
+        return operands[0] is not _MISSING and _dynamodb_type(operands[0]) == operands[1]
+    raise ExpressionError(f'Unsupported condition operator: {operator}')
+
+
+def condition_attribute_values(condition, name):
+    """
+    Get values compared for equality against attribute "name" in the
+    top-level "AND" clauses of a (key) condition
+    """
+    operator = condition.expression_operator
+    values = condition.get_expression()['values']
+    if operator == 'AND':
+        return [
+            v for c in values
+            for v in condition_attribute_values(c, name)
+        ]
+    if (
+        operator == '=' and
+        isinstance(values[0], AttributeBase) and
+        values[0].name == name
+    ):
+        return [values[1]]
+    return []
+
+
+def condition_attribute_names(condition):
+    if not isinstance(condition, ConditionBase):
+        return set()
+    names = set()
+    for value in condition.get_expression()['values']:
+        if isinstance(value, AttributeBase):
+            names.add(value.name)
+        elif isinstance(value, ConditionBase):
+            names |= condition_attribute_names(value)
+    return names
+
+
+def parse_projection(projection_expression, attribute_names=None):
+    if projection_expression is None:
+        return None
+    return [
+        _resolve_name(name.strip(), attribute_names)
+        for name in projection_expression.split(',')
+        if name.strip()
+    ]
+
+
+def project(item, attributes):
+    if attributes is None:
+        return item
+    return {k: item[k] for k in attributes if k in item}
+
+
+_TOKEN_REGEX = re.compile(r'\s*(?:(#\w+)|(:\w+)|([A-Za-z_][\w]*)|(\S))')
+_CLAUSES = {'SET', 'REMOVE', 'ADD', 'DELETE'}
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN_REGEX.match(expression, pos)
+        if match is None:
+            raise ExpressionError(f'Invalid expression: {expression}')
+        name, value, identifier, symbol = match.groups()
+        if name:
+            tokens.append(('name', name))
+        elif value:
+            tokens.append(('value', value))
+        elif identifier:
+            tokens.append(('identifier', identifier))
+        else:
+            tokens.append(('symbol', symbol))
+        pos = match.end()
+    return tokens
+
+
+class _UpdateParser:
+
+    def __init__(self, expression, attribute_names, attribute_values):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.attribute_names = attribute_names
+        self.attribute_values = attribute_values
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, symbol):
+        token = self.next()
+        if token != ('symbol', symbol):
+            raise ExpressionError(f'Expected "{symbol}" in update expression')
+
+    def at_clause(self):
+        kind, token = self.peek()
+        return kind == 'identifier' and token.upper() in _CLAUSES
+
+    def path(self):
+        kind, token = self.next()
+        if kind == 'name':
+            return _resolve_name(token, self.attribute_names)
+        if kind == 'identifier':
+            return token
+        raise ExpressionError(f'Expected attribute name in update expression, got "{token}"')
+
+    def value(self):
+        kind, token = self.next()
+        if kind != 'value':
+            raise ExpressionError(
+                f'Expected value placeholder in update expression, got "{token}"'
+            )
+        return _resolve_value(token, self.attribute_values)
+
+    def operand(self):
+        kind, token = self.peek()
+        if kind == 'value':
+            value = self.value()
+            return lambda item: value
+        if kind == 'identifier' and self.tokens[self.pos + 1:self.pos + 2] == [('symbol', '(')]:
+            func = token
+            self.pos += 2
+            if func == 'if_not_exists':
+                path = self.path()
+                self.expect(',')
+                default = self.operand()
+                self.expect(')')
+                return lambda item: item[path] if path in item else default(item)
+            if func == 'list_append':
+                first = self.operand()
+                self.expect(',')
+                second = self.operand()
+                self.expect(')')
+                return lambda item: list(first(item)) + list(second(item))
+            raise ExpressionError(f'Unsupported update expression function: {func}')
+
+        path = self.path()
+
+        def get_path(item):
+            if path not in item:
+                raise ExpressionError(
+                    'The provided expression refers to an attribute that does not '
+                    f'exist in the item: {path}'
+                )
+            return item[path]
+        return get_path
+
+    def value_expression(self):
+        left = self.operand()
+        kind, token = self.peek()
+        if kind == 'symbol' and token in ('+', '-'):
+            self.next()
+            right = self.operand()
+            if token == '+':
+                return lambda item: DYNAMODB_CONTEXT.add(left(item), right(item))
+            return lambda item: DYNAMODB_CONTEXT.subtract(left(item), right(item))
+        return left
+
+    def parse(self):
+        """
+        Parse the update expression into a list of (action, path, operand) tuples
+        """
+        actions = []
+        while self.peek()[0] is not None:
+            if not self.at_clause():
+                raise ExpressionError(f'Invalid update expression near "{self.peek()[1]}"')
+            clause = self.next()[1].upper()
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.expect('=')
+                    actions.append((clause, path, self.value_expression()))
+                elif clause == 'REMOVE':
+                    actions.append((clause, path, None))
+                else:
+                    value = self.value()
+                    actions.append((clause, path, lambda item, value=value: value))
+
+                if self.peek() == ('symbol', ','):
+                    self.next()
+                else:
+                    break
+        return actions
+
+
+def apply_update(item, update_expression, attribute_names=None, attribute_values=None):
+    """
+    Apply an update expression to a copy of an item
+
+    Returns the updated item and the names of the attributes updated
+    """
+    actions = _UpdateParser(update_expression, attribute_names, attribute_values).parse()
+
+    updated = dict(item)
+    updated_attributes = []
+    for action, path, operand in actions:
+        # operands are evaluated against the item before the update
+        if action == 'SET':
+            updated[path] = operand(item)
+        elif action == 'REMOVE':
+            updated.pop(path, None)
+        elif action == 'ADD':
+            value = operand(item)
+            if path not in updated:
+                updated[path] = value
+            elif isinstance(value, set):
+                updated[path] = updated[path] | value
+            else:
+                updated[path] = DYNAMODB_CONTEXT.add(updated[path], value)
+        elif action == 'DELETE':
+            if path in updated:
+                remaining = updated[path] - operand(item)
+                if remaining:
+                    updated[path] = remaining
+                else:
+                    del updated[path]
+        updated_attributes.append(path)
+    return updated, updated_attributes
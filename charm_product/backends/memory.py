@@ -0,0 +1,123 @@
+import bisect
+
+from charm_product.backends.base import LocalDynamoDB, Storage, copy_value
+
+
+class _SortedKeys:
+    """
+    Primary keys ordered by sort key (kept sorted on insert, so reads seek to
+    their start key)
+    """
+
+    def __init__(self):
+        self._sort_keys = []
+        self._pks = {}
+
+    def __len__(self):
+        return len(self._sort_keys)
+
+    def add(self, sort_key, pk):
+        bisect.insort(self._sort_keys, sort_key)
+        self._pks[sort_key] = pk
+
+    def remove(self, sort_key):
+        del self._sort_keys[bisect.bisect_left(self._sort_keys, sort_key)]
+        del self._pks[sort_key]
+
+    def read(self, start=None, reverse=False, limit=None):
+        """
+        Get "(sort key, primary key)" pairs after the "start" sort key
+        """
+        if reverse:
+            end = len(self._sort_keys) if start is None else (
+                bisect.bisect_left(self._sort_keys, start)
+            )
+            begin = 0 if limit is None else max(0, end - limit)
+            sort_keys = self._sort_keys[begin:end][::-1]
+        else:
+            begin = 0 if start is None else bisect.bisect_right(self._sort_keys, start)
+            end = None if limit is None else begin + limit
+            sort_keys = self._sort_keys[begin:end]
+        return [(sort_key, self._pks[sort_key]) for sort_key in sort_keys]
+
+
+class MemoryStorage(Storage):
+
+    def __init__(self):
+        self._schemas = {}
+        # table name -> primary key -> (item, index keys)
+        self._items = {}
+        # table name -> primary keys in scan order
+        self._scan_keys = {}
+        # table name -> index name -> hash key -> primary keys in sort order
+        self._indexes = {}
+
+    def load_schemas(self):
+        return dict(self._schemas)
+
+    def save_schema(self, table_name, description):
+        self._schemas[table_name] = description
+        self._items.setdefault(table_name, {})
+        self._scan_keys.setdefault(table_name, _SortedKeys())
+        self._indexes.setdefault(table_name, {})
+
+    def delete_table(self, table_name):
+        del self._schemas[table_name]
+        del self._items[table_name]
+        del self._scan_keys[table_name]
+        del self._indexes[table_name]
+
+    def get(self, table_name, pk):
+        entry = self._items[table_name].get(pk)
+        if entry is None:
+            return None
+        return copy_value(entry[0])
+
+    def put(self, table_name, pk, item, index_keys):
+        self.delete(table_name, pk)
+        self._items[table_name][pk] = (copy_value(item), index_keys)
+        self._scan_keys[table_name].add(index_keys[''][1], pk)
+        indexes = self._indexes[table_name]
+        for index_name, (hash_value, sort_key) in index_keys.items():
+            partitions = indexes.setdefault(index_name, {})
+            partitions.setdefault(hash_value, _SortedKeys()).add(sort_key, pk)
+
+    def delete(self, table_name, pk):
+        entry = self._items[table_name].pop(pk, None)
+        if entry is None:
+            return
+        index_keys = entry[1]
+        self._scan_keys[table_name].remove(index_keys[''][1])
+        indexes = self._indexes[table_name]
+        for index_name, (hash_value, sort_key) in index_keys.items():
+            partition = indexes[index_name][hash_value]
+            partition.remove(sort_key)
+            if not partition:
+                del indexes[index_name][hash_value]
+
+    def _entries(self, table_name, keys):
+        items = self._items[table_name]
+        return [(sort_key, copy_value(items[pk][0])) for sort_key, pk in keys]
+
+    def scan(self, table_name, start=None, limit=None):
+        return self._entries(
+            table_name, self._scan_keys[table_name].read(start, limit=limit)
+        )
+
+    def query(self, table_name, index_name, hash_value, start=None, reverse=False, limit=None):
+        partition = self._indexes[table_name].get(index_name, {}).get(hash_value)
+        if partition is None:
+            return []
+        return self._entries(table_name, partition.read(start, reverse, limit))
+
+    def count(self, table_name):
+        return len(self._items[table_name])
+
+
+class MemoryDynamoDB(LocalDynamoDB):
+    """
+    In-memory DynamoDB stand-in (see "LocalDynamoDB")
+    """
+
+    def __init__(self, latency=0):
+        super().__init__(MemoryStorage(), latency=latency)
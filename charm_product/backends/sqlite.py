@@ -0,0 +1,184 @@
+import contextlib
+import json
+import pickle
+import sqlite3
+import threading
+
+from charm_product.backends.base import LocalDynamoDB, Storage
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite storage for local backends
+
+    Items are stored as pickled python values (databases should only be
+    shared between trusted processes). The connection is shared by all
+    threads, so reads and writes are serialized by a lock.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._in_transaction = False
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS table_schema (
+                table_name TEXT PRIMARY KEY,
+                description TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS item (
+                table_name TEXT NOT NULL,
+                pk TEXT NOT NULL,
+                sort_key BLOB NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (table_name, pk)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS item_sort_key_idx ON item (table_name, sort_key);
+            CREATE TABLE IF NOT EXISTS index_entry (
+                table_name TEXT NOT NULL,
+                index_name TEXT NOT NULL,
+                hash_value TEXT NOT NULL,
+                sort_key BLOB NOT NULL,
+                pk TEXT NOT NULL,
+                PRIMARY KEY (table_name, index_name, hash_value, sort_key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS index_entry_pk_idx ON index_entry (table_name, pk);
+        ''')
+
+    def close(self):
+        self._conn.close()
+
+    def load_schemas(self):
+        with self._lock:
+            return {
+                table_name: json.loads(description)
+                for table_name, description in self._conn.execute(
+                    'SELECT table_name, description FROM table_schema'
+                )
+            }
+
+    def save_schema(self, table_name, description):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO table_schema VALUES (?, ?)',
+                (table_name, json.dumps(description)),
+            )
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._in_transaction:
+                yield
+                return
+            self._in_transaction = True
+            try:
+                with self._conn:
+                    self._conn.execute('BEGIN')
+                    yield
+            finally:
+                self._in_transaction = False
+
+    def delete_table(self, table_name):
+        with self.transaction():
+            for sql_table in ['table_schema', 'item', 'index_entry']:
+                self._conn.execute(
+                    f'DELETE FROM {sql_table} WHERE table_name = ?', (table_name,)
+                )
+
+    def get(self, table_name, pk):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM item WHERE table_name = ? AND pk = ?', (table_name, pk)
+            ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def put(self, table_name, pk, item, index_keys):
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.transaction():
+            self._conn.execute(
+                'INSERT OR REPLACE INTO item VALUES (?, ?, ?, ?)',
+                (table_name, pk, index_keys[''][1], data),
+            )
+            self._conn.execute(
+                'DELETE FROM index_entry WHERE table_name = ? AND pk = ?', (table_name, pk)
+            )
+            self._conn.executemany(
+                'INSERT INTO index_entry VALUES (?, ?, ?, ?, ?)',
+                [
+                    (table_name, index_name, hash_value, sort_key, pk)
+                    for index_name, (hash_value, sort_key) in index_keys.items()
+                ],
+            )
+
+    def delete(self, table_name, pk):
+        with self.transaction():
+            self._conn.execute(
+                'DELETE FROM item WHERE table_name = ? AND pk = ?', (table_name, pk)
+            )
+            self._conn.execute(
+                'DELETE FROM index_entry WHERE table_name = ? AND pk = ?', (table_name, pk)
+            )
+
+    def scan(self, table_name, start=None, limit=None):
+        start_condition = '' if start is None else 'AND sort_key > ?'
+        params = [table_name] + ([] if start is None else [start])
+        with self._lock:
+            rows = self._conn.execute(
+                f'''
+                SELECT sort_key, data FROM item
+                WHERE table_name = ? {start_condition}
+                ORDER BY sort_key
+                LIMIT ?
+                ''',
+                params + [-1 if limit is None else limit],
+            ).fetchall()
+        return [(sort_key, pickle.loads(data)) for sort_key, data in rows]
+
+    def query(self, table_name, index_name, hash_value, start=None, reverse=False, limit=None):
+        start_condition = ''
+        params = [table_name, index_name, hash_value]
+        if start is not None:
+            start_condition = 'AND index_entry.sort_key ' + ('<' if reverse else '>') + ' ?'
+            params.append(start)
+        with self._lock:
+            rows = self._conn.execute(
+                f'''
+                SELECT index_entry.sort_key, item.data FROM index_entry
+                JOIN item
+                    ON item.table_name = index_entry.table_name
+                    AND item.pk = index_entry.pk
+                WHERE index_entry.table_name = ?
+                    AND index_entry.index_name = ?
+                    AND index_entry.hash_value = ?
+                    {start_condition}
+                ORDER BY index_entry.sort_key {'DESC' if reverse else 'ASC'}
+                LIMIT ?
+                ''',
+                params + [-1 if limit is None else limit],
+            ).fetchall()
+        return [(sort_key, pickle.loads(data)) for sort_key, data in rows]
+
+    def count(self, table_name):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM item WHERE table_name = ?', (table_name,)
+            ).fetchone()[0]
+
+
+class SQLiteDynamoDB(LocalDynamoDB):
+    """
+    SQLite-backed DynamoDB stand-in (see "LocalDynamoDB")
+
+    Data is persisted to the SQLite database at "path" (an in-memory database
+    is used by default).
+    """
+
+    def __init__(self, path=':memory:', latency=0):
+        super().__init__(SQLiteStorage(path), latency=latency)
+
+    def close(self):
+        self.meta.client._storage.close()
@@ -0,0 +1,97 @@
+import time
+
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.instrument import span
+from charm_product.ratelimit import rate_limited, record_throttle
+
+
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_RETRY_DELAY = 0.05
+BATCH_MAX_RETRY_DELAY = 5
+
+
+class BatchWriter:
+    """
+    Batch writer for a single table (see "Table.batch_writer" in boto3)
+
+    Unlike the boto3 batch writer, consumed capacity is recorded per
+    operation (see "charm_product.capacity") and batches are paced by the
+    adaptive rate limiter (see "charm_product.ratelimit").
+    """
+
+    def __init__(self, dynamodb, table_name, operation):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.operation = operation
+        self._requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def put_item(self, Item):
+        self._add_request({'PutRequest': {'Item': Item}})
+
+    def delete_item(self, Key):
+        self._add_request({'DeleteRequest': {'Key': Key}})
+
+    def _add_request(self, request):
+        self._requests.append(request)
+        if len(self._requests) >= BATCH_WRITE_MAX_ITEMS:
+            self._write_batch()
+
+    def flush(self):
+        while self._requests:
+            self._write_batch()
+
+    def _write_batch(self):
+        batch = self._requests[:BATCH_WRITE_MAX_ITEMS]
+        self._requests = self._requests[BATCH_WRITE_MAX_ITEMS:]
+
+        delay = BATCH_RETRY_DELAY
+        while batch:
+            with span(f'{self.operation}.batch_write_item', n_items=len(batch)):
+                response = rate_limited(self.dynamodb.batch_write_item, units=len(batch))(
+                    RequestItems={self.table_name: batch},
+                    **capacity_kwargs()
+                )
+            record_consumed_capacity(self.operation, response, write=True)
+
+            batch = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if batch:
+                record_throttle()
+                time.sleep(delay)
+                delay = min(delay * 2, BATCH_MAX_RETRY_DELAY)
+
+
+BATCH_GET_MAX_KEYS = 100
+
+
+def batch_get_items(dynamodb, table_name, keys, operation, **request):
+    """
+    Get items by key with "BatchGetItem" (in chunks of 100 keys, retrying
+    unprocessed keys). Items are returned in no particular order; items
+    which do not exist are omitted.
+    """
+    items = []
+    for i in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request_items = {table_name: dict(request, Keys=keys[i:i + BATCH_GET_MAX_KEYS])}
+        delay = BATCH_RETRY_DELAY
+        while request_items:
+            n_keys = len(request_items[table_name]['Keys'])
+            with span(f'{operation}.batch_get_item', n_items=n_keys):
+                response = rate_limited(dynamodb.batch_get_item, units=n_keys)(
+                    RequestItems=request_items,
+                    **capacity_kwargs()
+                )
+            record_consumed_capacity(operation, response)
+            items.extend(response['Responses'].get(table_name, []))
+
+            request_items = response.get('UnprocessedKeys') or {}
+            if request_items:
+                record_throttle()
+                time.sleep(delay)
+                delay = min(delay * 2, BATCH_MAX_RETRY_DELAY)
+    return items
@@ -0,0 +1,264 @@
+"""
+Blacklist impact dry runs
+
+Before adding token groups to "PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS" or
+"IMAGE_URL_BLACKLIST_TOKEN_GROUPS", check which existing products they would
+match. The product table is scanned in parallel segments (or a JSON lines
+export is read in chunks) across a process pool:
+
+    CHARM_PRODUCT_ENV=dev python -m charm_product.blacklist \\
+        --title 'gift box' --image-url 'coming soon' --processes 8
+
+Titles are matched as "validation.product_title" does (products that would
+be rejected) and image URL paths as "validation.image_url" does (image URLs
+that would be skipped).
+"""
+import itertools
+import json
+import re
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from charm_product.search import tokenize
+from charm_product.validation import (
+    IMAGE_URL_BLACKLIST_TOKENS,
+    PRODUCT_TITLE_BLACKLIST_TOKENS,
+    format_token_group_regexes,
+)
+
+
+CHECKED_ATTRIBUTES = ['store_product_url', 'title', 'image_urls']
+
+DEFAULT_SEGMENTS_PER_PROCESS = 4
+# Export lines are checked in chunks of this many products per task
+EXPORT_CHUNK_SIZE = 10000
+
+
+class BlacklistRules:
+    """
+    Title and image URL token groups to check (picklable, compiled on first use)
+    """
+
+    def __init__(self, title_token_groups=(), image_token_groups=()):
+        self.title_token_groups = list(title_token_groups)
+        self.image_token_groups = list(image_token_groups)
+        self._regexes = None
+
+    @property
+    def names(self):
+        return (
+            [f'title:{group}' for group in self.title_token_groups] +
+            [f'image_url:{group}' for group in self.image_token_groups]
+        )
+
+    def _compiled_regexes(self):
+        if self._regexes is None:
+            names = self.names
+            n_title = len(self.title_token_groups)
+            self._regexes = (
+                _RuleRegexes(names[:n_title], self.title_token_groups),
+                _RuleRegexes(names[n_title:], self.image_token_groups),
+            )
+        return self._regexes
+
+    def matches(self, product):
+        """
+        Get the names of the rules matching a product
+        """
+        title_regexes, image_regexes = self._compiled_regexes()
+        matched = []
+        if title_regexes and product.get('title'):
+            matched.extend(title_regexes.matches([tokenize(product['title'])]))
+        if image_regexes and product.get('image_urls'):
+            matched.extend(image_regexes.matches(
+                [tokenize(urlsplit(url).path) for url in product['image_urls']]
+            ))
+        return matched
+
+
+class _RuleRegexes:
+    def __init__(self, names, token_groups):
+        self.rules = [
+            (name, re.compile(regex))
+            for name, regex in zip(names, format_token_group_regexes(token_groups))
+        ]
+        # (most texts match no rule, so check all rules with one regex first)
+        self.any_rule = re.compile('(^| )({})($| )'.format('|'.join(token_groups)))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def matches(self, texts):
+        texts = [text for text in texts if self.any_rule.search(text)]
+        if not texts:
+            return []
+        return [
+            name for name, regex in self.rules
+            if any(regex.search(text) for text in texts)
+        ]
+
+
+def _check_products(rules, products):
+    matches = defaultdict(list)
+    checked = 0
+    for product in products:
+        checked += 1
+        for name in rules.matches(product):
+            matches[name].append(product['store_product_url'])
+    return checked, dict(matches)
+
+
+def _check_segment(dynamodb, task):
+    from charm_product.product import scan_products
+
+    rules, segment, total_segments = task
+    return _check_products(rules, scan_products(
+        dynamodb, only_attributes=CHECKED_ATTRIBUTES,
+        segment=segment, total_segments=total_segments,
+    ))
+
+
+def _check_export_lines(task):
+    rules, lines = task
+    return _check_products(rules, (json.loads(line) for line in lines))
+
+
+def _report(rules, results, start):
+    seconds = time.perf_counter() - start
+    matches = {name: [] for name in rules.names}
+    checked = 0
+    for task_checked, task_matches in results:
+        checked += task_checked
+        for name, urls in task_matches.items():
+            matches[name].extend(urls)
+    return dict(
+        checked=checked,
+        seconds=seconds,
+        products_per_sec=checked / seconds if seconds else None,
+        rules={
+            name: dict(count=len(urls), store_product_urls=sorted(urls))
+            for name, urls in matches.items()
+        },
+    )
+
+
+def dry_run_scan(dynamodb, rules, processes=None, total_segments=None):
+    """
+    Scan the product table in "total_segments" parallel segments across
+    "processes" worker processes (each using the default resource factory)
+    and report the products matched by each rule. With "processes=1",
+    segments are scanned in this process with "dynamodb" (if not None).
+    Worker processes cannot use "dynamodb", so "processes" defaults to 1
+    when it is given.
+
+    Returns dict(checked, seconds, products_per_sec, rules={rule: dict(count,
+    store_product_urls)}).
+    """
+    import os
+
+    from charm_product.session import get_resource, process_map
+
+    if processes is None:
+        processes = 1 if dynamodb is not None else os.cpu_count() or 1
+    elif processes > 1 and dynamodb is not None:
+        raise ValueError('dynamodb can only be used with processes=1')
+    if total_segments is None:
+        total_segments = processes * DEFAULT_SEGMENTS_PER_PROCESS
+    tasks = [(rules, segment, total_segments) for segment in range(total_segments)]
+
+    start = time.perf_counter()
+    if processes == 1:
+        dynamodb = dynamodb if dynamodb is not None else get_resource()
+        results = [_check_segment(dynamodb, task) for task in tasks]
+    else:
+        results = process_map(_check_segment, tasks, processes=processes)
+    return _report(rules, results, start)
+
+
+def dry_run_export(path, rules, processes=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Check the products of a JSON lines export (one product dict per line) in
+    chunks across "processes" worker processes (see "dry_run_scan")
+    """
+    import concurrent.futures
+    import os
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    def tasks(fh):
+        lines = (line for line in fh if line.strip())
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            yield rules, chunk
+
+    start = time.perf_counter()
+    with open(path) as fh:
+        if processes == 1:
+            results = [_check_export_lines(task) for task in tasks(fh)]
+        else:
+            results = []
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+                # (bounded number of chunks in flight, exports may not fit in memory)
+                pending = set()
+                for task in tasks(fh):
+                    if len(pending) >= processes * 2:
+                        done, pending = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        results.extend(future.result() for future in done)
+                    pending.add(executor.submit(_check_export_lines, task))
+                results.extend(future.result() for future in pending)
+    return _report(rules, results, start)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Report the products matched by new blacklist token groups'
+    )
+    parser.add_argument(
+        '--title', action='append', default=[], help='title token group (repeatable)'
+    )
+    parser.add_argument(
+        '--image-url', action='append', default=[],
+        help='image URL token group (repeatable)',
+    )
+    parser.add_argument(
+        '--existing', action='store_true',
+        help='also check the current blacklist token groups',
+    )
+    parser.add_argument('--export', help='JSON lines product export (instead of a table scan)')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--segments', type=int, help='total table scan segments')
+    parser.add_argument(
+        '--max-urls', type=int, default=100, help='store product URLs listed per rule'
+    )
+    args = parser.parse_args(argv)
+
+    title_token_groups = list(args.title)
+    image_token_groups = list(args.image_url)
+    if args.existing:
+        title_token_groups += PRODUCT_TITLE_BLACKLIST_TOKENS
+        image_token_groups += IMAGE_URL_BLACKLIST_TOKENS
+    if not title_token_groups and not image_token_groups:
+        parser.error('no token groups given (use --title, --image-url or --existing)')
+    rules = BlacklistRules(title_token_groups, image_token_groups)
+
+    if args.export is not None:
+        report = dry_run_export(args.export, rules, processes=args.processes)
+    else:
+        report = dry_run_scan(
+            None, rules, processes=args.processes, total_segments=args.segments
+        )
+    for rule in report['rules'].values():
+        del rule['store_product_urls'][args.max_urls:]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Bulk product updates
+
+Availability updates for whole stores and brands:
+
+    report = set_store_availability(
+        dynamodb, 'store.com', False,
+        factory=ResourceFactory(max_pool_connections=32), max_workers=32,
+        checkpoint=FileCheckpoint('delist-store.com.json'),
+        progress=print,
+    )
+
+Product keys are read page by page from the store (or brand) index
+partition of products with the opposite availability, and each page is
+updated in a thread pool (see "session.parallel_map"), paced by the
+adaptive rate limiter. Updates are conditional on the old availability, so
+re-running (or resuming from a "checkpoint") never updates a product twice.
+
+Product UUID merges and brand domain assignment ("mega products"):
+
+    merge_product_uuids(
+        dynamodb,
+        {'store.com/product-1': uuid_a, 'other.com/product-9': uuid_a},
+        brand_domains={uuid_a: 'brand.com'},
+    )
+
+Worker threads use resources from "factory" (by default a factory sized for
+"max_workers"), as boto3 resources must not be shared between threads. A
+local backend "dynamodb" is shared by the worker threads.
+"""
+import itertools
+import json
+import os
+from datetime import datetime, timezone
+
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.counter import (
+    product_counter_changes,
+    product_counters_enabled,
+    update_product_counters,
+)
+from charm_product.indexes import modified_keys, top_rank
+from charm_product.instrument import span, traced
+from charm_product.ratelimit import rate_limited
+from charm_product.session import DEFAULT_MAX_WORKERS, parallel_map, parallel_resources
+from charm_product.tag import ProductTag, delete_product_tags
+from charm_product.util import clean_product_url, get_table_name
+from charm_product.validation import iso_date_string
+
+
+class FileCheckpoint:
+    """
+    Bulk operation checkpoint stored as a JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _set_product_availability(dynamodb, item, is_available, removed_at, operation):
+    """
+    Set the availability of a product (index item) if it is unchanged since
+    it was read. Returns whether the product was updated.
+    """
+    from boto3.dynamodb.conditions import Attr
+
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    updates = {'is_available': int(is_available)}
+    if not is_available:
+        updates['removed_at'] = removed_at
+    rank = top_rank(is_available, item.get('best_selling_position'))
+    if rank is not None:
+        updates['top_rank'] = rank
+    updates.update(modified_keys(item['store_product_url'], datetime.now(timezone.utc)))
+
+    update_expression = 'SET {}'.format(', '.join(f'{attr} = :{attr}' for attr in updates))
+    if is_available:
+        # (re-listed products are no longer removed)
+        update_expression += ' REMOVE removed_at'
+
+    try:
+        response = rate_limited(product_table.update_item)(
+            Key={'store_product_url': item['store_product_url']},
+            UpdateExpression=update_expression,
+            ConditionExpression=Attr('is_available').eq(int(not is_available)),
+            ExpressionAttributeValues={f':{attr}': value for attr, value in updates.items()},
+            **capacity_kwargs()
+        )
+    except product_table.meta.client.exceptions.ConditionalCheckFailedException:
+        # availability changed (or product deleted) since the index was read
+        return False
+    record_consumed_capacity(operation, response, write=True)
+
+    if product_counters_enabled():
+        update_product_counters(dynamodb, product_counter_changes(
+            dict(item, is_available=not is_available), dict(item, is_available=is_available)
+        ), operation)
+    return True
+
+
+def _set_availability(
+    dynamodb, index_name, hash_key, hash_value, is_available, operation,
+    removed_at=None, max_workers=DEFAULT_MAX_WORKERS, factory=None,
+    checkpoint=None, progress=None, page_size=None,
+):
+    from boto3.dynamodb.conditions import Key
+
+    if removed_at is None:
+        removed_at = datetime.now(timezone.utc)
+    removed_at = iso_date_string(removed_at)
+    old_is_available = int(not is_available)
+
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is None:
+        state = dict(processed=0, updated=0, skipped=0, last_key=None)
+
+    product_table = dynamodb.Table(get_table_name('product'))
+    resources = parallel_resources(dynamodb, factory, max_workers)
+
+    def update(worker_dynamodb, item):
+        return _set_product_availability(
+            worker_dynamodb, item, is_available, removed_at, operation
+        )
+
+    while True:
+        query_kwargs = {}
+        if state['last_key'] is not None:
+            query_kwargs['ExclusiveStartKey'] = {
+                hash_key: hash_value,
+                'is_available': old_is_available,
+                'store_product_url': state['last_key'],
+            }
+        if page_size is not None:
+            query_kwargs['Limit'] = page_size
+
+        with span(f'{operation}.query_page', index_name=index_name):
+            results = rate_limited(product_table.query)(
+                IndexName=index_name,
+                KeyConditionExpression=(
+                    Key(hash_key).eq(hash_value) & Key('is_available').eq(old_is_available)
+                ),
+                ProjectionExpression=(
+                    'store_product_url,store_domain,brand_domain,best_selling_position'
+                ),
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity(operation, results)
+
+        updated = parallel_map(
+            update, results['Items'], max_workers=max_workers, **resources
+        )
+        state['processed'] += len(updated)
+        state['updated'] += sum(updated)
+        state['skipped'] += len(updated) - sum(updated)
+
+        last_key = results.get('LastEvaluatedKey')
+        state['last_key'] = last_key['store_product_url'] if last_key else None
+        if checkpoint is not None:
+            checkpoint.save(state)
+        if progress is not None:
+            progress(dict(state))
+
+        if last_key is None:
+            break
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    return dict(processed=state['processed'], updated=state['updated'], skipped=state['skipped'])
+
+
+@traced('set_store_availability')
+def set_store_availability(dynamodb, store_domain, is_available, **kwargs):
+    """
+    Set the availability of all products of a store ("removed_at" is set
+    when products are made unavailable)
+
+    Progress ({"processed", "updated", "skipped", "last_key"}) is saved to
+    "checkpoint" (see "FileCheckpoint") and passed to "progress" after each
+    page. An interrupted operation resumes from the checkpoint. Returns the
+    number of products processed, updated and skipped (changed concurrently).
+    """
+    return _set_availability(
+        dynamodb, 'store_domain_hash_idx', 'store_domain', store_domain, is_available,
+        'set_store_availability', **kwargs
+    )
+
+
+@traced('set_brand_availability')
+def set_brand_availability(dynamodb, brand_domain, is_available, **kwargs):
+    """
+    Set the availability of all products of a brand (see
+    "set_store_availability")
+    """
+    return _set_availability(
+        dynamodb, 'brand_domain_list_idx', 'brand_domain', brand_domain, is_available,
+        'set_brand_availability', **kwargs
+    )
+
+
+MERGE_CHUNK_SIZE = 1000
+
+
+def _set_product_meta(dynamodb, store_product_url, attrs, operation):
+    """
+    Set managed attributes of an existing product. Returns the old item (or
+    None if the product does not exist).
+    """
+    from boto3.dynamodb.conditions import Attr
+
+    product_table = dynamodb.Table(get_table_name('product'))
+    updates = {**attrs, **modified_keys(store_product_url, datetime.now(timezone.utc))}
+    try:
+        response = rate_limited(product_table.update_item)(
+            Key={'store_product_url': store_product_url},
+            UpdateExpression='SET {}'.format(', '.join(f'{attr} = :{attr}' for attr in updates)),
+            ConditionExpression=Attr('store_product_url').exists(),
+            ExpressionAttributeValues={f':{attr}': value for attr, value in updates.items()},
+            ReturnValues='ALL_OLD',
+            **capacity_kwargs()
+        )
+    except product_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return None
+    record_consumed_capacity(operation, response, write=True)
+
+    old_item = response['Attributes']
+    if product_counters_enabled() and old_item.get('brand_domain') != attrs.get(
+        'brand_domain', old_item.get('brand_domain')
+    ):
+        update_product_counters(
+            dynamodb, product_counter_changes(old_item, {**old_item, **attrs}), operation
+        )
+    return old_item
+
+
+def _product_uuid_brand_updates(dynamodb, product_uuid, brand_domain, operation):
+    """
+    Get the products with a product UUID which do not have its brand domain
+    """
+    from boto3.dynamodb.conditions import Key
+
+    product_table = dynamodb.Table(get_table_name('product'))
+    query_kwargs = {}
+    store_product_urls = []
+    while True:
+        with span(f'{operation}.query_page', index_name='product_uuid_list_idx'):
+            results = rate_limited(product_table.query)(
+                IndexName='product_uuid_list_idx',
+                KeyConditionExpression=Key('product_uuid').eq(product_uuid),
+                ProjectionExpression='store_product_url,brand_domain',
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity(operation, results)
+        store_product_urls.extend(
+            item['store_product_url'] for item in results['Items']
+            if item.get('brand_domain') != brand_domain
+        )
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        query_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+    return store_product_urls
+
+
+@traced('merge_product_uuids')
+def merge_product_uuids(
+    dynamodb, product_uuids, brand_domains=None,
+    max_workers=DEFAULT_MAX_WORKERS, factory=None, progress=None,
+):
+    """
+    Set merged product UUIDs ({store product URL: product UUID}) and the brand
+    domains of product UUIDs ({product UUID: brand domain}), and clear the
+    "update_product_meta" tags of the updated products
+
+    Brand domains are also set for other products which already have the
+    product UUID. Updates are idempotent, so a failed run may be repeated.
+    Returns the number of products updated and missing (not updated).
+    """
+    brand_domains = brand_domains or {}
+    report = dict(updated=0, missing=0)
+    operation = 'merge_product_uuids'
+
+    resources = parallel_resources(dynamodb, factory, max_workers)
+
+    def update(worker_dynamodb, args):
+        store_product_url, attrs = args
+        old_item = _set_product_meta(worker_dynamodb, store_product_url, attrs, operation)
+        return old_item is not None
+
+    def apply(updates):
+        updates = iter(updates)
+        while True:
+            chunk = list(itertools.islice(updates, MERGE_CHUNK_SIZE))
+            if not chunk:
+                break
+            updated = parallel_map(update, chunk, max_workers=max_workers, **resources)
+            delete_product_tags(dynamodb, ProductTag.update_product_meta, [
+                store_product_url
+                for (store_product_url, _), was_updated in zip(chunk, updated)
+                if was_updated
+            ])
+            report['updated'] += sum(updated)
+            report['missing'] += len(updated) - sum(updated)
+            if progress is not None:
+                progress(dict(report))
+
+    def uuid_updates():
+        for product_url, product_uuid in product_uuids.items():
+            attrs = {'product_uuid': product_uuid}
+            if product_uuid in brand_domains:
+                attrs['brand_domain'] = brand_domains[product_uuid]
+            yield clean_product_url(product_url), attrs
+
+    def brand_updates():
+        for product_uuid, brand_domain in brand_domains.items():
+            for store_product_url in _product_uuid_brand_updates(
+                dynamodb, product_uuid, brand_domain, operation
+            ):
+                yield store_product_url, {'brand_domain': brand_domain}
+
+    apply(uuid_updates())
+    # (products merged above already have the brand domain)
+    apply(brand_updates())
+    return report
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class CapacityBudgetExceeded(Exception):
+    pass
+
+
+class CapacityBudget:
+    """
+    Capacity budget for batch jobs
+
+    Consumption above "read_units_per_second" / "write_units_per_second" is
+    slowed down (the recording thread sleeps until the budget recovers).
+    Consumption above "max_read_units" / "max_write_units" in total raises
+    "CapacityBudgetExceeded" (further work is rejected).
+    """
+
+    def __init__(
+        self,
+        read_units_per_second=None,
+        write_units_per_second=None,
+        max_read_units=None,
+        max_write_units=None,
+    ):
+        self.rates = {'read': read_units_per_second, 'write': write_units_per_second}
+        self.limits = {'read': max_read_units, 'write': max_write_units}
+        self._consumed = {'read': 0.0, 'write': 0.0}
+        # token bucket level per capacity type (allow up to 1 second of bursting)
+        self._tokens = {
+            k: rate for k, rate in self.rates.items() if rate is not None
+        }
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        Raise "CapacityBudgetExceeded" if the budget has been exhausted
+        """
+        for capacity_type, limit in self.limits.items():
+            if limit is not None and self._consumed[capacity_type] >= limit:
+                raise CapacityBudgetExceeded(
+                    f'{capacity_type.title()} capacity budget exhausted '
+                    f'({self._consumed[capacity_type]:g} >= {limit:g} units)'
+                )
+
+    def consume(self, read_units=0, write_units=0):
+        delay = 0
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._updated_at = now
+            for capacity_type, units in [('read', read_units), ('write', write_units)]:
+                self._consumed[capacity_type] += units
+                rate = self.rates[capacity_type]
+                if rate is None:
+                    continue
+                tokens = min(rate, self._tokens[capacity_type] + elapsed * rate) - units
+                self._tokens[capacity_type] = tokens
+                if tokens < 0:
+                    delay = max(delay, -tokens / rate)
+
+        if delay:
+            time.sleep(delay)
+        self.check()
+
+
+class CapacityAccount:
+    """
+    Consumed capacity totals per operation, table and index
+
+    Capacity is only collected while accounting is enabled (see
+    "enable_capacity_accounting").
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.budget = None
+        self._lock = threading.Lock()
+        self._usage = self._new_usage()
+
+    @staticmethod
+    def _new_usage():
+        # operation -> (table name, index name) -> capacity type -> units
+        return defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+
+    def reset(self):
+        with self._lock:
+            self._usage = self._new_usage()
+
+    def record(self, operation, consumed_capacity, write=False):
+        """
+        Record the "ConsumedCapacity" from a DynamoDB response (a dict or a
+        list of dicts for batch operations)
+        """
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+
+        read_units = write_units = 0
+        with self._lock:
+            usage = self._usage[operation]
+            for capacity in consumed_capacity:
+                table_name = capacity['TableName']
+                parts = [((table_name, None), capacity.get('Table', capacity))]
+                parts.extend(
+                    ((table_name, index_name), index_capacity)
+                    for index_name, index_capacity in
+                    capacity.get('GlobalSecondaryIndexes', {}).items()
+                )
+                for key, part in parts:
+                    read, write = _capacity_units(part, write)
+                    usage[key]['read'] += read
+                    usage[key]['write'] += write
+                    usage[key]['requests'] += 1 if key[1] is None else 0
+                    read_units += read
+                    write_units += write
+
+        if self.budget is not None:
+            self.budget.consume(read_units=read_units, write_units=write_units)
+
+    def totals(self):
+        """
+        Get total read and write units per operation
+        """
+        with self._lock:
+            return {
+                operation: {
+                    'read': sum(u['read'] for u in usage.values()),
+                    'write': sum(u['write'] for u in usage.values()),
+                }
+                for operation, usage in self._usage.items()
+            }
+
+    def report(self):
+        """
+        Get consumed capacity per operation broken down by table and index
+        """
+        with self._lock:
+            return {
+                operation: [
+                    dict(
+                        table_name=table_name,
+                        index_name=index_name,
+                        read_units=units['read'],
+                        write_units=units['write'],
+                        requests=int(units['requests']),
+                    )
+                    for (table_name, index_name), units in sorted(
+                        usage.items(), key=lambda u: (u[0][0], u[0][1] or '')
+                    )
+                ]
+                for operation, usage in self._usage.items()
+            }
+
+
+def _capacity_units(capacity, write):
+    read_units = float(capacity.get('ReadCapacityUnits', 0))
+    write_units = float(capacity.get('WriteCapacityUnits', 0))
+    if not read_units and not write_units:
+        # only total "CapacityUnits" reported
+        if write:
+            write_units = float(capacity.get('CapacityUnits', 0))
+        else:
+            read_units = float(capacity.get('CapacityUnits', 0))
+    return read_units, write_units
+
+
+# Process-wide capacity accounting
+capacity_account = CapacityAccount()
+
+
+def enable_capacity_accounting(budget=None):
+    capacity_account.enabled = True
+    capacity_account.budget = budget
+
+
+def disable_capacity_accounting():
+    capacity_account.enabled = False
+    capacity_account.budget = None
+
+
+def capacity_kwargs():
+    """
+    Get request arguments for DynamoDB calls to return consumed capacity
+    (when capacity accounting is enabled)
+    """
+    if not capacity_account.enabled:
+        return {}
+    if capacity_account.budget is not None:
+        capacity_account.budget.check()
+    return {'ReturnConsumedCapacity': 'INDEXES'}
+
+
+def record_consumed_capacity(operation, response, write=False):
+    if capacity_account.enabled and response.get('ConsumedCapacity'):
+        capacity_account.record(operation, response['ConsumedCapacity'], write=write)
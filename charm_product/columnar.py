@@ -0,0 +1,316 @@
+"""
+Columnar product fetches for analytics
+
+Products are decoded from the pages of low-level client results (see
+"charm_product.lowlevel") directly into typed column buffers
+("array.array"), without building a dict per product:
+
+    columns = fetch_product_columns_by_store(
+        dynamodb, 'store.com', columns=['primary_price', 'last_scraped_at']
+    )
+    arrays = columns.to_numpy()   # requires numpy
+    table = columns.to_arrow()    # requires pyarrow
+
+Column types are derived from "validation.ITEM_ATTRIBUTES": prices are
+float64 (NaN if missing), integers int64, dates datetime64[us] (UTC) and
+low-cardinality strings are dictionary encoded.
+"""
+import array
+import importlib
+import math
+from datetime import datetime, timezone
+
+from charm_product import lowlevel
+from charm_product.record import INTERNED_ATTRIBUTES
+from charm_product.validation import ITEM_ATTRIBUTES, iso_date_string, price
+
+
+# numpy "NaT" (and missing integer) value
+INT64_NULL = -2 ** 63
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _require(module_name, extra):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(
+            f'"{module_name}" is required for this conversion '
+            f'(pip install charm_product[{extra}])'
+        )
+
+
+class Column:
+    """
+    Column buffer with a validity mask
+    """
+    typecode = None
+
+    def __init__(self, name):
+        self.name = name
+        self.values = array.array(self.typecode)
+        self.valid = array.array('b')
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        if value is None:
+            self.values.append(self.null)
+            self.valid.append(0)
+        else:
+            self.values.append(self.convert(value))
+            self.valid.append(1)
+
+    def convert(self, value):
+        return value
+
+    def to_numpy(self):
+        np = _require('numpy', 'numpy')
+        return np.frombuffer(self.values, dtype=self.dtype).copy()
+
+    def to_arrow(self):
+        np = _require('numpy', 'numpy')
+        pa = _require('pyarrow', 'arrow')
+        mask = np.frombuffer(self.valid, dtype=np.int8) == 0
+        return pa.array(self.to_numpy(), mask=mask)
+
+
+class FloatColumn(Column):
+    typecode = 'd'
+    dtype = 'float64'
+    null = math.nan
+
+    def convert(self, value):
+        return float(value)
+
+
+class IntColumn(Column):
+    typecode = 'q'
+    dtype = 'int64'
+    null = INT64_NULL
+
+    def convert(self, value):
+        return int(value)
+
+
+class BoolColumn(Column):
+    typecode = 'b'
+    dtype = 'bool'
+    null = 0
+
+    def convert(self, value):
+        return 1 if value else 0
+
+
+class DatetimeColumn(Column):
+    """
+    UTC timestamps (microseconds since the epoch)
+    """
+    typecode = 'q'
+    dtype = 'datetime64[us]'
+    null = INT64_NULL
+
+    def convert(self, value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+    def to_numpy(self):
+        np = _require('numpy', 'numpy')
+        return np.frombuffer(self.values, dtype='int64').astype(self.dtype)
+
+
+class DictionaryColumn(Column):
+    """
+    Dictionary encoded strings ("codes" index into "categories", -1 if missing)
+    """
+    typecode = 'i'
+    null = -1
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.categories = []
+        self._codes = {}
+
+    def convert(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def to_numpy(self):
+        """
+        Get (codes, categories) arrays
+        """
+        np = _require('numpy', 'numpy')
+        return (
+            np.frombuffer(self.values, dtype='int32').copy(),
+            np.array(self.categories, dtype=object),
+        )
+
+    def to_arrow(self):
+        np = _require('numpy', 'numpy')
+        pa = _require('pyarrow', 'arrow')
+        codes = np.frombuffer(self.values, dtype='int32')
+        mask = np.frombuffer(self.valid, dtype=np.int8) == 0
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=mask), pa.array(self.categories, type=pa.string())
+        )
+
+
+class StringColumn(Column):
+
+    def __init__(self, name):
+        self.name = name
+        self.values = []
+        self.valid = array.array('b')
+
+    def append(self, value):
+        self.values.append(value)
+        self.valid.append(0 if value is None else 1)
+
+    def to_numpy(self):
+        np = _require('numpy', 'numpy')
+        return np.array(self.values, dtype=object)
+
+    def to_arrow(self):
+        pa = _require('pyarrow', 'arrow')
+        return pa.array(self.values, type=pa.string())
+
+
+def _column_type(attr):
+    if attr.name == 'is_available':
+        return BoolColumn
+    if attr.name in INTERNED_ATTRIBUTES:
+        return DictionaryColumn
+    if attr.type is price:
+        return FloatColumn
+    if attr.type is int:
+        return IntColumn
+    if attr.type is iso_date_string:
+        return DatetimeColumn
+    return StringColumn
+
+
+COLUMN_TYPES = {
+    'product_uuid': StringColumn,
+    'brand_domain': DictionaryColumn,
+    **{attr.name: _column_type(attr) for attr in ITEM_ATTRIBUTES}
+}
+
+DEFAULT_COLUMNS = [
+    'store_product_url',
+    'product_uuid',
+    'store_domain',
+    'brand_domain',
+    'is_available',
+    'primary_currency',
+    'primary_price',
+    'best_selling_position',
+    'published_at',
+    'last_scraped_at',
+]
+
+
+class ProductColumns:
+    """
+    Typed column buffers for a set of products
+    """
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = DEFAULT_COLUMNS
+        invalid = [name for name in columns if name not in COLUMN_TYPES]
+        if invalid:
+            raise ValueError(f'Invalid columns: {invalid}')
+        self.columns = {name: COLUMN_TYPES[name](name) for name in columns}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def append(self, item):
+        for name, column in self.columns.items():
+            column.append(item.get(name))
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+        return self
+
+    def extend_pages(self, dynamodb, pages):
+        """
+        Append the products of low-level result pages (see
+        "lowlevel._fetch_product_pages")
+        """
+        if getattr(lowlevel.get_client(dynamodb), 'native_types', False):
+            # (local backend items are python values)
+            for items in pages:
+                self.extend(items)
+            return self
+
+        decoders = [
+            (name, column, lowlevel.attribute_decoder(name))
+            for name, column in self.columns.items()
+        ]
+        for items in pages:
+            for item in items:
+                for name, column, decode in decoders:
+                    value = item.get(name)
+                    column.append(None if value is None else decode(value))
+        return self
+
+    def to_numpy(self):
+        """
+        Get a dict of numpy arrays by column name (dictionary encoded columns
+        as (codes, categories) tuples)
+        """
+        return {name: column.to_numpy() for name, column in self.columns.items()}
+
+    def to_arrow(self):
+        pa = _require('pyarrow', 'arrow')
+        return pa.Table.from_arrays(
+            [column.to_arrow() for column in self.columns.values()],
+            names=list(self.columns),
+        )
+
+
+def _fetch_columns(
+    dynamodb, index_name, hash_name, hash_value, columns, is_available=True, **kwargs
+):
+    product_columns = ProductColumns(columns)
+    return product_columns.extend_pages(dynamodb, lowlevel._fetch_product_pages(
+        dynamodb, index_name, hash_name, hash_value, is_available,
+        operation='fetch_product_columns', only_attributes=list(product_columns.columns),
+        **kwargs
+    ))
+
+
+def fetch_product_columns_by_store(dynamodb, store_domain, columns=None, **kwargs):
+    return _fetch_columns(
+        dynamodb, 'store_domain_hash_idx', 'store_domain', store_domain, columns, **kwargs
+    )
+
+
+def fetch_product_columns_by_brand(dynamodb, brand_domain, columns=None, **kwargs):
+    return _fetch_columns(
+        dynamodb, 'brand_domain_list_idx', 'brand_domain', brand_domain, columns, **kwargs
+    )
+
+
+def scan_product_columns(dynamodb, columns=None, **kwargs):
+    """
+    Export the whole product table as columns (see "product.scan_products")
+    """
+    product_columns = ProductColumns(columns)
+    return product_columns.extend_pages(dynamodb, lowlevel._scan_product_pages(
+        dynamodb, only_attributes=list(product_columns.columns), **kwargs
+    ))
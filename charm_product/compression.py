@@ -0,0 +1,284 @@
+"""
+Transparent compression of large product attributes
+
+When enabled, "description" and "json_data" values of at least "min_size"
+bytes are stored compressed as Binary attributes by the product write
+paths, and decompressed by the read paths. Compression is opt-in:
+
+    enable_compression('zlib')   # or 'zstd' (requires "zstandard")
+
+or set the "CHARM_PRODUCT_COMPRESSION" environment variable to "zlib" or
+"zstd". Compressed values are always decoded on read, whether or not
+compression is enabled.
+
+Existing items are compressed with "backfill_compression":
+
+    CHARM_PRODUCT_ENV=dev python -m charm_product.compression --codec zlib
+"""
+import math
+import os
+import zlib
+
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.indexes import ALL_PRODUCT_INDEX_KEYS, projected_attributes
+from charm_product.ratelimit import rate_limited
+
+
+COMPRESSED_ATTRIBUTES = ('description', 'json_data')
+
+DEFAULT_MIN_SIZE = 512
+
+# First byte of compressed values
+CODEC_IDS = {
+    'zlib': 1,
+    'zstd': 2,
+}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+
+class CompressedValue(bytes):
+    """
+    Compressed attribute value (codec id byte + compressed data)
+    """
+
+    def decompress(self):
+        return decompress_value(self)
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            '"zstandard" is required for zstd compression '
+            '(pip install charm_product[zstd])'
+        )
+    return zstandard
+
+
+def compress_value(value, codec='zlib', level=None):
+    data = value.encode('utf-8')
+    if codec == 'zlib':
+        compressed = zlib.compress(data, 6 if level is None else level)
+    elif codec == 'zstd':
+        compressed = _zstd().ZstdCompressor(level=3 if level is None else level).compress(data)
+    else:
+        raise ValueError(f'Invalid compression codec: {codec}')
+    return CompressedValue(bytes([CODEC_IDS[codec]]) + compressed)
+
+
+def decompress_value(value):
+    """
+    Decompress a value stored by "compress_value" (a bytes or boto3 "Binary")
+    """
+    data = bytes(getattr(value, 'value', value))
+    codec = CODEC_NAMES.get(data[0]) if data else None
+    if codec == 'zlib':
+        return zlib.decompress(data[1:]).decode('utf-8')
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data[1:]).decode('utf-8')
+    raise ValueError('Invalid compressed value')
+
+
+def is_compressed(value):
+    return not isinstance(value, str) and isinstance(getattr(value, 'value', value), bytes)
+
+
+class CompressionConfig:
+
+    def __init__(self, codec='zlib', level=None, min_size=DEFAULT_MIN_SIZE):
+        if codec not in CODEC_IDS:
+            raise ValueError(f'Invalid compression codec: {codec}')
+        if codec == 'zstd':
+            _zstd()
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+
+
+_UNSET = object()
+_config = _UNSET
+
+
+def enable_compression(codec='zlib', level=None, min_size=DEFAULT_MIN_SIZE):
+    global _config
+    _config = CompressionConfig(codec, level=level, min_size=min_size)
+
+
+def disable_compression():
+    global _config
+    _config = None
+
+
+def get_compression():
+    """
+    Get the compression config (None if compression is disabled)
+    """
+    global _config
+    if _config is _UNSET:
+        codec = os.environ.get('CHARM_PRODUCT_COMPRESSION', '').lower()
+        _config = CompressionConfig(codec) if codec not in ('', 'none') else None
+    return _config
+
+
+def compress_attributes(item_data, config=None):
+    """
+    Compress large attributes of validated product data (if enabled)
+    """
+    config = config or get_compression()
+    if config is None:
+        return item_data
+
+    for name in COMPRESSED_ATTRIBUTES:
+        value = item_data.get(name)
+        if isinstance(value, str) and len(value) >= config.min_size:
+            compressed = compress_value(value, config.codec, config.level)
+            if len(compressed) < len(value.encode('utf-8')):
+                item_data[name] = compressed
+    return item_data
+
+
+def decompress_attributes(item):
+    for name in COMPRESSED_ATTRIBUTES:
+        value = item.get(name)
+        if value is not None and is_compressed(value):
+            item[name] = decompress_value(value)
+    return item
+
+
+def _capacity_units(size, unit_size):
+    return max(1, math.ceil(size / unit_size))
+
+
+def _item_capacity(item):
+    from charm_product.backends.base import item_size
+
+    size = item_size(item)
+    write_units = _capacity_units(size, 1024)
+    # writes are repeated for each index the item is projected into
+    for index_name, index_keys in ALL_PRODUCT_INDEX_KEYS.items():
+        if all(key in item for key in index_keys):
+            attributes = projected_attributes(index_name)
+            write_units += _capacity_units(
+                item_size({k: v for k, v in item.items() if k in attributes}), 1024
+            )
+    return size, write_units, _capacity_units(size, 4096)
+
+
+def backfill_compression(
+    dynamodb, config=None, dry_run=False, segment=None, total_segments=None
+):
+    """
+    Compress large attributes of existing products
+
+    Returns a report of the storage and capacity saved (write units include
+    the copies of items in indexes; read units are for strongly consistent
+    reads of a single item).
+    """
+    from boto3.dynamodb.conditions import Attr
+    from charm_product.util import get_table_name
+
+    config = config or get_compression() or CompressionConfig()
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    totals = dict(
+        items_scanned=0, items_compressed=0, items_skipped=0,
+        bytes_before=0, bytes_after=0,
+        write_units_before=0, write_units_after=0,
+        read_units_before=0, read_units_after=0,
+    )
+
+    scan_kwargs = {}
+    if total_segments is not None:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+
+    scan = rate_limited(product_table.scan)
+    update_item = rate_limited(product_table.update_item)
+    while True:
+        results = scan(**scan_kwargs, **capacity_kwargs())
+        record_consumed_capacity('backfill_compression', results)
+        for item in results['Items']:
+            totals['items_scanned'] += 1
+            size, write_units, read_units = _item_capacity(item)
+            compressed = compress_attributes(
+                {name: item[name] for name in COMPRESSED_ATTRIBUTES if name in item},
+                config,
+            )
+            updates = {
+                name: value for name, value in compressed.items()
+                if isinstance(value, CompressedValue)
+            }
+
+            if updates and not dry_run:
+                condition = None
+                for name in updates:
+                    # do not overwrite values updated since the scan
+                    clause = Attr(name).eq(item[name])
+                    condition = clause if condition is None else condition & clause
+                try:
+                    response = update_item(
+                        Key={'store_product_url': item['store_product_url']},
+                        UpdateExpression='SET ' + ', '.join(
+                            f'{name} = :{name}' for name in updates
+                        ),
+                        ConditionExpression=condition,
+                        ExpressionAttributeValues={
+                            f':{name}': value for name, value in updates.items()
+                        },
+                        **capacity_kwargs()
+                    )
+                except product_table.meta.client.exceptions.ConditionalCheckFailedException:
+                    totals['items_skipped'] += 1
+                    updates = {}
+                else:
+                    record_consumed_capacity('backfill_compression', response, write=True)
+
+            new_size, new_write_units, new_read_units = _item_capacity({**item, **updates})
+            totals['items_compressed'] += 1 if updates else 0
+            totals['bytes_before'] += size
+            totals['bytes_after'] += new_size
+            totals['write_units_before'] += write_units
+            totals['write_units_after'] += new_write_units
+            totals['read_units_before'] += read_units
+            totals['read_units_after'] += new_read_units
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        scan_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+    n_items = totals['items_scanned'] or 1
+    totals.update(
+        saved_bytes_per_item=(totals['bytes_before'] - totals['bytes_after']) / n_items,
+        saved_write_units_per_item=(
+            totals['write_units_before'] - totals['write_units_after']
+        ) / n_items,
+        saved_read_units_per_item=(
+            totals['read_units_before'] - totals['read_units_after']
+        ) / n_items,
+    )
+    return totals
+
+
+def main(argv=None):
+    import argparse
+    import boto3
+    import json
+
+    parser = argparse.ArgumentParser(description='Compress large product attributes')
+    parser.add_argument('--codec', choices=sorted(CODEC_IDS), default='zlib')
+    parser.add_argument('--level', type=int)
+    parser.add_argument('--min-size', type=int, default=DEFAULT_MIN_SIZE)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    report = backfill_compression(
+        boto3.resource('dynamodb'),
+        CompressionConfig(args.codec, level=args.level, min_size=args.min_size),
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Maintained product counts per store and brand
+
+When enabled, the product add/update/delete paths update counts of
+available and unavailable products per store and brand in the
+"product_counter" table (with atomic "ADD" updates), so that counts are
+read with a single "GetItem":
+
+    enable_product_counters()   # or set CHARM_PRODUCT_COUNTERS=1
+    get_store_product_count(dynamodb, 'store.com')
+
+Counter updates are separate requests after the product write, not part of
+a transaction with it: if the counter update fails (or the process exits
+between the two writes), counts drift from the product table until
+"rebuild_product_counters" is run. ("TransactWriteItems" would double the
+write capacity of every product write, and is not supported by the local
+backends.)
+
+Counters are also updated by the bulk jobs in "charm_product.bulk", but not
+by jobs writing the product table directly. "rebuild_product_counters"
+resets counts from "COUNT" queries of the product indexes.
+"""
+import os
+from collections import defaultdict
+
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.instrument import traced
+from charm_product.ratelimit import rate_limited
+from charm_product.util import get_table_name
+
+
+COUNTER_ATTRIBUTES = {
+    True: 'available_count',
+    False: 'unavailable_count',
+}
+
+_UNSET = object()
+_enabled = _UNSET
+
+
+def enable_product_counters():
+    global _enabled
+    _enabled = True
+
+
+def disable_product_counters():
+    global _enabled
+    _enabled = False
+
+
+def product_counters_enabled():
+    global _enabled
+    if _enabled is _UNSET:
+        _enabled = os.environ.get('CHARM_PRODUCT_COUNTERS', '').lower() in ('1', 'true')
+    return _enabled
+
+
+def counter_key(kind, domain):
+    return f'{kind}#{domain}'
+
+
+def product_counter_deltas(item, delta):
+    """
+    Get counter deltas ({(counter key, attribute): delta}) for adding
+    ("delta" 1) or removing ("delta" -1) a product item
+    """
+    attr = COUNTER_ATTRIBUTES[bool(item['is_available'])]
+    deltas = {(counter_key('store', item['store_domain']), attr): delta}
+    if item.get('brand_domain'):
+        deltas[(counter_key('brand', item['brand_domain']), attr)] = delta
+    return deltas
+
+
+def product_counter_changes(old_item, new_item):
+    """
+    Get counter deltas for a change of a product item
+    """
+    deltas = product_counter_deltas(old_item, -1)
+    for key, delta in product_counter_deltas(new_item, 1).items():
+        deltas[key] = deltas.get(key, 0) + delta
+    return deltas
+
+
+def update_product_counters(dynamodb, deltas, operation='update_product_counters'):
+    """
+    Atomically add counter deltas (see "product_counter_deltas")
+    """
+    by_key = defaultdict(dict)
+    for (key, attr), delta in deltas.items():
+        if delta:
+            by_key[key][attr] = by_key[key].get(attr, 0) + delta
+
+    counter_table = dynamodb.Table(get_table_name('product_counter'))
+    for key, attr_deltas in by_key.items():
+        response = rate_limited(counter_table.update_item)(
+            Key={'counter_key': key},
+            UpdateExpression='ADD {}'.format(', '.join(
+                f'{attr} :{attr}' for attr in attr_deltas
+            )),
+            ExpressionAttributeValues={
+                f':{attr}': delta for attr, delta in attr_deltas.items()
+            },
+            **capacity_kwargs()
+        )
+        record_consumed_capacity(operation, response, write=True)
+
+
+def _get_count(dynamodb, key, is_available):
+    counter_table = dynamodb.Table(get_table_name('product_counter'))
+    response = rate_limited(counter_table.get_item)(
+        Key={'counter_key': key},
+        **capacity_kwargs()
+    )
+    record_consumed_capacity('get_product_count', response)
+    item = response.get('Item') or {}
+    if is_available is None:
+        return sum(int(item.get(attr, 0)) for attr in COUNTER_ATTRIBUTES.values())
+    return int(item.get(COUNTER_ATTRIBUTES[bool(is_available)], 0))
+
+
+@traced('get_store_product_count')
+def get_store_product_count(dynamodb, store_domain, is_available=True):
+    """
+    Get the maintained count of products of a store ("is_available" None
+    for all products)
+    """
+    return _get_count(dynamodb, counter_key('store', store_domain), is_available)
+
+
+@traced('get_brand_product_count')
+def get_brand_product_count(dynamodb, brand_domain, is_available=True):
+    return _get_count(dynamodb, counter_key('brand', brand_domain), is_available)
+
+
+@traced('rebuild_product_counters')
+def rebuild_product_counters(dynamodb, store_domains=(), brand_domains=()):
+    """
+    Reset counters of stores and brands from "COUNT" queries of the
+    product indexes
+    """
+    from charm_product.product import count_products_by_brand, count_products_by_store
+
+    counters = [
+        (counter_key('store', domain), count_products_by_store, domain)
+        for domain in store_domains
+    ] + [
+        (counter_key('brand', domain), count_products_by_brand, domain)
+        for domain in brand_domains
+    ]
+
+    counter_table = dynamodb.Table(get_table_name('product_counter'))
+    for key, count_products, domain in counters:
+        item = {'counter_key': key}
+        for is_available, attr in COUNTER_ATTRIBUTES.items():
+            item[attr] = count_products(dynamodb, domain, is_available=is_available)
+        response = rate_limited(counter_table.put_item)(Item=item, **capacity_kwargs())
+        record_consumed_capacity('rebuild_product_counters', response, write=True)
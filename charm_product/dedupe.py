@@ -0,0 +1,235 @@
+"""
+Near-duplicate product candidates for product UUID merging
+
+Titles are tokenized (as for blacklisted token matching), summarized by
+MinHash signatures and bucketed by locality sensitive hashing (LSH) per
+brand, so that candidate pairs are found without comparing all pairs of
+products of a brand:
+
+    for url_a, url_b, similarity in find_duplicate_candidates(products):
+        ...
+
+"products" are dicts (or "record.StoreProduct" records) with
+"store_product_url", "title" and "brand_domain", e.g. from
+"product.scan_products" or "fetch_brand_duplicate_candidates". Similarities
+are estimated Jaccard similarities of the title tokens. Products with the
+same title tokens (e.g. variants) are paired with the first of them only,
+so candidates are linear in the number of products, not quadratic.
+Requires numpy (pip install charm_product[numpy]).
+"""
+import importlib
+import random
+import zlib
+from collections import defaultdict
+
+from charm_product.validation import TOKENIZER_REGEX
+
+
+DEFAULT_NUM_PERM = 64
+DEFAULT_THRESHOLD = 0.5
+
+# Signatures are computed for up to this many titles at a time
+SIGNATURE_BATCH_SIZE = 10000
+# Products are bucketed in chunks of at least this many products
+CANDIDATE_CHUNK_SIZE = 50000
+# Signatures sharing an LSH bucket are paired with (up to) this many of the
+# next signatures of the bucket (so that large buckets of near-identical
+# titles do not give quadratic numbers of pairs)
+MAX_BUCKET_NEIGHBOURS = 50
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# largest 32 bit prime (a * hash + b for 32 bit hashes and coefficients below
+# it can't overflow 64 bits)
+_HASH_PRIME = (1 << 32) - 5
+
+
+def _numpy():
+    try:
+        return importlib.import_module('numpy')
+    except ImportError:
+        raise ImportError(
+            '"numpy" is required for duplicate detection (pip install charm_product[numpy])'
+        )
+
+
+def title_tokens(title):
+    return {token for token in TOKENIZER_REGEX.split(title.lower()) if token}
+
+
+def lsh_parameters(threshold, num_perm):
+    """
+    Get the (bands, rows) of an LSH index for a similarity "threshold"
+    (pairs with a similarity of about (1 / bands) ** (1 / rows) or more are
+    likely candidates)
+    """
+    return min(
+        ((num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0),
+        key=lambda p: abs((1 / p[0]) ** (1 / p[1]) - threshold),
+    )
+
+
+class MinHasher:
+    """
+    MinHash signatures of token sets (universal hashing of 32 bit token
+    hashes with "num_perm" permutations)
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, seed=1):
+        np = _numpy()
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._a = np.array(
+            [rng.randint(1, _HASH_PRIME - 1) for _ in range(num_perm)], dtype=np.uint64
+        )[:, None]
+        self._b = np.array(
+            [rng.randint(0, _HASH_PRIME - 1) for _ in range(num_perm)], dtype=np.uint64
+        )[:, None]
+        self._token_hashes = {}
+
+    def _token_hash(self, token):
+        h = self._token_hashes.get(token)
+        if h is None:
+            h = self._token_hashes[token] = zlib.crc32(token.encode('utf-8'))
+        return h
+
+    def signatures(self, token_sets):
+        """
+        Get an (n, num_perm) array of signatures for non-empty token sets
+        """
+        np = _numpy()
+        token_sets = list(token_sets)
+        signatures = np.empty((len(token_sets), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(token_sets), SIGNATURE_BATCH_SIZE):
+            batch = token_sets[start:start + SIGNATURE_BATCH_SIZE]
+            hashes = np.array(
+                [self._token_hash(token) for tokens in batch for token in tokens],
+                dtype=np.uint64,
+            )
+            offsets = np.cumsum([0] + [len(tokens) for tokens in batch[:-1]])
+            permuted = (self._a * hashes + self._b) % _HASH_PRIME
+            signatures[start:start + len(batch)] = np.minimum.reduceat(
+                permuted, offsets, axis=1
+            ).T
+        return signatures
+
+
+class LSHIndex:
+    """
+    Banded LSH over MinHash signatures
+    """
+
+    def __init__(self, bands, rows, seed=1):
+        np = _numpy()
+        rng = random.Random(seed)
+        self.bands = bands
+        self.rows = rows
+        self._coefficients = np.array(
+            [rng.getrandbits(64) | 1 for _ in range(rows)], dtype=np.uint64
+        )
+
+    def candidate_pairs(self, signatures, groups=None):
+        """
+        Get the set of (i, j) (i < j) signature index pairs sharing a bucket
+        in any band (and with the same "groups" value if given), each
+        signature paired with up to "MAX_BUCKET_NEIGHBOURS" others of a bucket
+        """
+        np = _numpy()
+        pairs = set()
+        if len(signatures) < 2:
+            return pairs
+        group_list = groups.tolist() if groups is not None else None
+        for band in range(self.bands):
+            columns = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+            # (wraps around)
+            keys = (columns * self._coefficients).sum(axis=1)
+            if groups is not None:
+                keys = keys * np.uint64(_MERSENNE_PRIME) + groups
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            same = sorted_keys[1:] == sorted_keys[:-1]
+            if not same.any():
+                continue
+            # runs of equal keys (buckets with more than one signature)
+            starts = np.flatnonzero(same & ~np.concatenate([[False], same[:-1]]))
+            ends = np.flatnonzero(same & ~np.concatenate([same[1:], [False]])) + 2
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                bucket = sorted(order[start:end].tolist())
+                pairs.update(
+                    (i, j) for n, i in enumerate(bucket)
+                    for j in bucket[n + 1:n + 1 + MAX_BUCKET_NEIGHBOURS]
+                    if group_list is None or group_list[i] == group_list[j]
+                )
+        return pairs
+
+
+def _chunk_candidates(urls, token_sets, groups, hasher, index, threshold):
+    np = _numpy()
+    signatures = hasher.signatures(token_sets)
+    groups = np.array(groups, dtype=np.uint64)
+    pairs = sorted(index.candidate_pairs(signatures, groups))
+    if not pairs:
+        return
+    i, j = np.array(pairs).T
+    similarities = (signatures[i] == signatures[j]).mean(axis=1)
+    for a, b, similarity in zip(i.tolist(), j.tolist(), similarities.tolist()):
+        if similarity >= threshold:
+            yield urls[a], urls[b], similarity
+
+
+def find_duplicate_candidates(
+    products, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+    group_by='brand_domain',
+):
+    """
+    Yield (store product URL, store product URL, similarity) candidate pairs
+    of products in the same "group_by" group (products without a group or
+    without title tokens are skipped)
+
+    Products with the same title tokens as an earlier product of their group
+    are only paired with that product (with a similarity of 1.0), and are
+    not indexed.
+    """
+    groups = defaultdict(lambda: ([], []))
+    first_urls = {}
+    for product in products:
+        group = product.get(group_by)
+        tokens = title_tokens(product.get('title') or '')
+        if group is None or not tokens:
+            continue
+        url = product['store_product_url']
+        first_url = first_urls.setdefault((group, frozenset(tokens)), url)
+        if first_url != url:
+            yield first_url, url, 1.0
+            continue
+        urls, token_sets = groups[group]
+        urls.append(url)
+        token_sets.append(tokens)
+
+    hasher = MinHasher(num_perm)
+    index = LSHIndex(*lsh_parameters(threshold, num_perm))
+
+    # groups are indexed together in chunks (of whole groups)
+    chunk = ([], [], [])
+    for group_id, (urls, token_sets) in enumerate(groups.values()):
+        chunk[0].extend(urls)
+        chunk[1].extend(token_sets)
+        chunk[2].extend([group_id] * len(urls))
+        if len(chunk[0]) >= CANDIDATE_CHUNK_SIZE:
+            yield from _chunk_candidates(*chunk, hasher, index, threshold)
+            chunk = ([], [], [])
+    if chunk[0]:
+        yield from _chunk_candidates(*chunk, hasher, index, threshold)
+
+
+def fetch_brand_duplicate_candidates(dynamodb, brand_domain, is_available=None, **kwargs):
+    """
+    Find duplicate candidates among the products of a brand (see
+    "find_duplicate_candidates")
+    """
+    from charm_product.product import fetch_products_by_brand
+
+    products = fetch_products_by_brand(
+        dynamodb, brand_domain, is_available=is_available,
+        only_attributes=['store_product_url', 'title', 'brand_domain'],
+    )
+    return find_duplicate_candidates(products, **kwargs)
@@ -0,0 +1,159 @@
+"""
+Projected attributes of the product and tag table indexes
+
+The product indexes only project the "list view" attributes used by listing
+queries (see migration 0006). Fetches needing other attributes read keys
+from an index and hydrate full items from the product table.
+"""
+import zlib
+from datetime import timedelta, timezone
+
+
+# Non-key attributes projected into the product indexes
+LIST_VIEW_ATTRIBUTES = [
+    'product_uuid',
+    'store_domain',
+    'brand_domain',
+    'full_store_product_url',
+    'title',
+    'image_urls',
+    'product_type',
+    'primary_currency',
+    'primary_price',
+    'best_selling_position',
+    'vendor_name',
+    'store_product_brand_domain',
+    'store_platform',
+    'published_at',
+    'last_scraped_at',
+]
+
+# Product index name -> index key attributes
+PRODUCT_INDEX_KEYS = {
+    'product_uuid_list_idx': ('product_uuid', 'is_available'),
+    'brand_domain_list_idx': ('brand_domain', 'is_available'),
+    'store_domain_hash_idx': ('store_domain', 'is_available'),
+}
+
+# Top products index name -> index key attributes (see "top_rank")
+TOP_RANK_INDEX_KEYS = {
+    'store_top_idx': ('store_domain', 'top_rank'),
+    'brand_top_idx': ('brand_domain', 'top_rank'),
+}
+
+# Modified products index name -> index key attributes (see "modified_keys")
+MODIFIED_INDEX_KEYS = {
+    'modified_idx': ('modified_shard', 'modified_at'),
+}
+
+ALL_PRODUCT_INDEX_KEYS = {**PRODUCT_INDEX_KEYS, **TOP_RANK_INDEX_KEYS, **MODIFIED_INDEX_KEYS}
+
+PRODUCT_TABLE_KEYS = ('store_product_url',)
+
+# Additional non-key attributes projected into specific product indexes
+# (the store index is read by "sync.sync_store" to detect changed products,
+# the modified index by incremental exports)
+INDEX_EXTRA_ATTRIBUTES = {
+    'store_domain_hash_idx': ['content_hash'],
+    'modified_idx': ['is_available', 'content_hash'],
+}
+
+# Best selling positions are zero-padded to sort as strings
+TOP_RANK_DIGITS = 10
+
+# Modified products are partitioned by hour, and spread over this many
+# shards within an hour (so that bursts of writes do not all go to one
+# index partition)
+MODIFIED_SHARDS = 16
+
+# Incremental reads of modified products start this long before the end of
+# the previous read ("modified_at" is set from the writer's clock, and the
+# index is eventually consistent)
+MODIFIED_OVERLAP = timedelta(minutes=5)
+
+# Non-key attributes projected into the product tag indexes
+TAG_INDEX_ATTRIBUTES = ['image_url']
+
+
+def non_key_attributes(index_name):
+    """
+    Get the "NonKeyAttributes" of an "INCLUDE" projected product index
+    """
+    keys = set(ALL_PRODUCT_INDEX_KEYS[index_name]) | set(PRODUCT_TABLE_KEYS)
+    return [
+        name for name in LIST_VIEW_ATTRIBUTES + INDEX_EXTRA_ATTRIBUTES.get(index_name, [])
+        if name not in keys
+    ]
+
+
+def projected_attributes(index_name):
+    """
+    Get all attributes projected into a product index
+    """
+    return (
+        set(PRODUCT_TABLE_KEYS) |
+        set(ALL_PRODUCT_INDEX_KEYS[index_name]) |
+        set(non_key_attributes(index_name))
+    )
+
+
+def top_rank(is_available, best_selling_position):
+    """
+    Get the "top_rank" sort key of the top products indexes
+    ("{is_available}#{best_selling_position}", so that available products
+    sort by best selling position). Products without a best selling position
+    are not ranked (returns None).
+    """
+    if best_selling_position is None or best_selling_position < 0:
+        return None
+    return f'{int(is_available)}#{int(best_selling_position):0{TOP_RANK_DIGITS}d}'
+
+
+def top_rank_prefix(is_available):
+    return f'{int(is_available)}#'
+
+
+def modified_timestamp(dt):
+    """
+    Format a datetime as a (sortable) "modified_at" value
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+def modified_bucket(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H')
+
+
+def modified_keys(store_product_url, modified_at):
+    """
+    Get the "modified_at" / "modified_shard" key attributes of the modified
+    products index ("modified_shard" is "{hour}#{shard}", the shard derived
+    from the store product URL)
+    """
+    shard = zlib.crc32(store_product_url.encode('utf-8')) % MODIFIED_SHARDS
+    return dict(
+        modified_at=modified_timestamp(modified_at),
+        modified_shard=f'{modified_bucket(modified_at)}#{shard:02d}',
+    )
+
+
+def modified_shards(since, until):
+    """
+    Get the "modified_shard" values of products modified between "since"
+    and "until"
+    """
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    hour = since.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    shards = []
+    while hour <= until:
+        bucket = modified_bucket(hour)
+        shards.extend(f'{bucket}#{shard:02d}' for shard in range(MODIFIED_SHARDS))
+        hour += timedelta(hours=1)
+    return shards
@@ -0,0 +1,211 @@
+"""
+Tracing and latency instrumentation
+
+API calls are wrapped in named spans (e.g. "update_store_product" and its
+stages "update_store_product.get_item", "update_store_product.validate",
+...). Spans are no-ops unless a tracer is installed with "set_tracer":
+
+    recorder = LatencyRecorder()
+    set_tracer(recorder)
+    ...
+    recorder.snapshot()
+
+A tracer is any object with a "span(name, attributes)" method returning a
+context manager. "OpenTelemetryTracer" adapts an OpenTelemetry tracer.
+"""
+import bisect
+import functools
+import threading
+import time
+
+
+# Histogram bucket upper bounds (milliseconds)
+HISTOGRAM_BUCKETS_MS = [
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+]
+
+
+class _NoopSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """
+    Install a tracer for all API calls (pass None to disable tracing)
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, **attributes):
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.span(name, attributes)
+
+
+def traced(name):
+    """
+    Decorator wrapping each call to a function in a span
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.bucket_counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def record(self, value_ms):
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+        self.bucket_counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value_ms)] += 1
+
+    def percentile(self, p):
+        """
+        Estimate a percentile (the upper bound of the bucket containing it)
+        """
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                if i < len(HISTOGRAM_BUCKETS_MS):
+                    return min(HISTOGRAM_BUCKETS_MS[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return dict(
+            count=self.count,
+            sum_ms=self.total,
+            min_ms=self.min,
+            max_ms=self.max,
+            mean_ms=self.total / self.count if self.count else None,
+            p50_ms=self.percentile(50),
+            p99_ms=self.percentile(99),
+            buckets=[
+                dict(le_ms=bound, count=count)
+                for bound, count in zip(HISTOGRAM_BUCKETS_MS + [None], self.bucket_counts)
+            ],
+        )
+
+
+class _TimedSpan:
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.record(self.name, 1000 * (time.perf_counter() - self.start))
+        return False
+
+
+class LatencyRecorder:
+    """
+    Tracer recording span latencies in histograms
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, attributes):
+        return _TimedSpan(self, name)
+
+    def record(self, name, value_ms):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(value_ms)
+
+    def snapshot(self):
+        """
+        Get latency histograms by span name (JSON serializable)
+        """
+        with self._lock:
+            return {
+                name: histogram.snapshot()
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+class _OpenTelemetrySpan:
+
+    def __init__(self, otel_span, timed_span):
+        self.otel_span = otel_span
+        self.timed_span = timed_span
+
+    def __enter__(self):
+        if self.timed_span is not None:
+            self.timed_span.__enter__()
+        return self.otel_span.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.otel_span.__exit__(exc_type, exc_value, traceback)
+        if self.timed_span is not None:
+            self.timed_span.__exit__(exc_type, exc_value, traceback)
+        return False
+
+
+class OpenTelemetryTracer:
+    """
+    Tracer creating OpenTelemetry spans
+
+        from opentelemetry import trace
+        set_tracer(OpenTelemetryTracer(trace.get_tracer('charm_product')))
+
+    Span latencies are also recorded in histograms when a "recorder" is given.
+    """
+
+    def __init__(self, tracer, recorder=None):
+        self.tracer = tracer
+        self.recorder = recorder
+
+    def span(self, name, attributes):
+        timed_span = None
+        if self.recorder is not None:
+            timed_span = self.recorder.span(name, attributes)
+        return _OpenTelemetrySpan(
+            self.tracer.start_as_current_span(name, attributes=attributes),
+            timed_span,
+        )
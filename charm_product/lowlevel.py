@@ -0,0 +1,438 @@
+"""
+Product reads on the low-level DynamoDB client
+
+The boto3 resource layer deserializes every attribute with
+"TypeDeserializer" (numbers as "Decimal"). These functions query with the
+low-level client and decode items with a deserializer specialised for the
+product schema ("validation.ITEM_ATTRIBUTES"), decoding only the requested
+attributes:
+
+    from charm_product import lowlevel
+    products = lowlevel.fetch_products_by_store(dynamodb, 'store.com')
+
+Numbers are decoded to int/float by default ("numbers='decimal'" keeps
+"Decimal" values, e.g. for exact prices). Local backends return python
+values, so their items are not deserialized.
+
+The client of a boto3 resource converts requests and responses to python
+types, so a separate client (with the resource client's credentials,
+region, endpoint and config) is created for each resource.
+"""
+import threading
+import weakref
+from decimal import Decimal
+
+from charm_product.batch import batch_get_items
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.compression import (
+    COMPRESSED_ATTRIBUTES,
+    decompress_attributes,
+    decompress_value,
+)
+from charm_product.indexes import projected_attributes
+from charm_product.instrument import span, traced
+from charm_product.ratelimit import rate_limited
+from charm_product.util import PRODUCT_UUID_BLACKLIST, clean_product_url, get_table_name
+from charm_product.validation import ITEM_ATTRIBUTES, price, string_list
+
+
+def _native_number(value):
+    if '.' in value or 'e' in value or 'E' in value:
+        return float(value)
+    return int(value)
+
+
+def _native_decimal(value):
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+NUMBER_DECODERS = {
+    'native': _native_number,
+    'decimal': Decimal,
+}
+
+
+def deserialize_value(value, decode_number=_native_number):
+    """
+    Decode any DynamoDB "AttributeValue"
+    """
+    (value_type, data), = value.items()
+    if value_type == 'S':
+        return data
+    if value_type == 'N':
+        return decode_number(data)
+    if value_type == 'BOOL':
+        return data
+    if value_type == 'NULL':
+        return None
+    if value_type == 'L':
+        return [deserialize_value(v, decode_number) for v in data]
+    if value_type == 'M':
+        return {k: deserialize_value(v, decode_number) for k, v in data.items()}
+    if value_type == 'B':
+        return bytes(data)
+    if value_type == 'SS':
+        return set(data)
+    if value_type == 'NS':
+        return {decode_number(v) for v in data}
+    if value_type == 'BS':
+        return {bytes(v) for v in data}
+    raise TypeError(f'Unsupported DynamoDB type: {value_type}')
+
+
+def _attribute_decoders(decode_number):
+    def string(value):
+        data = value.get('S')
+        return data if data is not None else deserialize_value(value, decode_number)
+
+    def number(value):
+        data = value.get('N')
+        return decode_number(data) if data is not None else deserialize_value(value, decode_number)
+
+    def strings(value):
+        data = value.get('L')
+        if data is not None and all('S' in v for v in data):
+            return [v['S'] for v in data]
+        return deserialize_value(value, decode_number)
+
+    def text(value):
+        if 'S' in value:
+            return value['S']
+        if 'B' in value:
+            return decompress_value(value['B'])
+        return deserialize_value(value, decode_number)
+
+    def boolean(value):
+        data = value.get('N')
+        return data != '0' if data is not None else deserialize_value(value, decode_number)
+
+    decoders = {'product_uuid': string, 'brand_domain': string}
+    for attr in ITEM_ATTRIBUTES:
+        if attr.name == 'is_available':
+            # stored as a "number" (required to allow indexing)
+            decoders[attr.name] = boolean
+        elif attr.type in (int, price):
+            decoders[attr.name] = number
+        elif attr.type is string_list:
+            decoders[attr.name] = strings
+        elif attr.name in COMPRESSED_ATTRIBUTES:
+            decoders[attr.name] = text
+        else:
+            decoders[attr.name] = string
+    return decoders
+
+
+_DECODERS = {
+    numbers: _attribute_decoders(decode_number)
+    for numbers, decode_number in NUMBER_DECODERS.items()
+}
+
+
+def attribute_decoder(name, numbers='native'):
+    """
+    Get a function decoding the low-level client value of a product attribute
+    """
+    decoder = _DECODERS[numbers].get(name)
+    if decoder is None:
+        decode_number = NUMBER_DECODERS[numbers]
+        return lambda value: deserialize_value(value, decode_number)
+    return decoder
+
+
+def make_product_deserializer(only_attributes=None, numbers='native'):
+    """
+    Get a function decoding low-level client product items (only decoding
+    "only_attributes" if given)
+    """
+    decoders = _DECODERS[numbers]
+    decode_number = NUMBER_DECODERS[numbers]
+    if only_attributes is not None:
+        only_attributes = frozenset(only_attributes)
+
+    def deserialize(item):
+        product = {}
+        for name, value in item.items():
+            if only_attributes is not None and name not in only_attributes:
+                continue
+            decoder = decoders.get(name)
+            if decoder is None:
+                product[name] = deserialize_value(value, decode_number)
+            else:
+                product[name] = decoder(value)
+        return product
+
+    return deserialize
+
+
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_client(dynamodb):
+    """
+    Get a low-level client for a DynamoDB resource (local backend clients are
+    returned as is)
+    """
+    from charm_product.session import credentials_session
+
+    resource_client = dynamodb.meta.client
+    if getattr(resource_client, 'native_types', False):
+        return resource_client
+
+    with _clients_lock:
+        client = _clients.get(resource_client)
+        if client is None:
+            session = credentials_session(resource_client._get_credentials())
+            client = _clients[resource_client] = session.client(
+                'dynamodb',
+                region_name=resource_client.meta.region_name,
+                endpoint_url=resource_client.meta.endpoint_url,
+                config=resource_client.meta.config,
+            )
+    return client
+
+
+def _native_product(item, only_attributes, numbers):
+    # local backend items (python values)
+    if 'is_available' in item:
+        item['is_available'] = bool(item['is_available'])
+    if only_attributes is not None:
+        item = {k: v for k, v in item.items() if k in only_attributes}
+    decompress_attributes(item)
+    if numbers == 'native':
+        item = {
+            k: _native_decimal(v) if isinstance(v, Decimal) else v
+            for k, v in item.items()
+        }
+    return item
+
+
+@traced('lowlevel.get_store_product')
+def get_store_product(dynamodb, product_url, only_attributes=None, numbers='native'):
+    client = get_client(dynamodb)
+    store_product_url = clean_product_url(product_url)
+    native_types = getattr(client, 'native_types', False)
+
+    response = rate_limited(client.get_item)(
+        TableName=get_table_name('product'),
+        Key={
+            'store_product_url': (
+                store_product_url if native_types else {'S': store_product_url}
+            ),
+        },
+        **capacity_kwargs()
+    )
+    record_consumed_capacity('get_store_product', response)
+    item = response.get('Item')
+    if item is None:
+        return None
+    if native_types:
+        return _native_product(item, only_attributes, numbers)
+    return make_product_deserializer(only_attributes, numbers)(item)
+
+
+def fetch_products_by_store(dynamodb, store_domain, is_available=True, **kwargs):
+    return _fetch_products(
+        dynamodb, 'store_domain_hash_idx', 'store_domain', store_domain, is_available,
+        operation='fetch_products_by_store', **kwargs
+    )
+
+
+def fetch_products_by_brand(dynamodb, brand_domain, is_available=True, **kwargs):
+    return _fetch_products(
+        dynamodb, 'brand_domain_list_idx', 'brand_domain', brand_domain, is_available,
+        operation='fetch_products_by_brand', **kwargs
+    )
+
+
+def fetch_products_by_product_uuid(dynamodb, product_uuid, is_available=True, **kwargs):
+    return _fetch_products(
+        dynamodb, 'product_uuid_list_idx', 'product_uuid', product_uuid, is_available,
+        operation='fetch_products_by_product_uuid', **kwargs
+    )
+
+
+def _projection(attributes, names):
+    # (one placeholder per attribute name)
+    placeholders = {name: placeholder for placeholder, name in names.items()}
+    for name in sorted(attributes):
+        if name not in placeholders:
+            placeholder = placeholders[name] = f'#p{len(names)}'
+            names[placeholder] = name
+    return ','.join(placeholders[name] for name in sorted(attributes))
+
+
+def _fetch_products(
+    dynamodb, index_name, hash_name, hash_value, is_available,
+    operation='fetch_products', limit=None, only_attributes=None,
+    consistent_read=False, numbers='native'
+):
+    native_types = getattr(get_client(dynamodb), 'native_types', False)
+    deserialize = make_product_deserializer(only_attributes, numbers)
+    for items in _fetch_product_pages(
+        dynamodb, index_name, hash_name, hash_value, is_available,
+        operation=operation, limit=limit, only_attributes=only_attributes,
+        consistent_read=consistent_read,
+    ):
+        for item in items:
+            if native_types:
+                yield _native_product(item, None, numbers)
+            else:
+                yield deserialize(item)
+
+
+def _fetch_product_pages(
+    dynamodb, index_name, hash_name, hash_value, is_available,
+    operation='fetch_products', limit=None, only_attributes=None,
+    consistent_read=False
+):
+    """
+    Query products page by page (lists of undecoded low-level client items,
+    or of python items for local backends)
+    """
+    client = get_client(dynamodb)
+
+    if getattr(client, 'native_types', False):
+        from boto3.dynamodb.conditions import Key
+        from charm_product import product
+
+        key_expr = Key(hash_name).eq(hash_value)
+        if is_available is not None:
+            key_expr = key_expr & Key('is_available').eq(int(is_available))
+        yield list(product._fetch_products(
+            dynamodb, index_name, key_expr, operation=operation, limit=limit,
+            only_attributes=only_attributes, consistent_read=consistent_read,
+        ))
+        return
+
+    key_expr = '#hash = :hash'
+    names = {'#hash': hash_name}
+    values = {':hash': {'S': hash_value}}
+    if is_available is not None:
+        key_expr += ' AND #is_available = :is_available'
+        names['#is_available'] = 'is_available'
+        values[':is_available'] = {'N': str(int(is_available))}
+    query_kwargs = {
+        'KeyConditionExpression': key_expr,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+    }
+
+    # Read keys from the index and items from the table unless the index
+    # projects all requested attributes (see "product._fetch_products")
+    hydrate = (
+        only_attributes is None or
+        consistent_read or
+        not set(only_attributes) <= projected_attributes(index_name)
+    )
+    if hydrate:
+        index_attributes = {'store_product_url', 'product_uuid'}
+    else:
+        # Always retrieve "product_uuid" so that blacklisted product UUIDs can
+        # be filtered from results
+        index_attributes = set(only_attributes) | {'product_uuid'}
+    query_kwargs['ProjectionExpression'] = _projection(index_attributes, names)
+
+    query = rate_limited(client.query)
+    table_name = get_table_name('product')
+
+    while True:
+        if limit is not None:
+            query_kwargs['Limit'] = limit
+        with span(f'lowlevel.{operation}.query_page', index_name=index_name):
+            results = query(
+                TableName=table_name,
+                IndexName=index_name,
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity(operation, results)
+
+        items = [
+            item for item in results['Items']
+            if item['product_uuid']['S'] not in PRODUCT_UUID_BLACKLIST
+        ]
+        if hydrate:
+            items = _hydrate_products(
+                client, items, operation, only_attributes, consistent_read
+            )
+        yield items
+
+        if limit is not None:
+            limit -= len(results['Items'])
+            if limit <= 0:
+                break
+
+        start_key = results.get('LastEvaluatedKey')
+        if start_key is None:
+            break
+        query_kwargs['ExclusiveStartKey'] = start_key
+
+
+def _scan_product_pages(dynamodb, only_attributes=None, segment=None, total_segments=None):
+    """
+    Scan the product table page by page (see "_fetch_product_pages")
+    """
+    client = get_client(dynamodb)
+
+    if getattr(client, 'native_types', False):
+        from charm_product import product
+
+        yield list(product.scan_products(
+            dynamodb, only_attributes=only_attributes,
+            segment=segment, total_segments=total_segments,
+        ))
+        return
+
+    scan_kwargs = {}
+    if only_attributes is not None:
+        names = {}
+        scan_kwargs['ProjectionExpression'] = _projection(
+            set(only_attributes) | {'product_uuid'}, names
+        )
+        scan_kwargs['ExpressionAttributeNames'] = names
+    if total_segments is not None:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+
+    scan = rate_limited(client.scan)
+    while True:
+        with span('lowlevel.scan_products.scan_page'):
+            results = scan(
+                TableName=get_table_name('product'),
+                **scan_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity('scan_products', results)
+        yield [
+            item for item in results['Items']
+            if item['product_uuid']['S'] not in PRODUCT_UUID_BLACKLIST
+        ]
+
+        start_key = results.get('LastEvaluatedKey')
+        if start_key is None:
+            break
+        scan_kwargs['ExclusiveStartKey'] = start_key
+
+
+def _hydrate_products(client, index_items, operation, only_attributes, consistent_read):
+    request = {'ConsistentRead': consistent_read}
+    if only_attributes is not None:
+        names = {}
+        request['ProjectionExpression'] = _projection(
+            set(only_attributes) | {'store_product_url'}, names
+        )
+        request['ExpressionAttributeNames'] = names
+
+    urls = [item['store_product_url']['S'] for item in index_items]
+    items = {
+        item['store_product_url']['S']: item
+        for item in batch_get_items(
+            client, get_table_name('product'),
+            [{'store_product_url': {'S': url}} for url in urls], operation, **request
+        )
+    }
+    # (in index order, skipping products deleted since the index was read)
+    return [items[url] for url in urls if url in items]
@@ -1,21 +1,37 @@
-import botocore
 import uuid
-from boto3.dynamodb.conditions import Key
-
+from datetime import datetime, timedelta, timezone
+
+from charm_product.batch import BatchWriter, batch_get_items
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.compression import compress_attributes, decompress_attributes
+from charm_product.counter import (
+    product_counter_changes,
+    product_counter_deltas,
+    product_counters_enabled,
+    update_product_counters,
+)
+from charm_product.indexes import (
+    MODIFIED_OVERLAP,
+    MODIFIED_SHARDS,
+    modified_keys,
+    modified_shards,
+    modified_timestamp,
+    projected_attributes,
+    top_rank,
+    top_rank_prefix,
+)
+from charm_product.instrument import span, traced
+from charm_product.ratelimit import rate_limited
+from charm_product.record import StoreProduct
 from charm_product.tag import ProductTag, set_product_tag, fetch_product_tags
 from charm_product.util import PRODUCT_UUID_BLACKLIST, clean_product_url, get_table_name
-from charm_product.validation import parse_store_product_data
-
+from charm_product.validation import content_hash, parse_store_product_data
 
-def add_store_product(
-    dynamodb,
-    product_url,
-    store_domain,
-    is_available=True,
-    **attrs
-):
-    product_table = dynamodb.Table(get_table_name('product'))
 
+def _new_product_item(product_url, store_domain, is_available, attrs):
+    """
+    Get the validated item of a new product (with a new product UUID)
+    """
     store_product_url = clean_product_url(product_url)
     item_data = dict(
         store_product_url=store_product_url,
@@ -27,7 +43,10 @@ def add_store_product(
         **attrs
     )
 
-    item_data = parse_store_product_data(item_data)
+    with span('add_store_product.validate'):
+        item_data = parse_store_product_data(item_data)
+        item_data['content_hash'] = content_hash(item_data)
+        item_data = compress_attributes(item_data)
 
     # Set "brand domain" if available for new products
     # (for existing products, this is set according to "product_uuid" by bulk
@@ -35,36 +54,86 @@ def add_store_product(
     if attrs.get('store_product_brand_domain'):
         item_data['brand_domain'] = attrs.get('store_product_brand_domain')
 
-    try:
-        # product does not yet exist in DB, assign a new product ID
-        item_data['product_uuid'] = uuid.uuid4().hex
+    # Sort key of the top products indexes
+    rank = top_rank(item_data['is_available'], item_data.get('best_selling_position'))
+    if rank is not None:
+        item_data['top_rank'] = rank
+    # Key of the modified products index
+    item_data.update(modified_keys(store_product_url, datetime.now(timezone.utc)))
+
+    # product does not yet exist in DB, assign a new product ID
+    item_data['product_uuid'] = uuid.uuid4().hex
+    return item_data
 
-        product_table.put_item(
-            Item=item_data,
-            ConditionExpression='attribute_not_exists(store_product_url)'
-        )
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
-            raise
-        else:
-            raise ValueError(f'Product with url "{store_product_url}" already exists')
 
+def _new_product_tags(dynamodb, tag_buffer, item_data):
+    """
+    Set the tags of a new product
+    """
     primary_image_url = None
     if item_data.get('image_urls'):
         primary_image_url = item_data['image_urls'][0]
 
-    # Tag this store product for requiring indexing if it has an image
-    if primary_image_url:
-        set_product_tag(
-            dynamodb,
-            store_product_url, ProductTag.image_not_indexed,
-            image_url=primary_image_url
+    with span('add_store_product.tags'):
+        # Tag this store product for requiring indexing if it has an image
+        if primary_image_url:
+            _set_product_tag(
+                dynamodb, tag_buffer,
+                item_data['store_product_url'], ProductTag.image_not_indexed,
+                image_url=primary_image_url
+            )
+        # Tag this store product for requiring metadata update
+        _set_product_tag(
+            dynamodb, tag_buffer, item_data['store_product_url'],
+            ProductTag.update_product_meta
         )
-    # Tag this store product for requiring metadata update
-    set_product_tag(dynamodb, store_product_url, ProductTag.update_product_meta)
 
 
-def update_store_product(dynamodb, product_url, **attrs):
+@traced('add_store_product')
+def add_store_product(
+    dynamodb,
+    product_url,
+    store_domain,
+    is_available=True,
+    tag_buffer=None,
+    **attrs
+):
+    from boto3.dynamodb.conditions import Attr
+
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    item_data = _new_product_item(product_url, store_domain, is_available, attrs)
+    store_product_url = item_data['store_product_url']
+
+    try:
+        with span('add_store_product.put_item'):
+            response = rate_limited(product_table.put_item)(
+                Item=item_data,
+                ConditionExpression=Attr('store_product_url').not_exists(),
+                **capacity_kwargs()
+            )
+        record_consumed_capacity('add_store_product', response, write=True)
+    except product_table.meta.client.exceptions.ConditionalCheckFailedException:
+        raise ValueError(f'Product with url "{store_product_url}" already exists')
+
+    if product_counters_enabled():
+        update_product_counters(
+            dynamodb, product_counter_deltas(item_data, 1), 'add_store_product'
+        )
+
+    _new_product_tags(dynamodb, tag_buffer, item_data)
+
+
+@traced('update_store_product')
+def update_store_product(dynamodb, product_url, tag_buffer=None, **attrs):
+    _update_store_product(dynamodb, product_url, tag_buffer, attrs)
+
+
+def _update_store_product(dynamodb, product_url, tag_buffer, attrs, scraped_hash=None):
+    """
+    Update a product ("scraped_hash" is stored as the content hash instead
+    of the hash of the updated item, see "sync.sync_store")
+    """
     product_table = dynamodb.Table(get_table_name('product'))
 
     store_product_url = clean_product_url(product_url)
@@ -77,9 +146,13 @@ def update_store_product(dynamodb, product_url, **attrs):
     image_not_indexed = False
     update_product_meta = False
 
-    old_item_data = product_table.get_item(
-        Key={'store_product_url': store_product_url},
-    ).get('Item')
+    with span('update_store_product.get_item'):
+        response = rate_limited(product_table.get_item)(
+            Key={'store_product_url': store_product_url},
+            **capacity_kwargs()
+        )
+    record_consumed_capacity('update_store_product', response)
+    old_item_data = response.get('Item')
 
     if not old_item_data:
         raise ValueError(f'Product with url "{store_product_url}" does not yet exist')
@@ -105,47 +178,128 @@ def update_store_product(dynamodb, product_url, **attrs):
     ):
         update_product_meta = True
 
-    item_data = parse_store_product_data(item_data, new_item=False)
+    with span('update_store_product.validate'):
+        item_data = parse_store_product_data(item_data, new_item=False)
+        if scraped_hash is not None:
+            item_data['content_hash'] = scraped_hash
+        else:
+            item_data['content_hash'] = content_hash(
+                {**decompress_attributes(dict(old_item_data)), **item_data}
+            )
+        item_data = compress_attributes(item_data)
+
+    # Keep the sort key of the top products indexes in sync
+    remove_attributes = []
+    if 'is_available' in item_data or 'best_selling_position' in item_data:
+        new_item_data = {**old_item_data, **item_data}
+        rank = top_rank(
+            new_item_data['is_available'], new_item_data.get('best_selling_position')
+        )
+        if rank is not None:
+            item_data['top_rank'] = rank
+        elif 'top_rank' in old_item_data:
+            remove_attributes.append('top_rank')
+    # (re-listed products are no longer removed)
+    if (
+        item_data.get('is_available') and 'removed_at' in old_item_data and
+        'removed_at' not in item_data
+    ):
+        remove_attributes.append('removed_at')
+    item_data.update(modified_keys(store_product_url, datetime.now(timezone.utc)))
 
     update_expression = 'SET {}'.format(', '.join([
         f'{attr} = :{attr}' for attr in item_data
     ]))
+    if remove_attributes:
+        update_expression += ' REMOVE {}'.format(', '.join(remove_attributes))
     expression_attribute_values = {
         f':{attr}': value for attr, value in item_data.items()
     }
-    product_table.update_item(
-        Key={'store_product_url': store_product_url},
-        UpdateExpression=update_expression,
-        ExpressionAttributeValues=expression_attribute_values
-    )
-
-    # flag image for feature extraction and indexing
-    if image_not_indexed:
-        set_product_tag(
-            dynamodb, store_product_url, ProductTag.image_not_indexed,
-            image_url=new_primary_image_url
+    update_counters = product_counters_enabled() and 'is_available' in item_data
+    update_kwargs = {}
+    if update_counters:
+        # (the availability before this update, for counters)
+        update_kwargs['ReturnValues'] = 'UPDATED_OLD'
+    with span('update_store_product.update_item'):
+        response = rate_limited(product_table.update_item)(
+            Key={'store_product_url': store_product_url},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_attribute_values,
+            **update_kwargs,
+            **capacity_kwargs()
         )
-
-    # flag product metadata to be updated (re-evaluate product "brand domain")
-    if update_product_meta:
-        set_product_tag(dynamodb, store_product_url, ProductTag.update_product_meta)
-
-
+    record_consumed_capacity('update_store_product', response, write=True)
+
+    if update_counters:
+        old_is_available = response.get('Attributes', {}).get('is_available')
+        if (
+            old_is_available is not None and
+            bool(old_is_available) != bool(item_data['is_available'])
+        ):
+            old_item = {**old_item_data, 'is_available': old_is_available}
+            update_product_counters(
+                dynamodb, product_counter_changes(old_item, {**old_item, **item_data}),
+                'update_store_product'
+            )
+
+    with span('update_store_product.tags'):
+        # flag image for feature extraction and indexing
+        if image_not_indexed:
+            _set_product_tag(
+                dynamodb, tag_buffer,
+                store_product_url, ProductTag.image_not_indexed,
+                image_url=new_primary_image_url
+            )
+
+        # flag product metadata to be updated (re-evaluate product "brand domain")
+        if update_product_meta:
+            _set_product_tag(
+                dynamodb, tag_buffer, store_product_url, ProductTag.update_product_meta
+            )
+
+
+def _set_product_tag(dynamodb, tag_buffer, store_product_url, product_tag, **attrs):
+    # Write tags through a buffer when provided (see "ProductTagBuffer")
+    if tag_buffer is not None:
+        tag_buffer.set_product_tag(store_product_url, product_tag, **attrs)
+    else:
+        set_product_tag(dynamodb, store_product_url, product_tag, **attrs)
+
+
+@traced('get_store_product')
 def get_store_product(dynamodb, product_url):
     product_table = dynamodb.Table(get_table_name('product'))
     store_product_url = clean_product_url(product_url)
-    return product_table.get_item(Key={'store_product_url': store_product_url}).get('Item')
-
-
-def delete_store_products(dynamodb, store_product_urls):
-    product_table = dynamodb.Table(get_table_name('product'))
-    tag_table = dynamodb.Table(get_table_name('product_tag'))
-
-    with product_table.batch_writer() as batch:
-        for sp_url in store_product_urls:
-            batch.delete_item(Key={'store_product_url': sp_url})
-
-    with tag_table.batch_writer() as batch:
+    response = rate_limited(product_table.get_item)(
+        Key={'store_product_url': store_product_url},
+        **capacity_kwargs()
+    )
+    record_consumed_capacity('get_store_product', response)
+    item = response.get('Item')
+    if item is not None:
+        decompress_attributes(item)
+    return item
+
+
+@traced('delete_store_products')
+def delete_store_products(dynamodb, store_product_urls, tag_buffer=None):
+    store_product_urls = list(store_product_urls)
+    if tag_buffer is not None:
+        tag_buffer.discard(store_product_urls)
+
+    if product_counters_enabled():
+        # delete items one at a time to count the items actually deleted
+        _delete_counted_store_products(dynamodb, store_product_urls)
+    else:
+        with BatchWriter(
+            dynamodb, get_table_name('product'), 'delete_store_products'
+        ) as batch:
+            for sp_url in store_product_urls:
+                batch.delete_item(Key={'store_product_url': sp_url})
+
+    with BatchWriter(
+        dynamodb, get_table_name('product_tag'), 'delete_store_products'
+    ) as batch:
         for tag in fetch_product_tags(dynamodb, store_product_urls):
             batch.delete_item(Key=dict(
                 store_product_url=tag['store_product_url'],
@@ -153,18 +307,37 @@ def delete_store_products(dynamodb, store_product_urls):
             ))
 
 
+def _delete_counted_store_products(dynamodb, store_product_urls):
+    product_table = dynamodb.Table(get_table_name('product'))
+    deltas = {}
+    for sp_url in store_product_urls:
+        response = rate_limited(product_table.delete_item)(
+            Key={'store_product_url': sp_url},
+            ReturnValues='ALL_OLD',
+            **capacity_kwargs()
+        )
+        record_consumed_capacity('delete_store_products', response, write=True)
+        if response.get('Attributes'):
+            for key, delta in product_counter_deltas(response['Attributes'], -1).items():
+                deltas[key] = deltas.get(key, 0) + delta
+    update_product_counters(dynamodb, deltas, 'delete_store_products')
+
+
 def fetch_products_by_store(
     dynamodb,
     store_domain,
     is_available=True,
     **kwargs,
 ):
+    from boto3.dynamodb.conditions import Key
+
     key_expr = Key('store_domain').eq(store_domain)
     if is_available is not None:
         key_expr = key_expr & Key('is_available').eq(int(is_available))
 
     return _fetch_products(
-        dynamodb, 'store_domain_idx', key_expr, **kwargs
+        dynamodb, 'store_domain_hash_idx', key_expr,
+        operation='fetch_products_by_store', **kwargs
     )
 
 
@@ -174,12 +347,15 @@ def fetch_products_by_brand(
     is_available=True,
     **kwargs,
 ):
+    from boto3.dynamodb.conditions import Key
+
     key_expr = Key('brand_domain').eq(brand_domain)
     if is_available is not None:
         key_expr = key_expr & Key('is_available').eq(int(is_available))
 
     return _fetch_products(
-        dynamodb, 'brand_domain_idx', key_expr, **kwargs
+        dynamodb, 'brand_domain_list_idx', key_expr,
+        operation='fetch_products_by_brand', **kwargs
     )
 
 
@@ -189,35 +365,180 @@ def fetch_products_by_product_uuid(
     is_available=True,
     **kwargs,
 ):
+    from boto3.dynamodb.conditions import Key
+
     key_expr = Key('product_uuid').eq(product_uuid)
     if is_available is not None:
         key_expr = key_expr & Key('is_available').eq(int(is_available))
 
     return _fetch_products(
-        dynamodb, 'product_uuid_idx', key_expr, **kwargs
+        dynamodb, 'product_uuid_list_idx', key_expr,
+        operation='fetch_products_by_product_uuid', **kwargs
+    )
+
+
+@traced('count_products_by_store')
+def count_products_by_store(dynamodb, store_domain, is_available=True):
+    """
+    Count the products of a store with a "COUNT" query of the store index
+    (see "counter.get_store_product_count" for maintained counts)
+    """
+    from boto3.dynamodb.conditions import Key
+
+    key_expr = Key('store_domain').eq(store_domain)
+    if is_available is not None:
+        key_expr = key_expr & Key('is_available').eq(int(is_available))
+
+    return _count_products(
+        dynamodb, 'store_domain_hash_idx', key_expr, operation='count_products_by_store'
+    )
+
+
+@traced('count_products_by_brand')
+def count_products_by_brand(dynamodb, brand_domain, is_available=True):
+    from boto3.dynamodb.conditions import Key
+
+    key_expr = Key('brand_domain').eq(brand_domain)
+    if is_available is not None:
+        key_expr = key_expr & Key('is_available').eq(int(is_available))
+
+    return _count_products(
+        dynamodb, 'brand_domain_list_idx', key_expr, operation='count_products_by_brand'
+    )
+
+
+def _count_products(dynamodb, index_name, key_expr, operation):
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    count = 0
+    query_kwargs = {}
+    while True:
+        with span(f'{operation}.query_page', index_name=index_name):
+            results = rate_limited(product_table.query)(
+                IndexName=index_name,
+                KeyConditionExpression=key_expr,
+                Select='COUNT',
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity(operation, results)
+        count += results['Count']
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        query_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+    return count
+
+
+def fetch_top_products_by_store(dynamodb, store_domain, n=10, is_available=True, **kwargs):
+    """
+    Get the "n" best selling products of a store (ordered by best selling
+    position). Products without a best selling position are not included.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    key_expr = (
+        Key('store_domain').eq(store_domain) &
+        Key('top_rank').begins_with(top_rank_prefix(is_available))
+    )
+    return _fetch_products(
+        dynamodb, 'store_top_idx', key_expr,
+        operation='fetch_top_products_by_store', limit=n, **kwargs
+    )
+
+
+def fetch_top_products_by_brand(dynamodb, brand_domain, n=10, is_available=True, **kwargs):
+    """
+    Get the "n" best selling products of a brand (ordered by best selling
+    position). Products without a best selling position are not included.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    key_expr = (
+        Key('brand_domain').eq(brand_domain) &
+        Key('top_rank').begins_with(top_rank_prefix(is_available))
+    )
+    return _fetch_products(
+        dynamodb, 'brand_top_idx', key_expr,
+        operation='fetch_top_products_by_brand', limit=n, **kwargs
     )
 
 
+def iter_products_changed_since(
+    dynamodb, since, until=None, overlap=MODIFIED_OVERLAP,
+    max_workers=MODIFIED_SHARDS, factory=None, **kwargs
+):
+    """
+    Get the products added or updated between "since" minus "overlap"
+    (inclusive) and "until" (exclusive, by default now), e.g. for
+    incremental exports (continue from the "until" of the previous run;
+    the overlap re-reads products whose index entries were written late,
+    so readers must handle products being returned again). The shards of
+    each hour are queried in parallel (see "session.parallel_map");
+    products are not ordered by modified time. Deleted products are not
+    included.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    from charm_product.session import parallel_map, parallel_resources
+
+    if until is None:
+        until = datetime.now(timezone.utc)
+    since = since - overlap
+    # ("between" is inclusive, timestamps have microsecond precision)
+    key_range = (
+        modified_timestamp(since), modified_timestamp(until - timedelta(microseconds=1))
+    )
+
+    def fetch_shard(dynamodb, shard):
+        key_expr = (
+            Key('modified_shard').eq(shard) &
+            Key('modified_at').between(*key_range)
+        )
+        return list(_fetch_products(
+            dynamodb, 'modified_idx', key_expr,
+            operation='iter_products_changed_since', **kwargs
+        ))
+
+    resources = parallel_resources(dynamodb, factory, max_workers)
+    shards = modified_shards(since, until)
+    for start in range(0, len(shards), max_workers):
+        results = parallel_map(
+            fetch_shard, shards[start:start + max_workers], max_workers=max_workers,
+            **resources
+        )
+        for products in results:
+            yield from products
+
+
 def _fetch_products(
-    dynamodb, index_name, key_expr,
-    limit=None, only_attributes=None, consistent_read=False
+    dynamodb, index_name, key_expr, operation='fetch_products',
+    limit=None, only_attributes=None, consistent_read=False, as_records=False
 ):
+    """
+    Query products from an index (yields "record.StoreProduct" records
+    instead of dicts if "as_records" is set)
+
+    Indexes only project "list view" attributes (see "indexes"). Unless all
+    of "only_attributes" are projected, product keys are read from the index
+    and items are read from the product table ("consistent_read" applies to
+    the product table reads).
+    """
     product_table = dynamodb.Table(get_table_name('product'))
 
-    projection_expression = None
-    if only_attributes is not None:
-        # Always retrieve "product_uuid" so that blacklisted product UUIDs can
-        # be filtered from results
-        if 'product_uuid' not in only_attributes:
-            fetch_attributes = list(only_attributes) + ['product_uuid']
-        else:
-            fetch_attributes = only_attributes
-        projection_expression = ','.join(fetch_attributes)
+    hydrate = (
+        only_attributes is None or
+        consistent_read or
+        not set(only_attributes) <= projected_attributes(index_name)
+    )
+    if hydrate:
+        projection_expression = 'store_product_url,product_uuid'
+    else:
+        projection_expression = _projection_expression(only_attributes)
 
     start_key = None
     while True:
         query_kwargs = {}
-        query_kwargs['ConsistentRead'] = consistent_read
         if start_key is not None:
             query_kwargs['ExclusiveStartKey'] = start_key
         if projection_expression is not None:
@@ -228,25 +549,21 @@ def _fetch_products(
             # https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Query.html#Query.Limit
             query_kwargs['Limit'] = limit
 
-        results = product_table.query(
-            IndexName=index_name,
-            KeyConditionExpression=key_expr,
-            **query_kwargs
-        )
-        for item in results['Items']:
-            # stored as a "number" in DynamoDB
-            # (required to allow indexing)
-            if 'is_available' in item:
-                item['is_available'] = bool(item['is_available'])
-
-            if item['product_uuid'] not in PRODUCT_UUID_BLACKLIST:
-                if (
-                    only_attributes is not None and
-                    'product_uuid' not in only_attributes
-                ):
-                    # Do not include product UUID in results if not requested
-                    del item['product_uuid']
-                yield item
+        with span(f'{operation}.query_page', index_name=index_name):
+            results = rate_limited(product_table.query)(
+                IndexName=index_name,
+                KeyConditionExpression=key_expr,
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity(operation, results)
+
+        items = results['Items']
+        if hydrate:
+            items = _hydrate_products(
+                dynamodb, items, operation, only_attributes, consistent_read
+            )
+        yield from _product_results(items, only_attributes, as_records)
 
         if limit is not None:
             limit -= len(results['Items'])
@@ -256,3 +573,103 @@ def _fetch_products(
         start_key = results.get('LastEvaluatedKey')
         if start_key is None:
             break
+
+
+def _hydrate_products(dynamodb, index_items, operation, only_attributes, consistent_read):
+    """
+    Read the product table items for index items (in index order)
+    """
+    urls = [
+        item['store_product_url'] for item in index_items
+        if item['product_uuid'] not in PRODUCT_UUID_BLACKLIST
+    ]
+
+    request = {'ConsistentRead': consistent_read}
+    if only_attributes is not None:
+        request['ProjectionExpression'] = _projection_expression(
+            set(only_attributes) | {'store_product_url'}
+        )
+    items = {
+        item['store_product_url']: item
+        for item in batch_get_items(
+            dynamodb, get_table_name('product'),
+            [{'store_product_url': url} for url in urls], operation, **request
+        )
+    }
+
+    hydrated = []
+    for url in urls:
+        item = items.get(url)
+        if item is None:
+            # deleted since the index was read
+            continue
+        if only_attributes is not None and 'store_product_url' not in only_attributes:
+            del item['store_product_url']
+        hydrated.append(item)
+    return hydrated
+
+
+def scan_products(
+    dynamodb, only_attributes=None, segment=None, total_segments=None,
+    as_records=False
+):
+    """
+    Scan all products in the product table (for exports). Scans may be run
+    in parallel by giving each worker a "segment" of "total_segments".
+    """
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    scan_kwargs = {}
+    projection_expression = _projection_expression(only_attributes)
+    if projection_expression is not None:
+        scan_kwargs['ProjectionExpression'] = projection_expression
+    if total_segments is not None:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+
+    while True:
+        with span('scan_products.scan_page'):
+            results = rate_limited(product_table.scan)(
+                **scan_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity('scan_products', results)
+        yield from _product_results(results['Items'], only_attributes, as_records)
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        scan_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+
+def _projection_expression(only_attributes):
+    if only_attributes is None:
+        return None
+    # Always retrieve "product_uuid" so that blacklisted product UUIDs can
+    # be filtered from results
+    if 'product_uuid' not in only_attributes:
+        fetch_attributes = list(only_attributes) + ['product_uuid']
+    else:
+        fetch_attributes = only_attributes
+    return ','.join(fetch_attributes)
+
+
+def _product_results(items, only_attributes, as_records):
+    for item in items:
+        # stored as a "number" in DynamoDB
+        # (required to allow indexing)
+        if 'is_available' in item:
+            item['is_available'] = bool(item['is_available'])
+
+        if item['product_uuid'] not in PRODUCT_UUID_BLACKLIST:
+            if (
+                only_attributes is not None and
+                'product_uuid' not in only_attributes
+            ):
+                # Do not include product UUID in results if not requested
+                del item['product_uuid']
+            if as_records:
+                # (compressed attributes are decompressed on access)
+                item = StoreProduct.from_item(item)
+            else:
+                decompress_attributes(item)
+            yield item
@@ -0,0 +1,135 @@
+"""
+Adaptive rate limiting for DynamoDB requests
+
+Product and tag requests (queries, scans, item requests and batch writes)
+go through "rate_limited". When a rate limiter is installed with "set_rate_limiter",
+requests are paced by a token bucket whose rate is adjusted with AIMD:
+throttling errors and unprocessed batch items cut the rate, successful
+requests ramp it back up. Throttling errors are retried with exponential
+backoff whether or not a rate limiter is installed.
+"""
+import functools
+import threading
+import time
+
+
+THROTTLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+}
+THROTTLE_RETRY_ATTEMPTS = 8
+THROTTLE_RETRY_DELAY = 0.05
+THROTTLE_MAX_RETRY_DELAY = 5
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket with an additive increase / multiplicative decrease rate
+    (in request units per second)
+    """
+
+    def __init__(
+        self,
+        rate=100.0,
+        min_rate=1.0,
+        max_rate=10000.0,
+        increase=1.0,
+        decrease_factor=0.5,
+    ):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.throttle_count = 0
+        # allow up to 1 second of bursting
+        self._tokens = self.rate
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units=1):
+        """
+        Take "units" tokens from the bucket, sleeping until they are available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._updated_at) * self.rate
+            ) - units
+            self._updated_at = now
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0)
+
+
+_rate_limiter = None
+
+
+def set_rate_limiter(rate_limiter):
+    """
+    Install a process-wide rate limiter (pass None to disable pacing)
+    """
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def record_throttle():
+    """
+    Report throttling not surfaced as an error (e.g. unprocessed batch items)
+    """
+    if _rate_limiter is not None:
+        _rate_limiter.on_throttle()
+
+
+def is_throttling_error(error):
+    # (botocore "ClientError" and local backend errors have a "response")
+    response = getattr(error, 'response', None)
+    return (
+        isinstance(response, dict) and
+        response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+    )
+
+
+def rate_limited(func, units=1):
+    """
+    Wrap a DynamoDB call to be paced by the rate limiter and retried on
+    throttling errors
+
+        response = rate_limited(table.put_item)(Item=item)
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        delay = THROTTLE_RETRY_DELAY
+        for attempt in range(THROTTLE_RETRY_ATTEMPTS):
+            rate_limiter = _rate_limiter
+            if rate_limiter is not None:
+                rate_limiter.acquire(units)
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == THROTTLE_RETRY_ATTEMPTS - 1:
+                    raise
+                if rate_limiter is not None:
+                    rate_limiter.on_throttle()
+                time.sleep(delay)
+                delay = min(delay * 2, THROTTLE_MAX_RETRY_DELAY)
+                continue
+            if rate_limiter is not None:
+                rate_limiter.on_success()
+            return response
+    return wrapper
@@ -0,0 +1,168 @@
+"""
+Compact record type for large product result sets
+
+"StoreProduct" stores product attributes in "__slots__" (derived from
+"validation.ITEM_ATTRIBUTES") instead of a dict per item. Low-cardinality
+strings (domains, currencies, ...) are interned so that products share a
+single copy, and the heavy "description" / "json_data" attributes are kept
+as UTF-8 (or compressed) bytes and decoded on access.
+
+Records also support dict-style access ("product['title']",
+"product.get('title')") in addition to attribute access.
+"""
+import sys
+from decimal import Decimal
+
+from charm_product.compression import CompressedValue, is_compressed
+from charm_product.validation import ITEM_ATTRIBUTES
+
+
+# Attributes managed by the API (not validated input)
+MANAGED_ATTRIBUTES = (
+    'product_uuid', 'brand_domain', 'top_rank', 'content_hash', 'modified_at', 'modified_shard',
+)
+
+RECORD_ATTRIBUTES = MANAGED_ATTRIBUTES + tuple(attr.name for attr in ITEM_ATTRIBUTES)
+
+INTERNED_ATTRIBUTES = frozenset([
+    'store_domain',
+    'brand_domain',
+    'store_product_brand_domain',
+    'store_product_brand_domain_association',
+    'primary_currency',
+    'store_platform',
+    'scraper_type',
+    'product_type',
+    'vendor_name',
+])
+
+LAZY_ATTRIBUTES = frozenset(['description', 'json_data'])
+
+INT_ATTRIBUTES = frozenset(['best_selling_position'])
+
+# Record attribute name -> slot (lazy attributes are stored encoded)
+RECORD_SLOTS = {
+    name: f'_{name}' if name in LAZY_ATTRIBUTES else name
+    for name in RECORD_ATTRIBUTES
+}
+
+
+class StoreProduct:
+    __slots__ = tuple(RECORD_SLOTS.values()) + ('_extra',)
+
+    def __init__(self, **attrs):
+        self._extra = None
+        for name, value in attrs.items():
+            self._set(name, value)
+
+    @classmethod
+    def from_item(cls, item):
+        """
+        Create a record from a DynamoDB product item
+        """
+        return cls(**item)
+
+    def _set(self, name, value):
+        if name in LAZY_ATTRIBUTES:
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            elif is_compressed(value):
+                value = CompressedValue(bytes(getattr(value, 'value', value)))
+            setattr(self, f'_{name}', value)
+        elif name in RECORD_ATTRIBUTES:
+            if name == 'is_available':
+                value = bool(value)
+            elif name in INT_ATTRIBUTES and isinstance(value, Decimal):
+                value = int(value)
+            elif name in INTERNED_ATTRIBUTES and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, name, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[name] = value
+
+    def __getattr__(self, name):
+        # only called for attributes which are not set
+        extra = object.__getattribute__(self, '_extra')
+        if extra is not None and name in extra:
+            return extra[name]
+        if name in RECORD_ATTRIBUTES:
+            return None
+        raise AttributeError(name)
+
+    def _has_slot(self, slot):
+        try:
+            object.__getattribute__(self, slot)
+        except AttributeError:
+            return False
+        return True
+
+    def keys(self):
+        keys = [name for name, slot in RECORD_SLOTS.items() if self._has_slot(slot)]
+        if self._extra is not None:
+            keys.extend(self._extra)
+        return keys
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        slot = RECORD_SLOTS.get(name)
+        if slot is not None:
+            return self._has_slot(slot)
+        return self._extra is not None and name in self._extra
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self else default
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __eq__(self, other):
+        if not isinstance(other, StoreProduct):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return (
+            f'StoreProduct(store_product_url={self.store_product_url!r}, '
+            f'title={self.title!r})'
+        )
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._extra = None
+        for name, value in state.items():
+            self._set(name, value)
+
+
+def _lazy_attribute(name):
+    slot = f'_{name}'
+
+    def get(self):
+        try:
+            value = object.__getattribute__(self, slot)
+        except AttributeError:
+            return None
+        if isinstance(value, CompressedValue):
+            return value.decompress()
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    return property(get)
+
+
+for _name in LAZY_ATTRIBUTES:
+    setattr(StoreProduct, _name, _lazy_attribute(_name))
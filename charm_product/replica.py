@@ -0,0 +1,176 @@
+"""
+Local read replica of the product table
+
+"ProductReplica" copies products into a local backend (see
+"charm_product.backends") and keeps it current from the modified products
+index, for read-heavy services. The replica has the same table and indexes
+as DynamoDB, so the "charm_product.product" read API works unchanged:
+
+    replica = ProductReplica(SQLiteDynamoDB('replica.db'))
+    replica.bootstrap(dynamodb)  # parallel scan
+    ...
+    replica.sync(dynamodb)  # products changed since the last sync
+    replica.get_store_product('https://store.com/product')
+    replica.fetch_products_by_store('store.com')
+
+Deleted products are not reported by the modified products index; bootstrap
+again (which removes products missing from the scan) to drop them.
+"""
+import importlib
+import os
+from datetime import datetime, timezone
+
+from charm_product import product
+from charm_product.indexes import MODIFIED_OVERLAP, modified_timestamp
+from charm_product.util import get_table_name
+
+
+# Syncs re-read products modified this long before the previous sync (index
+# entries are eventually consistent, and writers' clocks may differ)
+SYNC_OVERLAP = MODIFIED_OVERLAP
+
+DEFAULT_SCAN_SEGMENTS = 16
+
+
+def _migrate(local_dynamodb):
+    schema_dir = os.path.join(os.path.dirname(__file__), 'schema')
+    for filename in sorted(os.listdir(schema_dir)):
+        if filename.startswith('migrate_') and filename.endswith('.py'):
+            module = importlib.import_module(f'charm_product.schema.{filename[:-3]}')
+            module.migrate(local_dynamodb)
+
+
+def _replica_item(item):
+    # (results of the product read API have "is_available" as a bool, the
+    # indexes need the stored number)
+    item['is_available'] = int(item['is_available'])
+    return item
+
+
+class ProductReplica:
+    """
+    Product table replica in a local backend (e.g. "SQLiteDynamoDB")
+    """
+
+    def __init__(self, local_dynamodb):
+        self.dynamodb = local_dynamodb
+        client = local_dynamodb.meta.client
+        if get_table_name('product') not in client.list_tables()['TableNames']:
+            _migrate(local_dynamodb)
+        if get_table_name('replica_state') not in client.list_tables()['TableNames']:
+            client.create_table(
+                TableName=get_table_name('replica_state'),
+                AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}],
+                KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}],
+                BillingMode='PAY_PER_REQUEST',
+            )
+        self._product_table = local_dynamodb.Table(get_table_name('product'))
+        self._state_table = local_dynamodb.Table(get_table_name('replica_state'))
+
+    @property
+    def synced_until(self):
+        """
+        The time up to which products have been replicated (None before the
+        first bootstrap)
+        """
+        item = self._state_table.get_item(Key={'name': 'synced_until'}).get('Item')
+        if item is None:
+            return None
+        return datetime.fromisoformat(item['value'])
+
+    def _set_synced_until(self, dt):
+        self._state_table.put_item(
+            Item={'name': 'synced_until', 'value': modified_timestamp(dt)}
+        )
+
+    def bootstrap(
+        self, dynamodb, total_segments=DEFAULT_SCAN_SEGMENTS,
+        max_workers=DEFAULT_SCAN_SEGMENTS, factory=None,
+    ):
+        """
+        Copy all products with a parallel scan of the product table (in
+        "total_segments" segments, see "session.parallel_map"). Local
+        products missing from the scan are removed. Returns dict(copied,
+        removed).
+        """
+        from charm_product.session import parallel_map, parallel_resources
+
+        started_at = datetime.now(timezone.utc)
+
+        def copy_segment(dynamodb, segment):
+            urls = []
+            with self._product_table.batch_writer() as batch:
+                for item in product.scan_products(
+                    dynamodb, segment=segment, total_segments=total_segments
+                ):
+                    batch.put_item(Item=_replica_item(item))
+                    urls.append(item['store_product_url'])
+            return urls
+
+        copied = set()
+        for urls in parallel_map(
+            copy_segment, range(total_segments), max_workers=max_workers,
+            **parallel_resources(dynamodb, factory, max_workers)
+        ):
+            copied.update(urls)
+
+        removed = [
+            item['store_product_url']
+            for item in product.scan_products(self.dynamodb, only_attributes=['store_product_url'])
+            if item['store_product_url'] not in copied
+        ]
+        with self._product_table.batch_writer() as batch:
+            for url in removed:
+                batch.delete_item(Key={'store_product_url': url})
+
+        self._set_synced_until(started_at)
+        return dict(copied=len(copied), removed=len(removed))
+
+    def sync(self, dynamodb, max_workers=None, factory=None):
+        """
+        Copy the products modified since the last sync (see
+        "product.iter_products_changed_since"). Returns dict(copied).
+        """
+        synced_until = self.synced_until
+        if synced_until is None:
+            raise ValueError('Replica must be bootstrapped before syncing')
+
+        until = datetime.now(timezone.utc)
+        kwargs = {}
+        if max_workers is not None:
+            kwargs['max_workers'] = max_workers
+        copied = 0
+        with self._product_table.batch_writer() as batch:
+            for item in product.iter_products_changed_since(
+                dynamodb, synced_until, until, overlap=SYNC_OVERLAP, factory=factory,
+                **kwargs
+            ):
+                batch.put_item(Item=_replica_item(item))
+                copied += 1
+
+        self._set_synced_until(until)
+        return dict(copied=copied)
+
+    def get_store_product(self, product_url):
+        return product.get_store_product(self.dynamodb, product_url)
+
+    def fetch_products_by_store(self, store_domain, **kwargs):
+        return product.fetch_products_by_store(self.dynamodb, store_domain, **kwargs)
+
+    def fetch_products_by_brand(self, brand_domain, **kwargs):
+        return product.fetch_products_by_brand(self.dynamodb, brand_domain, **kwargs)
+
+    def fetch_products_by_product_uuid(self, product_uuid, **kwargs):
+        return product.fetch_products_by_product_uuid(self.dynamodb, product_uuid, **kwargs)
+
+    def fetch_top_products_by_store(self, store_domain, **kwargs):
+        return product.fetch_top_products_by_store(self.dynamodb, store_domain, **kwargs)
+
+    def fetch_top_products_by_brand(self, brand_domain, **kwargs):
+        return product.fetch_top_products_by_brand(self.dynamodb, brand_domain, **kwargs)
+
+    def count_products_by_store(self, store_domain, **kwargs):
+        return product.count_products_by_store(self.dynamodb, store_domain, **kwargs)
+
+    def count_products_by_brand(self, brand_domain, **kwargs):
+        return product.count_products_by_brand(self.dynamodb, brand_domain, **kwargs)
@@ -3,8 +3,10 @@ import boto3
 from charm_product.util import get_table_name
 
 
-def migrate():
-    client = boto3.client('dynamodb')
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
 
     client.create_table(
         TableName=get_table_name('product'),
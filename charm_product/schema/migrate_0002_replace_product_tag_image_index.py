@@ -8,8 +8,10 @@ RETRY_ATTEMPTS = 10
 RETRY_DELAY = 3
 
 
-def migrate():
-    client = boto3.client('dynamodb')
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
 
     def boto_do_retry(f):
         """
@@ -0,0 +1,112 @@
+import boto3
+import time
+import zlib
+from boto3.dynamodb.conditions import Attr
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Work queue shards per tag when this migration was written (the shard key
+# is computed here rather than by "charm_product.tag", so that changes to the
+# live sharding do not change what this migration writes)
+TAG_QUEUE_SHARDS = 16
+
+
+def tag_shard_key(tag, store_product_url):
+    shard = zlib.crc32(store_product_url.encode('utf-8')) % TAG_QUEUE_SHARDS
+    return f'{tag}#{shard}'
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    # Sparse "work queue" index over product tags
+    # (partitioned by "{tag}#{shard}" so that all products with a given tag can
+    # be retrieved without scanning the tag table)
+    boto_do_retry(lambda: client.update_table(
+        TableName=get_table_name('product_tag'),
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'tag_shard',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'store_product_url',
+                'AttributeType': 'S'
+            },
+        ],
+        GlobalSecondaryIndexUpdates=[
+            {
+                'Create': {
+                    'IndexName': 'tag_queue_idx',
+                    'KeySchema': [
+                        {
+                            'AttributeName': 'tag_shard',
+                            'KeyType': 'HASH'
+                        },
+                        {
+                            'AttributeName': 'store_product_url',
+                            'KeyType': 'RANGE'
+                        },
+                    ],
+                    'Projection': {
+                        'ProjectionType': 'ALL',
+                    },
+                },
+            },
+        ],
+    ))
+
+    # Backfill the shard key for existing tags
+    tag_table = dynamodb.Table(get_table_name('product_tag'))
+    scan_kwargs = {}
+    while True:
+        results = tag_table.scan(**scan_kwargs)
+        for item in results['Items']:
+            if 'tag_shard' in item:
+                continue
+            try:
+                tag_table.update_item(
+                    Key={
+                        'store_product_url': item['store_product_url'],
+                        'tag': item['tag'],
+                    },
+                    UpdateExpression='SET tag_shard = :tag_shard',
+                    ConditionExpression=Attr('store_product_url').exists(),
+                    ExpressionAttributeValues={
+                        ':tag_shard': tag_shard_key(item['tag'], item['store_product_url']),
+                    },
+                )
+            except client.exceptions.ConditionalCheckFailedException:
+                # tag deleted since scan
+                pass
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        scan_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,130 @@
+import boto3
+import time
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Delay between checks of the status of indexes being created
+WAIT_DELAY = 20
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    def wait_for_indexes(table_name):
+        """
+        Wait until a table and all of its indexes are active (DynamoDB
+        creates or deletes one index of a table at a time, and backfilling
+        an index of a large table can take hours)
+        """
+        while True:
+            table = client.describe_table(TableName=table_name)['Table']
+            if table['TableStatus'] == 'ACTIVE' and all(
+                index['IndexStatus'] == 'ACTIVE'
+                for index in table.get('GlobalSecondaryIndexes', [])
+            ):
+                return
+            time.sleep(WAIT_DELAY)
+
+    def create_index(table_name, index_name, key_schema, attribute_types, non_key_attributes):
+        wait_for_indexes(table_name)
+        boto_do_retry(lambda: client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {
+                    'AttributeName': name,
+                    'AttributeType': attribute_types[name],
+                }
+                for name, _ in key_schema
+            ],
+            GlobalSecondaryIndexUpdates=[
+                {
+                    'Create': {
+                        'IndexName': index_name,
+                        'KeySchema': [
+                            {
+                                'AttributeName': name,
+                                'KeyType': key_type,
+                            }
+                            for name, key_type in key_schema
+                        ],
+                        'Projection': {
+                            'ProjectionType': 'INCLUDE',
+                            'NonKeyAttributes': non_key_attributes,
+                        },
+                    },
+                },
+            ],
+        ))
+        wait_for_indexes(table_name)
+
+    # Create "list view" indexes to replace the "ALL" projected product
+    # indexes (product writes no longer copy full items into each index).
+    # The old indexes stay readable while the new ones are backfilled, and
+    # are deleted by migration 0011 once reads use the new indexes.
+    list_view_attributes = [
+        'product_uuid',
+        'store_domain',
+        'brand_domain',
+        'full_store_product_url',
+        'title',
+        'image_urls',
+        'product_type',
+        'primary_currency',
+        'primary_price',
+        'best_selling_position',
+        'vendor_name',
+        'store_product_brand_domain',
+        'store_platform',
+        'published_at',
+        'last_scraped_at',
+    ]
+    for index_name, hash_key in [
+        ('product_uuid_list_idx', 'product_uuid'),
+        ('brand_domain_list_idx', 'brand_domain'),
+        ('store_domain_list_idx', 'store_domain'),
+    ]:
+        create_index(
+            get_table_name('product'),
+            index_name,
+            [(hash_key, 'HASH'), ('is_available', 'RANGE')],
+            {hash_key: 'S', 'is_available': 'N'},
+            [name for name in list_view_attributes if name != hash_key],
+        )
+
+    # Product tag indexes only need the image URL (tag attributes such as
+    # leases are read from the tag table)
+    for tag in ['image_not_indexed', 'update_product_meta']:
+        create_index(
+            get_table_name('product_tag'),
+            f'{tag}_list_idx',
+            [('store_product_url', 'HASH'), (tag, 'RANGE')],
+            {'store_product_url': 'S', tag: 'N'},
+            ['image_url'],
+        )
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,152 @@
+import boto3
+import time
+from boto3.dynamodb.conditions import Attr
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Delay between checks of the status of indexes being created
+WAIT_DELAY = 20
+
+
+def top_rank(is_available, best_selling_position):
+    # (as "indexes.top_rank" when this migration was written)
+    if best_selling_position is None or best_selling_position < 0:
+        return None
+    return f'{int(is_available)}#{int(best_selling_position):010d}'
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    def wait_for_indexes(table_name):
+        """
+        Wait until a table and all of its indexes are active (DynamoDB
+        creates or deletes one index of a table at a time, and backfilling
+        an index of a large table can take hours)
+        """
+        while True:
+            table = client.describe_table(TableName=table_name)['Table']
+            if table['TableStatus'] == 'ACTIVE' and all(
+                index['IndexStatus'] == 'ACTIVE'
+                for index in table.get('GlobalSecondaryIndexes', [])
+            ):
+                return
+            time.sleep(WAIT_DELAY)
+
+    # Sparse "top products" indexes sorted by "{is_available}#{best_selling_position}"
+    # (best sellers are retrieved without paging through a whole store/brand)
+    list_view_attributes = [
+        'product_uuid',
+        'store_domain',
+        'brand_domain',
+        'full_store_product_url',
+        'title',
+        'image_urls',
+        'product_type',
+        'primary_currency',
+        'primary_price',
+        'best_selling_position',
+        'vendor_name',
+        'store_product_brand_domain',
+        'store_platform',
+        'published_at',
+        'last_scraped_at',
+    ]
+    for index_name, hash_key, range_key in [
+        ('store_top_idx', 'store_domain', 'top_rank'),
+        ('brand_top_idx', 'brand_domain', 'top_rank'),
+    ]:
+        wait_for_indexes(get_table_name('product'))
+        boto_do_retry(lambda: client.update_table(
+            TableName=get_table_name('product'),
+            AttributeDefinitions=[
+                {
+                    'AttributeName': hash_key,
+                    'AttributeType': 'S'
+                },
+                {
+                    'AttributeName': range_key,
+                    'AttributeType': 'S'
+                },
+            ],
+            GlobalSecondaryIndexUpdates=[
+                {
+                    'Create': {
+                        'IndexName': index_name,
+                        'KeySchema': [
+                            {
+                                'AttributeName': hash_key,
+                                'KeyType': 'HASH'
+                            },
+                            {
+                                'AttributeName': range_key,
+                                'KeyType': 'RANGE'
+                            },
+                        ],
+                        'Projection': {
+                            'ProjectionType': 'INCLUDE',
+                            'NonKeyAttributes': [
+                                name for name in list_view_attributes if name != hash_key
+                            ],
+                        },
+                    },
+                },
+            ],
+        ))
+    wait_for_indexes(get_table_name('product'))
+
+    # Backfill the rank of existing products
+    product_table = dynamodb.Table(get_table_name('product'))
+    scan_kwargs = {
+        'FilterExpression': Attr('best_selling_position').exists(),
+    }
+    while True:
+        results = product_table.scan(**scan_kwargs)
+        for item in results['Items']:
+            rank = top_rank(item['is_available'], item['best_selling_position'])
+            if rank is None or item.get('top_rank') == rank:
+                continue
+            try:
+                product_table.update_item(
+                    Key={'store_product_url': item['store_product_url']},
+                    UpdateExpression='SET top_rank = :top_rank',
+                    # do not overwrite ranks of products updated since the scan
+                    ConditionExpression=(
+                        Attr('is_available').eq(item['is_available']) &
+                        Attr('best_selling_position').eq(item['best_selling_position'])
+                    ),
+                    ExpressionAttributeValues={':top_rank': rank},
+                )
+            except client.exceptions.ConditionalCheckFailedException:
+                pass
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        scan_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+
+if __name__ == '__main__':
+    migrate()
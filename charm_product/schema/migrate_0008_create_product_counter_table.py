@@ -0,0 +1,32 @@
+import boto3
+
+from charm_product.util import get_table_name
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    # Product counts per store/brand (see "charm_product.counter")
+    client.create_table(
+        TableName=get_table_name('product_counter'),
+        AttributeDefinitions=[
+            # "store#{store_domain}" or "brand#{brand_domain}"
+            {
+                'AttributeName': 'counter_key',
+                'AttributeType': 'S'
+            },
+        ],
+        KeySchema=[
+            {
+                'AttributeName': 'counter_key',
+                'KeyType': 'HASH'
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST',
+    )
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,114 @@
+import boto3
+import time
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Delay between checks of the status of indexes being created
+WAIT_DELAY = 20
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    def wait_for_indexes(table_name):
+        """
+        Wait until a table and all of its indexes are active (DynamoDB
+        creates or deletes one index of a table at a time, and backfilling
+        an index of a large table can take hours)
+        """
+        while True:
+            table = client.describe_table(TableName=table_name)['Table']
+            if table['TableStatus'] == 'ACTIVE' and all(
+                index['IndexStatus'] == 'ACTIVE'
+                for index in table.get('GlobalSecondaryIndexes', [])
+            ):
+                return
+            time.sleep(WAIT_DELAY)
+
+    def create_index(table_name, index_name, key_schema, attribute_types, non_key_attributes):
+        wait_for_indexes(table_name)
+        boto_do_retry(lambda: client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {
+                    'AttributeName': name,
+                    'AttributeType': attribute_types[name],
+                }
+                for name, _ in key_schema
+            ],
+            GlobalSecondaryIndexUpdates=[
+                {
+                    'Create': {
+                        'IndexName': index_name,
+                        'KeySchema': [
+                            {
+                                'AttributeName': name,
+                                'KeyType': key_type,
+                            }
+                            for name, key_type in key_schema
+                        ],
+                        'Projection': {
+                            'ProjectionType': 'INCLUDE',
+                            'NonKeyAttributes': non_key_attributes,
+                        },
+                    },
+                },
+            ],
+        ))
+        wait_for_indexes(table_name)
+
+    # Create a store index with "content_hash" projected to replace the store
+    # list view index (changed products are detected by "sync.sync_store"
+    # without reading full items). Products without a content hash are
+    # treated as changed by the next sync. The replaced index is deleted by
+    # migration 0011 once reads use the new index.
+    create_index(
+        get_table_name('product'),
+        'store_domain_hash_idx',
+        [('store_domain', 'HASH'), ('is_available', 'RANGE')],
+        {'store_domain': 'S', 'is_available': 'N'},
+        [
+            'product_uuid',
+            'brand_domain',
+            'full_store_product_url',
+            'title',
+            'image_urls',
+            'product_type',
+            'primary_currency',
+            'primary_price',
+            'best_selling_position',
+            'vendor_name',
+            'store_product_brand_domain',
+            'store_platform',
+            'published_at',
+            'last_scraped_at',
+            'content_hash',
+        ],
+    )
+
+
+if __name__ == '__main__':
+    migrate()
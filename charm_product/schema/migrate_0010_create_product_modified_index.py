@@ -0,0 +1,115 @@
+import boto3
+import time
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Delay between checks of the status of indexes being created
+WAIT_DELAY = 20
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    def wait_for_indexes(table_name):
+        """
+        Wait until a table and all of its indexes are active (DynamoDB
+        creates or deletes one index of a table at a time, and backfilling
+        an index of a large table can take hours)
+        """
+        while True:
+            table = client.describe_table(TableName=table_name)['Table']
+            if table['TableStatus'] == 'ACTIVE' and all(
+                index['IndexStatus'] == 'ACTIVE'
+                for index in table.get('GlobalSecondaryIndexes', [])
+            ):
+                return
+            time.sleep(WAIT_DELAY)
+
+    # Sparse index of products by last modified time, partitioned by
+    # "{hour}#{shard}" (incremental exports query the shards of the hours
+    # since the last export). Products are added to the index when they are
+    # next written, so take a full export after running this migration.
+    for index_name, hash_key, range_key in [
+        ('modified_idx', 'modified_shard', 'modified_at'),
+    ]:
+        wait_for_indexes(get_table_name('product'))
+        boto_do_retry(lambda: client.update_table(
+            TableName=get_table_name('product'),
+            AttributeDefinitions=[
+                {
+                    'AttributeName': hash_key,
+                    'AttributeType': 'S'
+                },
+                {
+                    'AttributeName': range_key,
+                    'AttributeType': 'S'
+                },
+            ],
+            GlobalSecondaryIndexUpdates=[
+                {
+                    'Create': {
+                        'IndexName': index_name,
+                        'KeySchema': [
+                            {
+                                'AttributeName': hash_key,
+                                'KeyType': 'HASH'
+                            },
+                            {
+                                'AttributeName': range_key,
+                                'KeyType': 'RANGE'
+                            },
+                        ],
+                        'Projection': {
+                            'ProjectionType': 'INCLUDE',
+                            'NonKeyAttributes': [
+                                'product_uuid',
+                                'store_domain',
+                                'brand_domain',
+                                'full_store_product_url',
+                                'title',
+                                'image_urls',
+                                'product_type',
+                                'primary_currency',
+                                'primary_price',
+                                'best_selling_position',
+                                'vendor_name',
+                                'store_product_brand_domain',
+                                'store_platform',
+                                'published_at',
+                                'last_scraped_at',
+                                'is_available',
+                                'content_hash',
+                            ],
+                        },
+                    },
+                },
+            ],
+        ))
+    wait_for_indexes(get_table_name('product'))
+
+
+if __name__ == '__main__':
+    migrate()
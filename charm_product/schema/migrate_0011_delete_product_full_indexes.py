@@ -0,0 +1,76 @@
+import boto3
+import time
+
+from charm_product.util import get_table_name
+
+
+RETRY_ATTEMPTS = 10
+RETRY_DELAY = 3
+# Delay between checks of the status of indexes being deleted
+WAIT_DELAY = 20
+
+
+def migrate(dynamodb=None):
+    if dynamodb is None:
+        dynamodb = boto3.resource('dynamodb')
+    client = dynamodb.meta.client
+
+    def boto_do_retry(f):
+        """
+        Boto Client will throw errors while resources are updating.
+        Use this function to catch and retry those errors until the operation
+        succeeds.
+        """
+        for i in range(RETRY_ATTEMPTS):
+            try:
+                f()
+                return
+            except (
+                client.exceptions.LimitExceededException,
+                client.exceptions.ResourceInUseException
+            ):
+                if i == (RETRY_ATTEMPTS - 1):
+                    raise
+                time.sleep(RETRY_DELAY)
+
+    def wait_for_indexes(table_name):
+        """
+        Wait until a table and all of its indexes are active (DynamoDB
+        creates or deletes one index of a table at a time)
+        """
+        while True:
+            table = client.describe_table(TableName=table_name)['Table']
+            if table['TableStatus'] == 'ACTIVE' and all(
+                index['IndexStatus'] == 'ACTIVE'
+                for index in table.get('GlobalSecondaryIndexes', [])
+            ):
+                return
+            time.sleep(WAIT_DELAY)
+
+    def delete_index(table_name, index_name):
+        wait_for_indexes(table_name)
+        boto_do_retry(lambda: client.update_table(
+            TableName=table_name,
+            GlobalSecondaryIndexUpdates=[{
+                'Delete': {'IndexName': index_name}
+            }],
+        ))
+        wait_for_indexes(table_name)
+
+    # Delete the "ALL" projected indexes replaced by the "list view" indexes
+    # of migration 0006, and the store list view index replaced in migration
+    # 0009 (run once no deployed code reads the old indexes)
+    for index_name in [
+        'product_uuid_idx',
+        'brand_domain_idx',
+        'store_domain_idx',
+        'store_domain_list_idx',
+    ]:
+        delete_index(get_table_name('product'), index_name)
+
+    for tag in ['image_not_indexed', 'update_product_meta']:
+        delete_index(get_table_name('product_tag'), f'{tag}_idx')
+
+
+if __name__ == '__main__':
+    migrate()
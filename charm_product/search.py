@@ -0,0 +1,326 @@
+"""
+Local inverted index for title/vendor search
+
+A SQLite file maps title and vendor name tokens (tokenized as for
+blacklisted token matching) to the store product URLs containing them, so
+that token group queries are answered without scanning the product table:
+
+    with SearchIndex('search.db') as index:
+        index.update(scan_products(dynamodb, only_attributes=INDEXED_ATTRIBUTES))
+        index.search('gift card')
+        index.search_token_groups(['gift card', 'test product'])
+
+Updates are incremental: unchanged products are not re-indexed, and with
+"complete=True" (a full export) products missing from the export are removed.
+Results match "validation.contains_blacklist_tokens" for the same token group.
+"""
+import re
+import sqlite3
+
+from charm_product.validation import TOKENIZER_REGEX
+
+
+SEARCH_FIELDS = ('title', 'vendor_name')
+INDEXED_ATTRIBUTES = ('store_product_url',) + SEARCH_FIELDS
+
+# Products are indexed in transactions of this many products
+UPDATE_BATCH_SIZE = 1000
+# Documents are read in batches of this many (SQLite variable limit)
+QUERY_BATCH_SIZE = 500
+
+
+def tokenize(text):
+    """
+    Tokenize text as "contains_blacklist_tokens" does (single spaces
+    between lowercase tokens)
+    """
+    return ' '.join(TOKENIZER_REGEX.split(text or '')).lower().strip()
+
+
+def _token_group_regex(tokens):
+    return re.compile('(^| ){}($| )'.format(re.escape(' '.join(tokens))))
+
+
+class SearchIndex:
+    """
+    Inverted index of product titles and vendor names stored in SQLite
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS document (
+                doc_id INTEGER PRIMARY KEY,
+                store_product_url TEXT NOT NULL UNIQUE,
+                title TEXT NOT NULL,
+                vendor_name TEXT NOT NULL,
+                generation INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS token (
+                token_id INTEGER PRIMARY KEY,
+                field TEXT NOT NULL,
+                token TEXT NOT NULL,
+                UNIQUE (field, token)
+            );
+            CREATE TABLE IF NOT EXISTS posting (
+                token_id INTEGER NOT NULL,
+                doc_id INTEGER NOT NULL,
+                PRIMARY KEY (token_id, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        ''')
+        self._token_ids = {}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM document').fetchone()[0]
+
+    def _generation(self):
+        row = self._conn.execute(
+            "SELECT value FROM metadata WHERE key = 'generation'"
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def _token_id(self, field, token, create=False):
+        key = (field, token)
+        token_id = self._token_ids.get(key)
+        if token_id is None:
+            row = self._conn.execute(
+                'SELECT token_id FROM token WHERE field = ? AND token = ?', key
+            ).fetchone()
+            if row is not None:
+                token_id = row[0]
+            elif create:
+                token_id = self._conn.execute(
+                    'INSERT INTO token (field, token) VALUES (?, ?)', key
+                ).lastrowid
+            else:
+                return None
+            self._token_ids[key] = token_id
+        return token_id
+
+    def _postings(self, texts, create=False):
+        return {
+            self._token_id(field, token, create=create)
+            for field, text in zip(SEARCH_FIELDS, texts)
+            for token in set(text.split())
+        }
+
+    def update(self, products, complete=False):
+        """
+        Index products (dicts or "record.StoreProduct" records with
+        "store_product_url", "title" and "vendor_name"). If "complete", the
+        products are a full export and other indexed products are removed.
+        Returns dict(added, updated, unchanged, removed).
+        """
+        report = dict(added=0, updated=0, unchanged=0, removed=0)
+        generation = self._generation() + 1
+        batch = []
+        for product in products:
+            batch.append(product)
+            if len(batch) >= UPDATE_BATCH_SIZE:
+                self._update_batch(batch, generation, report)
+                batch = []
+        if batch:
+            self._update_batch(batch, generation, report)
+
+        with self._conn:
+            self._conn.execute('BEGIN')
+            if complete:
+                removed = [
+                    doc_id for doc_id, in self._conn.execute(
+                        'SELECT doc_id FROM document WHERE generation < ?', (generation,)
+                    )
+                ]
+                self._remove_documents(removed)
+                report['removed'] = len(removed)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('generation', ?)", (generation,)
+            )
+        return report
+
+    def _update_batch(self, products, generation, report):
+        with self._conn:
+            self._conn.execute('BEGIN')
+            existing = {}
+            urls = [product['store_product_url'] for product in products]
+            for start in range(0, len(urls), QUERY_BATCH_SIZE):
+                batch = urls[start:start + QUERY_BATCH_SIZE]
+                existing.update(
+                    (row[0], row[1:]) for row in self._conn.execute(
+                        'SELECT store_product_url, doc_id, title, vendor_name FROM document'
+                        f' WHERE store_product_url IN ({",".join("?" * len(batch))})',
+                        batch,
+                    )
+                )
+
+            unchanged = []
+            for url, product in zip(urls, products):
+                texts = tuple(tokenize(product.get(field)) for field in SEARCH_FIELDS)
+                row = existing.get(url)
+                if row is None:
+                    doc_id = self._conn.execute(
+                        'INSERT INTO document (store_product_url, title, vendor_name, generation)'
+                        ' VALUES (?, ?, ?, ?)',
+                        (url, *texts, generation),
+                    ).lastrowid
+                    existing[url] = (doc_id, *texts)
+                    old_postings = set()
+                    report['added'] += 1
+                else:
+                    doc_id, old_texts = row[0], row[1:]
+                    if old_texts == texts:
+                        unchanged.append((generation, doc_id))
+                        report['unchanged'] += 1
+                        continue
+                    self._conn.execute(
+                        'UPDATE document SET title = ?, vendor_name = ?, generation = ?'
+                        ' WHERE doc_id = ?',
+                        (*texts, generation, doc_id),
+                    )
+                    existing[url] = (doc_id, *texts)
+                    old_postings = self._postings(old_texts)
+                    report['updated'] += 1
+
+                new_postings = self._postings(texts, create=True)
+                self._conn.executemany(
+                    'DELETE FROM posting WHERE token_id = ? AND doc_id = ?',
+                    [(token_id, doc_id) for token_id in old_postings - new_postings],
+                )
+                self._conn.executemany(
+                    'INSERT INTO posting VALUES (?, ?)',
+                    [(token_id, doc_id) for token_id in new_postings - old_postings],
+                )
+            self._conn.executemany(
+                'UPDATE document SET generation = ? WHERE doc_id = ?', unchanged
+            )
+
+    def remove(self, store_product_urls):
+        """
+        Remove products from the index
+        """
+        with self._conn:
+            self._conn.execute('BEGIN')
+            doc_ids = []
+            for url in store_product_urls:
+                row = self._conn.execute(
+                    'SELECT doc_id FROM document WHERE store_product_url = ?', (url,)
+                ).fetchone()
+                if row is not None:
+                    doc_ids.append(row[0])
+            self._remove_documents(doc_ids)
+        return len(doc_ids)
+
+    def _remove_documents(self, doc_ids):
+        for doc_id in doc_ids:
+            texts = self._conn.execute(
+                'SELECT title, vendor_name FROM document WHERE doc_id = ?', (doc_id,)
+            ).fetchone()
+            self._conn.executemany(
+                'DELETE FROM posting WHERE token_id = ? AND doc_id = ?',
+                [(token_id, doc_id) for token_id in self._postings(texts)],
+            )
+            self._conn.execute('DELETE FROM document WHERE doc_id = ?', (doc_id,))
+
+    def search(self, token_group, field='title', limit=None):
+        """
+        Get the store product URLs (sorted) of products whose "field"
+        contains the tokens of "token_group" consecutively
+        """
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f'Unsupported search field "{field}"')
+        tokens = tokenize(token_group).split()
+        if not tokens:
+            return []
+        token_ids = [self._token_id(field, token) for token in set(tokens)]
+        if None in token_ids:
+            return []
+
+        doc_ids = [
+            doc_id for doc_id, in self._conn.execute(
+                ' INTERSECT '.join(
+                    ['SELECT doc_id FROM posting WHERE token_id = ?'] * len(token_ids)
+                ),
+                token_ids,
+            )
+        ]
+        # (postings only match tokens, so check that they are consecutive)
+        regex = _token_group_regex(tokens) if len(tokens) > 1 else None
+        urls = []
+        for start in range(0, len(doc_ids), QUERY_BATCH_SIZE):
+            batch = doc_ids[start:start + QUERY_BATCH_SIZE]
+            rows = self._conn.execute(
+                f'SELECT store_product_url, {field} FROM document'
+                f' WHERE doc_id IN ({",".join("?" * len(batch))})',
+                batch,
+            )
+            urls.extend(
+                url for url, text in rows if regex is None or regex.search(text)
+            )
+        urls.sort()
+        return urls[:limit] if limit is not None else urls
+
+    def search_token_groups(self, token_groups, field='title', limit=None):
+        """
+        Get {token group: store product URLs} (e.g. to check the products a
+        new blacklist token group would match)
+        """
+        return {
+            token_group: self.search(token_group, field=field, limit=limit)
+            for token_group in token_groups
+        }
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Build or query a product search index')
+    parser.add_argument('path', help='SQLite index file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser(
+        'build', help='index the product table (or a JSON lines export)'
+    )
+    build_parser.add_argument('--export', help='JSON lines product export')
+    query_parser = subparsers.add_parser('query', help='search for token groups')
+    query_parser.add_argument('token_groups', nargs='+')
+    query_parser.add_argument('--field', choices=SEARCH_FIELDS, default='title')
+    query_parser.add_argument('--limit', type=int)
+    args = parser.parse_args(argv)
+
+    with SearchIndex(args.path) as index:
+        if args.command == 'build':
+            if args.export is not None:
+                with open(args.export) as fh:
+                    report = index.update((json.loads(line) for line in fh), complete=True)
+            else:
+                import boto3
+                from charm_product.product import scan_products
+
+                report = index.update(
+                    scan_products(boto3.resource('dynamodb'), only_attributes=INDEXED_ATTRIBUTES),
+                    complete=True,
+                )
+        else:
+            report = index.search_token_groups(
+                args.token_groups, field=args.field, limit=args.limit
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+DynamoDB resource factory for multi-threaded and multi-process use
+
+boto3 sessions and resources must not be shared between threads (or carried
+across "fork"). "ResourceFactory" hands out a resource per thread, all
+sharing one low-level client (which is thread safe) with a connection pool
+sized for the number of threads:
+
+    factory = ResourceFactory(max_pool_connections=64)
+    dynamodb = factory.resource()
+
+Clients and resources are re-created in child processes after a fork. A
+factory for the settings (region, endpoint, config and credentials) of an
+existing resource is made with "ResourceFactory.from_resource(dynamodb)".
+"""
+import concurrent.futures
+import itertools
+import os
+import threading
+import weakref
+
+import boto3
+import botocore.config
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_WORKERS = 32
+
+_factories = weakref.WeakSet()
+
+
+class ResourceFactory:
+    """
+    Factory of per-thread DynamoDB resources sharing a pooled client
+    """
+
+    def __init__(
+        self,
+        max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+        region_name=None,
+        endpoint_url=None,
+        config=None,
+        credentials=None,
+        **session_kwargs
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.credentials = credentials
+        self.config = botocore.config.Config(
+            max_pool_connections=max_pool_connections
+        )
+        if config is not None:
+            self.config = self.config.merge(config)
+        self.session_kwargs = session_kwargs
+        self._reset()
+        _factories.add(self)
+
+    @classmethod
+    def from_resource(cls, dynamodb, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+        """
+        Get a factory of resources with the region, endpoint, config and
+        credentials of a boto3 resource
+        """
+        client = dynamodb.meta.client
+        return cls(
+            max_pool_connections=max_pool_connections,
+            region_name=client.meta.region_name,
+            endpoint_url=client.meta.endpoint_url,
+            # (the pool size of the factory wins over the resource's)
+            config=client.meta.config.merge(
+                botocore.config.Config(max_pool_connections=max_pool_connections)
+            ),
+            credentials=client._get_credentials(),
+        )
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._client = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # forked since clients were created (connections can not be shared)
+            self._reset()
+
+    def _session(self):
+        if self.credentials is not None:
+            return credentials_session(self.credentials)
+        return boto3.session.Session(**self.session_kwargs)
+
+    def client(self):
+        """
+        Get the DynamoDB client shared by the resources of all threads
+
+        (Like any resource client, it converts request and response values
+        to and from python types; see "charm_product.lowlevel" for reads
+        using a plain client.)
+        """
+        self._check_pid()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._session().client(
+                        'dynamodb',
+                        region_name=self.region_name,
+                        endpoint_url=self.endpoint_url,
+                        config=self.config,
+                    )
+        return self._client
+
+    def resource(self):
+        """
+        Get the DynamoDB resource for the current thread
+        """
+        self._check_pid()
+        dynamodb = getattr(self._local, 'resource', None)
+        if dynamodb is None:
+            dynamodb = self._session().resource(
+                'dynamodb',
+                region_name=self.region_name,
+                endpoint_url=self.endpoint_url,
+                config=self.config,
+            )
+            # share the pooled client between the resources of all threads
+            dynamodb.meta.client = self.client()
+            self._local.resource = dynamodb
+        return dynamodb
+
+
+def credentials_session(credentials):
+    """
+    Get a boto3 session using botocore "credentials" (e.g. those of an existing
+    client, see "botocore.client.BaseClient._get_credentials") or the default
+    credentials if None
+    """
+    import botocore.credentials
+    import botocore.session
+
+    if credentials is None:
+        return boto3.session.Session()
+
+    class ClientCredentialProvider(botocore.credentials.CredentialProvider):
+        METHOD = 'charm-product-client'
+
+        def load(self):
+            # (refreshable credentials are shared, not copied)
+            return credentials
+
+    botocore_session = botocore.session.Session()
+    botocore_session.register_component(
+        'credential_provider',
+        botocore.credentials.CredentialResolver([ClientCredentialProvider()]),
+    )
+    return boto3.session.Session(botocore_session=botocore_session)
+
+
+def _reset_factories_after_fork():
+    for factory in list(_factories):
+        factory._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_factories_after_fork)
+
+
+_default_factory = None
+_default_factory_lock = threading.Lock()
+
+
+def get_resource_factory():
+    """
+    Get the process-wide default resource factory
+    """
+    global _default_factory
+    if _default_factory is None:
+        with _default_factory_lock:
+            if _default_factory is None:
+                _default_factory = ResourceFactory()
+    return _default_factory
+
+
+def set_resource_factory(factory):
+    global _default_factory
+    _default_factory = factory
+
+
+def get_resource():
+    """
+    Get a DynamoDB resource for the current thread (from the default factory)
+    """
+    return get_resource_factory().resource()
+
+
+def _call_with_default_resource(func, item):
+    return func(get_resource(), item)
+
+
+def _pool_factory(max_workers, dynamodb=None):
+    max_pool_connections = max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS)
+    if dynamodb is not None:
+        return ResourceFactory.from_resource(dynamodb, max_pool_connections)
+    return ResourceFactory(max_pool_connections=max_pool_connections)
+
+
+def parallel_resources(dynamodb, factory=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Get the "factory" and "dynamodb" arguments of "parallel_map" for a
+    caller's "dynamodb": local backends (which are thread safe) are shared
+    by the worker threads, boto3 resources are not (the threads use
+    resources from "factory", by default a factory with the settings of
+    "dynamodb" and sized for "max_workers")
+    """
+    from charm_product.backends import LocalDynamoDB
+
+    if factory is None and isinstance(dynamodb, LocalDynamoDB):
+        return dict(factory=None, dynamodb=dynamodb)
+    if factory is None:
+        factory = _pool_factory(max_workers, dynamodb)
+    return dict(factory=factory, dynamodb=None)
+
+
+def parallel_map(
+    func, items, max_workers=DEFAULT_MAX_WORKERS, factory=None, dynamodb=None
+):
+    """
+    Call "func(dynamodb, item)" for each item in a thread pool, each thread
+    using its own resource from "factory" (by default a factory with a
+    connection pool sized for "max_workers"). Results are returned in order.
+
+    A thread safe "dynamodb" (e.g. a local backend) may be given instead to
+    be shared by all threads.
+    """
+    if dynamodb is None and factory is None:
+        factory = _pool_factory(max_workers)
+
+    def call(item):
+        return func(dynamodb if dynamodb is not None else factory.resource(), item)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(call, items))
+
+
+def process_map(func, items, processes=None, chunksize=1):
+    """
+    Call "func(dynamodb, item)" for each item in a process pool, each worker
+    process using the default resource factory ("func" and the items must be
+    picklable). Results are returned in order.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(
+            _call_with_default_resource, itertools.repeat(func), items,
+            chunksize=chunksize,
+        ))
@@ -0,0 +1,339 @@
+"""
+Immutable, memory-mapped product snapshots
+
+"write_snapshot" serializes products (e.g. from "product.scan_products")
+into a single file, and "ProductSnapshot" memory-maps it. Processes opening
+the same snapshot share its pages (through the OS page cache) instead of
+each loading the catalogue into dicts, and products are only deserialized
+when accessed:
+
+    write_snapshot('products.snap', scan_products(dynamodb))
+
+    with ProductSnapshot('products.snap') as snapshot:
+        snapshot.get_store_product('https://store.com/product')
+        for product in snapshot.fetch_products_by_brand('brand.com'):
+            ...
+
+Layout (little-endian): a header with the offset and length of each
+section, records (pickled product dicts) sorted by store product URL, a
+sorted key index (binary searched for lookups), the availability of each
+record, and per store/brand domain groups of record numbers. Records are
+pickled, so snapshots should only be shared between trusted processes.
+
+Like "product.fetch_products_by_store/brand", the snapshot fetches only
+return available products unless "is_available" is given (None for all).
+"""
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+from array import array
+from collections import defaultdict
+
+from charm_product.compression import decompress_attributes
+from charm_product.record import StoreProduct
+from charm_product.util import clean_product_url
+
+
+MAGIC = b'CPSNAP\x00\x00'
+FORMAT_VERSION = 2
+
+GROUP_ATTRIBUTES = ('store_domain', 'brand_domain')
+
+SECTIONS = ['records', 'record_offsets', 'keys', 'key_offsets', 'is_available'] + [
+    f'{attr}_{part}' for attr in GROUP_ATTRIBUTES
+    for part in ('names', 'name_offsets', 'starts', 'members')
+]
+
+# magic, format version, number of products, then (offset, length) per section
+_HEADER = struct.Struct('<8sIQ' + 'QQ' * len(SECTIONS))
+_ALIGNMENT = 8
+
+
+def _search(count, key, key_at):
+    """
+    Get the position of "key" in sorted keys (None if not found)
+    """
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key_at(mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < count and key_at(lo) == key:
+        return lo
+    return None
+
+
+def _array_bytes(values):
+    """
+    Get the little-endian bytes of an array (arrays use native byte order)
+    """
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _offsets_array(lengths):
+    offsets = array('Q', [0])
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    return offsets
+
+
+def _group_sections(attr, groups):
+    """
+    Get the sections of a group attribute ({name: record numbers})
+    """
+    names = sorted(groups, key=lambda name: name.encode('utf-8'))
+    encoded = [name.encode('utf-8') for name in names]
+    members = array('I')
+    starts = array('Q', [0])
+    for name in names:
+        members.extend(groups[name])
+        starts.append(len(members))
+    return {
+        f'{attr}_names': b''.join(encoded),
+        f'{attr}_name_offsets': _offsets_array(len(name) for name in encoded),
+        f'{attr}_starts': starts,
+        f'{attr}_members': members,
+    }
+
+
+def write_snapshot(path, products):
+    """
+    Write products (dicts or "record.StoreProduct" records) to a snapshot
+    file. The file is written next to "path" and renamed into place.
+    Returns the number of products written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+
+    # records are pickled to a spill file in input order, and copied to the
+    # snapshot in key order
+    keys = []
+    with tempfile.TemporaryFile(dir=directory) as spill:
+        for product in products:
+            if isinstance(product, StoreProduct):
+                item = product.to_dict()
+            else:
+                item = decompress_attributes(dict(product))
+            data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+            keys.append((
+                item['store_product_url'].encode('utf-8'),
+                spill.tell(), len(data),
+                tuple(item.get(attr) for attr in GROUP_ATTRIBUTES),
+                bool(item.get('is_available', True)),
+            ))
+            spill.write(data)
+        spill.flush()
+        keys.sort(key=lambda key: key[0])
+        for i in range(1, len(keys)):
+            if keys[i][0] == keys[i - 1][0]:
+                raise ValueError(f'Duplicate store product URL "{keys[i][0].decode()}"')
+
+        sections = {
+            'record_offsets': _offsets_array(length for _, _, length, _, _ in keys),
+            'keys': b''.join(key for key, _, _, _, _ in keys),
+            'key_offsets': _offsets_array(len(key) for key, _, _, _, _ in keys),
+            'is_available': bytes(available for _, _, _, _, available in keys),
+        }
+        for n, attr in enumerate(GROUP_ATTRIBUTES):
+            groups = defaultdict(list)
+            for i, (_, _, _, group_values, _) in enumerate(keys):
+                if group_values[n] is not None:
+                    groups[group_values[n]].append(i)
+            sections.update(_group_sections(attr, groups))
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(b'\0' * _HEADER.size)
+                positions = {}
+                for name in SECTIONS:
+                    fh.write(b'\0' * (-fh.tell() % _ALIGNMENT))
+                    start = fh.tell()
+                    if name == 'records':
+                        for _, offset, length, _, _ in keys:
+                            spill.seek(offset)
+                            fh.write(spill.read(length))
+                    elif isinstance(sections[name], array):
+                        fh.write(_array_bytes(sections[name]))
+                    else:
+                        fh.write(sections[name])
+                    positions[name] = (start, fh.tell() - start)
+
+                fh.seek(0)
+                fh.write(_HEADER.pack(
+                    MAGIC, FORMAT_VERSION, len(keys),
+                    *[value for name in SECTIONS for value in positions[name]]
+                ))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return len(keys)
+
+
+class ProductSnapshot:
+    """
+    Read-only, memory-mapped product snapshot (see "write_snapshot")
+
+    Snapshots can be passed to worker processes (they are re-opened from
+    their path when unpickled).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = [memoryview(self._mmap)]
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f'"{self.path}" is not a product snapshot')
+        header = _HEADER.unpack_from(self._mmap)
+        magic, version, self._count = header[:3]
+        if magic != MAGIC:
+            raise ValueError(f'"{self.path}" is not a product snapshot')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported snapshot format version {version}')
+
+        sections = {}
+        for n, name in enumerate(SECTIONS):
+            offset, length = header[3 + 2 * n:5 + 2 * n]
+            sections[name] = self._view(offset, length)
+
+        self._records = sections['records']
+        self._record_offsets = self._cast(sections['record_offsets'], 'Q')
+        self._keys = sections['keys']
+        self._key_offsets = self._cast(sections['key_offsets'], 'Q')
+        self._is_available = sections['is_available']
+        self._groups = {
+            attr: (
+                sections[f'{attr}_names'],
+                self._cast(sections[f'{attr}_name_offsets'], 'Q'),
+                self._cast(sections[f'{attr}_starts'], 'Q'),
+                self._cast(sections[f'{attr}_members'], 'I'),
+            )
+            for attr in GROUP_ATTRIBUTES
+        }
+
+    def _view(self, offset, length):
+        view = self._views[0][offset:offset + length]
+        self._views.append(view)
+        return view
+
+    def _cast(self, view, fmt):
+        if sys.byteorder != 'little':
+            # (copied, as memoryview casts use native byte order)
+            values = array(fmt)
+            values.frombytes(view)
+            values.byteswap()
+            return values
+        view = view.cast(fmt)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        if self._mmap is None:
+            return
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, i):
+        return bytes(self._keys[self._key_offsets[i]:self._key_offsets[i + 1]])
+
+    def _find(self, store_product_url):
+        return _search(self._count, store_product_url.encode('utf-8'), self._key)
+
+    def _record(self, i, as_records=False):
+        item = pickle.loads(
+            self._records[self._record_offsets[i]:self._record_offsets[i + 1]]
+        )
+        return StoreProduct.from_item(item) if as_records else item
+
+    def __contains__(self, product_url):
+        return self._find(clean_product_url(product_url)) is not None
+
+    def get_store_product(self, product_url, as_records=False):
+        """
+        Get a product by URL (None if the product is not in the snapshot)
+        """
+        i = self._find(clean_product_url(product_url))
+        if i is None:
+            return None
+        return self._record(i, as_records)
+
+    def store_product_urls(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8')
+
+    def scan_products(self, as_records=False):
+        for i in range(self._count):
+            yield self._record(i, as_records)
+
+    def _group_names(self, attr):
+        names, name_offsets, _, _ = self._groups[attr]
+        return [
+            bytes(names[name_offsets[i]:name_offsets[i + 1]]).decode('utf-8')
+            for i in range(len(name_offsets) - 1)
+        ]
+
+    def _group_records(self, attr, name, is_available, as_records):
+        names, name_offsets, starts, members = self._groups[attr]
+        i = _search(
+            len(name_offsets) - 1, name.encode('utf-8'),
+            lambda j: bytes(names[name_offsets[j]:name_offsets[j + 1]]),
+        )
+        if i is None:
+            return
+        for n in range(starts[i], starts[i + 1]):
+            if is_available is None or self._is_available[members[n]] == is_available:
+                yield self._record(members[n], as_records)
+
+    def store_domains(self):
+        return self._group_names('store_domain')
+
+    def brand_domains(self):
+        return self._group_names('brand_domain')
+
+    def fetch_products_by_store(self, store_domain, is_available=True, as_records=False):
+        """
+        Get the products of a store (ordered by store product URL; all
+        products if "is_available" is None)
+        """
+        return self._group_records('store_domain', store_domain, is_available, as_records)
+
+    def fetch_products_by_brand(self, brand_domain, is_available=True, as_records=False):
+        """
+        Get the products of a brand (ordered by store product URL; all
+        products if "is_available" is None)
+        """
+        return self._group_records('brand_domain', brand_domain, is_available, as_records)
@@ -0,0 +1,188 @@
+"""
+Store catalogue sync
+
+"sync_store" applies a complete scrape of a store with the minimal writes:
+
+    report = sync_store(dynamodb, 'store.com', [
+        dict(product_url='https://store.com/product-1', title='...', ...),
+        ...
+    ])
+
+The current products of the store are read from the store index (keys,
+availability and "content_hash" only). Scraped products are added if new,
+updated if their content hash or availability changed, and
+otherwise left unchanged ("last_scraped_at" is only written with changes).
+Available products missing from the scrape are marked unavailable with
+"removed_at" set ("removed_at" is cleared if they are scraped again).
+
+Products missing from the (eventually consistent) index read are checked
+with batched reads, and only written as new products, in batches, if they
+do not exist. Removed products are updated conditionally (not read first).
+Updated products store the hash of their scraped attributes, so attributes
+missing from a scrape do not cause updates on every sync.
+"""
+from datetime import datetime, timezone
+
+from charm_product.batch import BatchWriter, batch_get_items
+from charm_product.bulk import _set_product_availability
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.counter import (
+    product_counter_deltas,
+    product_counters_enabled,
+    update_product_counters,
+)
+from charm_product.instrument import span, traced
+from charm_product.product import _new_product_item, _new_product_tags, _update_store_product
+from charm_product.ratelimit import rate_limited
+from charm_product.tag import ProductTagBuffer
+from charm_product.util import clean_product_url, get_table_name
+from charm_product.validation import (
+    ValidationError,
+    content_hash,
+    iso_date_string,
+    parse_store_product_data,
+)
+
+
+def _store_product_states(dynamodb, store_domain):
+    """
+    Get {store product URL: index item} for all products of a store
+    """
+    from boto3.dynamodb.conditions import Key
+
+    product_table = dynamodb.Table(get_table_name('product'))
+
+    states = {}
+    query_kwargs = {}
+    while True:
+        with span('sync_store.query_page', index_name='store_domain_hash_idx'):
+            results = rate_limited(product_table.query)(
+                IndexName='store_domain_hash_idx',
+                KeyConditionExpression=Key('store_domain').eq(store_domain),
+                ProjectionExpression=(
+                    'store_product_url,full_store_product_url,store_domain,brand_domain,'
+                    'best_selling_position,is_available,content_hash'
+                ),
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+        record_consumed_capacity('sync_store', results)
+        for item in results['Items']:
+            states[item['store_product_url']] = item
+
+        if 'LastEvaluatedKey' not in results:
+            break
+        query_kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+    return states
+
+
+def _sync_product(
+    dynamodb, tag_buffer, store_domain, state, product_url, attrs, is_available, report
+):
+    """
+    Update an existing product if its content hash or availability changed
+    """
+    store_product_url = clean_product_url(product_url)
+    try:
+        scraped_hash = content_hash(parse_store_product_data(dict(
+            store_product_url=store_product_url,
+            full_store_product_url=product_url,
+            store_domain=store_domain,
+            **attrs
+        ), new_item=False))
+        if (
+            bool(state['is_available']) != is_available or
+            state.get('content_hash') != scraped_hash
+        ):
+            attrs = dict(attrs, is_available=is_available)
+            attrs.pop('first_scraped_at', None)
+            _update_store_product(
+                dynamodb, product_url, tag_buffer, attrs, scraped_hash=scraped_hash
+            )
+            report['updated'] += 1
+        else:
+            report['unchanged'] += 1
+    except ValidationError as err:
+        report['errors'][product_url] = str(err)
+
+
+@traced('sync_store')
+def sync_store(dynamodb, store_domain, products, removed_at=None, tag_buffer=None):
+    """
+    Sync the products of a store with a complete scrape ("products" are
+    dicts of "add_store_product" arguments with a "product_url")
+
+    Returns the number of products added, updated, removed and unchanged,
+    and the validation errors of products which were skipped (by URL).
+    """
+    if removed_at is None:
+        removed_at = datetime.now(timezone.utc)
+
+    if tag_buffer is None:
+        with ProductTagBuffer(dynamodb) as tag_buffer:
+            return sync_store(dynamodb, store_domain, products, removed_at, tag_buffer)
+
+    states = _store_product_states(dynamodb, store_domain)
+    report = dict(added=0, updated=0, removed=0, unchanged=0, errors={})
+
+    scraped = set()
+    candidates = {}
+    for product in products:
+        attrs = dict(product)
+        product_url = attrs.pop('product_url')
+        is_available = bool(attrs.pop('is_available', True))
+        store_product_url = clean_product_url(product_url)
+        scraped.add(store_product_url)
+
+        state = states.get(store_product_url)
+        if state is None:
+            candidates[store_product_url] = (product_url, attrs, is_available)
+            continue
+        _sync_product(
+            dynamodb, tag_buffer, store_domain, state, product_url, attrs, is_available,
+            report,
+        )
+
+    # products missing from the index read may exist (the index is eventually
+    # consistent, or they are stored with another store domain)
+    existing = {
+        item['store_product_url']: item for item in batch_get_items(
+            dynamodb, get_table_name('product'),
+            [{'store_product_url': url} for url in candidates], 'sync_store',
+            ProjectionExpression='store_product_url,is_available,content_hash',
+        )
+    }
+
+    added = []
+    with BatchWriter(dynamodb, get_table_name('product'), 'sync_store') as batch:
+        for store_product_url, (product_url, attrs, is_available) in candidates.items():
+            if store_product_url in existing:
+                _sync_product(
+                    dynamodb, tag_buffer, store_domain, existing[store_product_url],
+                    product_url, attrs, is_available, report,
+                )
+                continue
+            try:
+                item_data = _new_product_item(product_url, store_domain, is_available, attrs)
+            except ValidationError as err:
+                report['errors'][product_url] = str(err)
+                continue
+            batch.put_item(Item=item_data)
+            added.append(item_data)
+
+    report['added'] = len(added)
+    for item_data in added:
+        if product_counters_enabled():
+            update_product_counters(
+                dynamodb, product_counter_deltas(item_data, 1), 'sync_store'
+            )
+        _new_product_tags(dynamodb, tag_buffer, item_data)
+
+    removed_at = iso_date_string(removed_at)
+    for store_product_url, state in states.items():
+        if state['is_available'] and store_product_url not in scraped:
+            # (skipped if the product changed since the index was read)
+            if _set_product_availability(dynamodb, state, False, removed_at, 'sync_store'):
+                report['removed'] += 1
+
+    return report
@@ -1,32 +1,165 @@
-from boto3.dynamodb.conditions import Key
+import threading
+import time
+import zlib
 from enum import Enum, auto
 
+from charm_product.batch import BatchWriter
+from charm_product.capacity import capacity_kwargs, record_consumed_capacity
+from charm_product.instrument import span, traced
+from charm_product.ratelimit import rate_limited
 from charm_product.util import clean_product_url, get_table_name
 
 
+# Sparse index over the tag table used as a work queue ("all products with
+# tag X"). Tags are write-sharded across "TAG_QUEUE_SHARDS" partitions per
+# tag so that a single tag does not become a hot partition and so that
+# workers can drain disjoint sets of shards in parallel.
+TAG_QUEUE_INDEX = 'tag_queue_idx'
+TAG_QUEUE_SHARDS = 16
+
+DEFAULT_LEASE_SECONDS = 300
+
+# Default flush thresholds for buffered tag writes
+TAG_BUFFER_MAX_ITEMS = 500
+TAG_BUFFER_MAX_DELAY = 5.0
+
+
 class ProductTag(Enum):
     image_not_indexed = auto()
     update_product_meta = auto()
 
 
-def set_product_tag(dynamodb, store_product_url, product_tag, **attrs):
-    tag_table = dynamodb.Table(get_table_name('product_tag'))
+def tag_queue_shard(store_product_url):
+    """
+    Get the (stable) work queue shard for a store product URL
+    """
+    return zlib.crc32(store_product_url.encode('utf-8')) % TAG_QUEUE_SHARDS
+
+
+def tag_queue_key(product_tag, shard):
+    return f'{product_tag.name}#{shard}'
+
+
+def worker_tag_shards(worker_index, n_workers):
+    """
+    Get the work queue shards to be drained by one of "n_workers" workers
+    (workers with different indexes are assigned disjoint shards)
+    """
+    if not 0 <= worker_index < n_workers:
+        raise ValueError(f'Invalid worker index {worker_index} for {n_workers} workers')
+    return list(range(worker_index, TAG_QUEUE_SHARDS, n_workers))
+
+
+def product_tag_item(store_product_url, product_tag, **attrs):
     store_product_url = clean_product_url(store_product_url)
     item = {
         'store_product_url': store_product_url,
         'tag': product_tag.name,
         product_tag.name: 1,
+        'tag_shard': tag_queue_key(product_tag, tag_queue_shard(store_product_url)),
     }
     item.update(attrs)
-    tag_table.put_item(Item=item)
+    return item
+
+
+@traced('set_product_tag')
+def set_product_tag(dynamodb, store_product_url, product_tag, **attrs):
+    tag_table = dynamodb.Table(get_table_name('product_tag'))
+    response = rate_limited(tag_table.put_item)(
+        Item=product_tag_item(store_product_url, product_tag, **attrs),
+        **capacity_kwargs()
+    )
+    record_consumed_capacity('set_product_tag', response, write=True)
+
+
+class ProductTagBuffer:
+    """
+    Write-behind buffer for product tags
+
+    Tags are de-duplicated by (store product URL, tag) (the last write wins)
+    and written using batch writes when "max_items" tags are buffered, when
+    the oldest buffered tag is older than "max_delay" seconds (checked as tags
+    are added) or when the buffer is flushed on exit from a "with" block.
+
+        with ProductTagBuffer(dynamodb) as tag_buffer:
+            for product in products:
+                add_store_product(dynamodb, tag_buffer=tag_buffer, **product)
+    """
+
+    def __init__(
+        self,
+        dynamodb,
+        max_items=TAG_BUFFER_MAX_ITEMS,
+        max_delay=TAG_BUFFER_MAX_DELAY,
+    ):
+        self.dynamodb = dynamodb
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._items = {}
+        self._buffered_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def set_product_tag(self, store_product_url, product_tag, **attrs):
+        item = product_tag_item(store_product_url, product_tag, **attrs)
+        with self._lock:
+            self._items[(item['store_product_url'], item['tag'])] = item
+            if self._buffered_at is None:
+                self._buffered_at = time.monotonic()
+            flush = (
+                len(self._items) >= self.max_items or
+                time.monotonic() - self._buffered_at >= self.max_delay
+            )
+        if flush:
+            self.flush()
+
+    def discard(self, store_product_urls):
+        """
+        Drop the buffered tags of products (used when the products are deleted
+        so that a later flush doesn't recreate their tags)
+        """
+        sp_urls = {clean_product_url(sp_url) for sp_url in store_product_urls}
+        with self._lock:
+            self._items = {
+                key: item for key, item in self._items.items() if key[0] not in sp_urls
+            }
+            if not self._items:
+                self._buffered_at = None
+
+    def flush(self):
+        with self._lock:
+            items = list(self._items.values())
+            self._items = {}
+            self._buffered_at = None
+
+        if items:
+            with span('product_tag_buffer.flush', n_items=len(items)), BatchWriter(
+                self.dynamodb, get_table_name('product_tag'), 'set_product_tag'
+            ) as batch:
+                for item in items:
+                    batch.put_item(Item=item)
 
 
 def fetch_product_tags(dynamodb, store_product_urls, product_tag=None):
+    """
+    Get the tags of products (tags fetched by "product_tag" are read from the
+    tag index and only include "indexes.TAG_INDEX_ATTRIBUTES")
+    """
+    from boto3.dynamodb.conditions import Key
+
     tag_table = dynamodb.Table(get_table_name('product_tag'))
 
     index_name = None
     if product_tag is not None:
-        index_name = f'{product_tag.name}_idx'
+        index_name = f'{product_tag.name}_list_idx'
 
     for sp_url in store_product_urls:
         sp_url = clean_product_url(sp_url)
@@ -40,10 +173,12 @@ def fetch_product_tags(dynamodb, store_product_urls, product_tag=None):
             if index_name is not None:
                 query_kwargs['IndexName'] = index_name
 
-            results = tag_table.query(
+            results = rate_limited(tag_table.query)(
                 KeyConditionExpression=key_expr,
-                **query_kwargs
+                **query_kwargs,
+                **capacity_kwargs()
             )
+            record_consumed_capacity('fetch_product_tags', results)
             for item in results['Items']:
                 yield item
 
@@ -52,10 +187,123 @@ def fetch_product_tags(dynamodb, store_product_urls, product_tag=None):
                 break
 
 
-def delete_product_tags(dynamodb, product_tag, store_product_urls):
+@traced('claim_product_tags')
+def claim_product_tags(
+    dynamodb,
+    product_tag,
+    worker_id,
+    shards=None,
+    limit=100,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+):
+    """
+    Claim up to "limit" tagged products from the tag work queue
+
+    Each claimed tag is leased to "worker_id" for "lease_seconds" (tags with
+    an active lease held by another worker are skipped). Acknowledge
+    processed products with "delete_product_tags", or give them back with
+    "release_product_tags". Tags which are not acknowledged before their
+    lease expires may be claimed again by any worker.
+    """
+    from boto3.dynamodb.conditions import Attr, Key
+
     tag_table = dynamodb.Table(get_table_name('product_tag'))
 
-    with tag_table.batch_writer() as batch:
+    if shards is None:
+        shards = range(TAG_QUEUE_SHARDS)
+
+    now = int(time.time())
+    lease_expires_at = now + lease_seconds
+    not_leased = (
+        Attr('lease_expires_at').not_exists() |
+        Attr('lease_expires_at').lt(now)
+    )
+
+    claimed = []
+    for shard in shards:
+        start_key = None
+        while len(claimed) < limit:
+            query_kwargs = {}
+            if start_key is not None:
+                query_kwargs['ExclusiveStartKey'] = start_key
+
+            results = rate_limited(tag_table.query)(
+                IndexName=TAG_QUEUE_INDEX,
+                KeyConditionExpression=Key('tag_shard').eq(tag_queue_key(product_tag, shard)),
+                FilterExpression=not_leased,
+                **query_kwargs,
+                **capacity_kwargs()
+            )
+            record_consumed_capacity('claim_product_tags', results)
+            for item in results['Items']:
+                if len(claimed) >= limit:
+                    break
+                try:
+                    # Conditional write ensures only one worker acquires the
+                    # lease, even if several workers read the same tag
+                    result = rate_limited(tag_table.update_item)(
+                        Key={
+                            'store_product_url': item['store_product_url'],
+                            'tag': item['tag'],
+                        },
+                        UpdateExpression=(
+                            'SET lease_owner = :lease_owner, '
+                            'lease_expires_at = :lease_expires_at'
+                        ),
+                        ConditionExpression=Attr('store_product_url').exists() & not_leased,
+                        ExpressionAttributeValues={
+                            ':lease_owner': worker_id,
+                            ':lease_expires_at': lease_expires_at,
+                        },
+                        ReturnValues='ALL_NEW',
+                        **capacity_kwargs()
+                    )
+                except tag_table.meta.client.exceptions.ConditionalCheckFailedException:
+                    # tag was claimed by another worker (or deleted)
+                    continue
+                record_consumed_capacity('claim_product_tags', result, write=True)
+                claimed.append(result['Attributes'])
+
+            start_key = results.get('LastEvaluatedKey')
+            if start_key is None:
+                break
+
+        if len(claimed) >= limit:
+            break
+
+    return claimed
+
+
+@traced('release_product_tags')
+def release_product_tags(dynamodb, product_tag, store_product_urls, worker_id):
+    """
+    Release leases held by "worker_id" so that tags may be claimed again
+    without waiting for the leases to expire
+    """
+    from boto3.dynamodb.conditions import Attr
+
+    tag_table = dynamodb.Table(get_table_name('product_tag'))
+
+    for sp_url in store_product_urls:
+        sp_url = clean_product_url(sp_url)
+        try:
+            response = rate_limited(tag_table.update_item)(
+                Key={'store_product_url': sp_url, 'tag': product_tag.name},
+                UpdateExpression='REMOVE lease_owner, lease_expires_at',
+                ConditionExpression=Attr('lease_owner').eq(worker_id),
+                **capacity_kwargs()
+            )
+            record_consumed_capacity('release_product_tags', response, write=True)
+        except tag_table.meta.client.exceptions.ConditionalCheckFailedException:
+            # lease expired and was claimed by another worker (or tag was deleted)
+            pass
+
+
+@traced('delete_product_tags')
+def delete_product_tags(dynamodb, product_tag, store_product_urls):
+    with BatchWriter(
+        dynamodb, get_table_name('product_tag'), 'delete_product_tags'
+    ) as batch:
         for sp_url in store_product_urls:
             sp_url = clean_product_url(sp_url)
             batch.delete_item(Key=dict(
@@ -1,16 +1,14 @@
 import re
 import decimal
+import functools
+import hashlib
 import json
-import pytz
 import warnings
-from boto3.dynamodb.types import TypeSerializer
 from collections import namedtuple
+from datetime import timezone
 from urllib.parse import urlsplit
 
 
-dynamo_type_serializer = TypeSerializer()
-
-
 MINIMUM_PRICE = decimal.Decimal('0.02')
 
 
@@ -24,24 +22,23 @@ class ValidationWarning(UserWarning):
 
 def format_token_group_regexes(token_groups):
     """
-    Convert space-delimited token groups into compiled regexes for matching
-    groups of sequential tokens
+    Convert space-delimited token groups into regexes for matching groups of
+    sequential tokens (compiled by "contains_blacklist_tokens" on first use)
     """
-    return [
-        re.compile(f'(^| ){tkn_grp}($| )')
-        for tkn_grp in token_groups
-    ]
+    return [f'(^| ){tkn_grp}($| )' for tkn_grp in token_groups]
 
 
-IMAGE_URL_BLACKLIST_TOKEN_GROUPS = format_token_group_regexes([
+# Space-delimited blacklisted token groups (and their regexes)
+IMAGE_URL_BLACKLIST_TOKENS = [
     'noimage',
     'no image',
     'nophoto',
     'no photo',
     'placeholder',
-])
+]
+IMAGE_URL_BLACKLIST_TOKEN_GROUPS = format_token_group_regexes(IMAGE_URL_BLACKLIST_TOKENS)
 
-PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS = format_token_group_regexes([
+PRODUCT_TITLE_BLACKLIST_TOKENS = [
     'test product',
     'gift card',
     'egift card',
@@ -66,19 +63,27 @@ PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS = format_token_group_regexes([
     'item customizations',
     'item personalization',
     'bottle deposit',
-])
+]
+PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS = format_token_group_regexes(
+    PRODUCT_TITLE_BLACKLIST_TOKENS
+)
 
 
 TOKENIZER_REGEX = re.compile(r'[\W_]+')
 
 
+@functools.lru_cache(maxsize=None)
+def _token_group_regex(token_group):
+    return re.compile(token_group)
+
+
 def contains_blacklist_tokens(text, token_groups):
     # Split on non-word characters and put a single space between
     # all tokens (allow matching on groups of consecutive tokens)
     tokenized_text = ' '.join(TOKENIZER_REGEX.split(text)).lower()
 
     for token_group in token_groups:
-        match = re.search(token_group, tokenized_text)
+        match = _token_group_regex(token_group).search(tokenized_text)
         if match is not None:
             return True, match.group(0).strip()
     return False, None
@@ -128,10 +133,10 @@ def price(price):
 
 def iso_date_string(dt):
     try:
-        return pytz.utc.localize(dt).isoformat()
-    except ValueError:
-        return dt.astimezone(pytz.utc).isoformat()
-    except AttributeError:
+        if dt.tzinfo is None:
+            return dt.replace(tzinfo=timezone.utc).isoformat()
+        return dt.astimezone(timezone.utc).isoformat()
+    except (AttributeError, TypeError):
         raise ValidationError(f'Invalid datetime value: {dt}')
 
 
@@ -147,20 +152,13 @@ def json_string(x):
 
 
 def string_list(x):
-    try:
-        serialized = dynamo_type_serializer.serialize(x)
-        if (
-            set(serialized.keys()) != {'L'} or
-            {
-                elem_type
-                for elem in list(serialized.values())[0]
-                for elem_type in elem.keys()
-            } != {'S'}
-        ):
-            raise ValidationError(f'Invalid "string list" value: {x}')
-    except TypeError:
+    # non-empty list of strings (stored as a DynamoDB "L" of "S" values)
+    if (
+        not isinstance(x, list) or
+        not x or
+        not all(isinstance(elem, str) for elem in x)
+    ):
         raise ValidationError(f'Invalid "string list" value: {x}')
-
     return x
 
 
@@ -258,3 +256,35 @@ def parse_store_product_data(
             raise ValidationError(f'Missing required attributes: {missing_attrs}')
 
     return item_data
+
+
+# Attributes which do not change the product listing (excluded from
+# "content_hash")
+CONTENT_HASH_IGNORED_ATTRIBUTES = frozenset([
+    'is_available',
+    'removed_at',
+    'first_scraped_at',
+    'last_scraped_at',
+])
+
+CONTENT_HASH_ATTRIBUTES = sorted(VALID_ATTRIBUTES - CONTENT_HASH_IGNORED_ATTRIBUTES)
+
+
+def _hash_value(value):
+    if isinstance(value, decimal.Decimal):
+        # integral numbers read from DynamoDB are Decimals
+        return int(value) if value == value.to_integral_value() else str(value)
+    return value
+
+
+def content_hash(item_data):
+    """
+    Get a hash of the (parsed, uncompressed) scraped attributes of a product,
+    for detecting changed products without comparing items
+    """
+    content = {
+        name: _hash_value(item_data[name]) for name in CONTENT_HASH_ATTRIBUTES
+        if item_data.get(name) is not None
+    }
+    data = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
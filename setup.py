@@ -13,4 +13,9 @@ setup(
     packages=find_namespace_packages(include=['charm_product', 'charm_product.*']),
     include_package_data=True,
     install_requires=readlines('requirements.txt'),
+    extras_require={
+        'numpy': ['numpy'],
+        'arrow': ['numpy', 'pyarrow'],
+        'zstd': ['zstandard'],
+    },
 )
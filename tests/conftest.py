@@ -1,11 +1,24 @@
+import boto3
+import moto
 import os
 import pytest
+from ciso8601 import parse_datetime as parse_dt
 from mock import patch
 
+from charm_product import counter
+from charm_product.backends import MemoryDynamoDB, SQLiteDynamoDB
+from charm_product.product import add_store_product
 from charm_product.schema.migrate_0001_create_product_tables import migrate as migrate1
 from charm_product.schema.migrate_0002_replace_product_tag_image_index import migrate as migrate2
 from charm_product.schema.migrate_0003_replace_product_tag_meta_index import migrate as migrate3
 from charm_product.schema.migrate_0004_delete_visual_features_table import migrate as migrate4
+from charm_product.schema.migrate_0005_create_product_tag_queue_index import migrate as migrate5
+from charm_product.schema.migrate_0006_replace_product_list_view_indexes import migrate as migrate6
+from charm_product.schema.migrate_0007_create_product_top_rank_indexes import migrate as migrate7
+from charm_product.schema.migrate_0008_create_product_counter_table import migrate as migrate8
+from charm_product.schema.migrate_0009_replace_product_store_index import migrate as migrate9
+from charm_product.schema.migrate_0010_create_product_modified_index import migrate as migrate10
+from charm_product.schema.migrate_0011_delete_product_full_indexes import migrate as migrate11
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -23,10 +36,80 @@ def mock_env():
 @pytest.fixture()
 def create_dynamodb_tables():
 
-    def func():
-        migrate1()
-        migrate2()
-        migrate3()
-        migrate4()
+    def func(dynamodb=None):
+        migrate1(dynamodb)
+        migrate2(dynamodb)
+        migrate3(dynamodb)
+        migrate4(dynamodb)
+        migrate5(dynamodb)
+        migrate6(dynamodb)
+        migrate7(dynamodb)
+        migrate8(dynamodb)
+        migrate9(dynamodb)
+        migrate10(dynamodb)
+        migrate11(dynamodb)
+
+    return func
+
+
+@pytest.fixture(params=['moto', 'memory', 'sqlite'])
+def dynamodb(request, create_dynamodb_tables, tmp_path):
+    """DynamoDB resource (moto or a local backend) with all tables created"""
+    if request.param == 'moto':
+        with moto.mock_dynamodb2():
+            dynamodb = boto3.resource('dynamodb')
+            create_dynamodb_tables(dynamodb)
+            yield dynamodb
+        return
+
+    if request.param == 'memory':
+        dynamodb = MemoryDynamoDB()
+    else:
+        dynamodb = SQLiteDynamoDB(str(tmp_path / 'charm_product.db'))
+    create_dynamodb_tables(dynamodb)
+    yield dynamodb
+
+
+@pytest.fixture()
+def regional_dynamodb(create_dynamodb_tables):
+    """moto DynamoDB resource (with all tables created) in a non-default region"""
+    with moto.mock_dynamodb2():
+        dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+        create_dynamodb_tables(dynamodb)
+        yield dynamodb
+
+
+@pytest.fixture()
+def product_counters(monkeypatch):
+    """enable product counters (the env-derived default is restored afterwards)"""
+    monkeypatch.setattr(counter, '_enabled', True)
+
+
+@pytest.fixture()
+def add_products():
+    """
+    add products "{store_domain}/product-{i}" and return their URLs (attribute
+    values may also be functions of the product index "i")
+    """
+
+    def func(dynamodb, store_domain, n, **attrs):
+        product_urls = []
+        for i in range(n):
+            product = dict(
+                product_url=f'https://{store_domain}/product-{i}',
+                store_domain=store_domain,
+                title=f'Product {i}',
+                best_selling_position=i + 1,
+                image_urls=[f'https://{store_domain}/images/product-{i}'],
+                scraper_type='generic_scraper',
+                first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+                last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            )
+            product.update({
+                name: value(i) if callable(value) else value for name, value in attrs.items()
+            })
+            add_store_product(dynamodb, **product)
+            product_urls.append(product['product_url'])
+        return product_urls
 
     return func
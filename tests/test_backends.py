@@ -0,0 +1,223 @@
+import concurrent.futures
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from decimal import Decimal
+
+from charm_product.backends import MemoryDynamoDB, SQLiteDynamoDB, Storage, base
+from charm_product.util import get_table_name
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def local_dynamodb(request, tmp_path):
+    if request.param == 'memory':
+        dynamodb = MemoryDynamoDB()
+    else:
+        dynamodb = SQLiteDynamoDB(str(tmp_path / 'charm_product.db'))
+    dynamodb.meta.client.create_table(
+        TableName='items',
+        AttributeDefinitions=[
+            {'AttributeName': 'pk', 'AttributeType': 'S'},
+            {'AttributeName': 'group', 'AttributeType': 'S'},
+            {'AttributeName': 'rank', 'AttributeType': 'N'},
+        ],
+        KeySchema=[{'AttributeName': 'pk', 'KeyType': 'HASH'}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'group_idx',
+            'KeySchema': [
+                {'AttributeName': 'group', 'KeyType': 'HASH'},
+                {'AttributeName': 'rank', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['title']},
+        }],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    return dynamodb
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_concurrent_reads_and_writes(local_dynamodb):
+    table = local_dynamodb.Table('items')
+
+    def write_and_read(i):
+        table.put_item(Item=dict(pk=f'item-{i}', group='a', rank=i))
+        assert table.get_item(Key={'pk': f'item-{i}'})['Item']['rank'] == i
+        table.query(IndexName='group_idx', KeyConditionExpression=Key('group').eq('a'))
+        return len(table.scan()['Items'])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write_and_read, range(200)))
+    assert len(table.scan()['Items']) == 200
+
+
+def test_query_index_pagination(local_dynamodb):
+    table = local_dynamodb.Table('items')
+    for i in range(10):
+        table.put_item(Item=dict(pk=f'item-{i}', group='a', rank=10 - i, title=f'Item {i}'))
+    # sparse index (no "rank")
+    table.put_item(Item=dict(pk='unranked', group='a'))
+
+    pages = []
+    start_key = None
+    while True:
+        kwargs = {} if start_key is None else {'ExclusiveStartKey': start_key}
+        results = table.query(
+            IndexName='group_idx', KeyConditionExpression=Key('group').eq('a'),
+            Limit=4, **kwargs
+        )
+        pages.append(results['Items'])
+        start_key = results.get('LastEvaluatedKey')
+        if start_key is None:
+            break
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    items = [item for page in pages for item in page]
+    assert [item['rank'] for item in items] == list(range(1, 11))
+    # index projection
+    assert set(items[0]) == {'pk', 'group', 'rank', 'title'}
+
+    results = table.query(
+        IndexName='group_idx',
+        KeyConditionExpression=Key('group').eq('a') & Key('rank').between(3, 5),
+        ScanIndexForward=False,
+    )
+    assert [item['rank'] for item in results['Items']] == [5, 4, 3]
+
+    results = table.query(
+        IndexName='group_idx', KeyConditionExpression=Key('group').eq('a'),
+        Select='COUNT',
+    )
+    assert results['Count'] == 10
+    assert 'Items' not in results
+
+
+def test_paging_seeks_to_start_key(local_dynamodb, monkeypatch):
+    monkeypatch.setattr(base, 'READ_CHUNK_SIZE', 7)
+    ranks = [Decimal(r) for r in [
+        '-1000', '-12.5', '-12', '-1.25', '-0.5', '0', '0.001', '0.5', '1', '9', '10',
+        '12', '12.5', '100', '1E+20',
+    ]]
+    table = local_dynamodb.Table('items')
+    with table.batch_writer() as batch:
+        for i in range(100):
+            batch.put_item(Item=dict(pk=f'item-{i}', group='a', rank=ranks[i % len(ranks)]))
+
+    storage = local_dynamodb.meta.client._storage
+    entries_read = []
+    for method_name in ['query', 'scan']:
+        method = getattr(storage, method_name)
+
+        def read(*args, method=method, **kwargs):
+            entries = method(*args, **kwargs)
+            entries_read.append(len(entries))
+            return entries
+
+        monkeypatch.setattr(storage, method_name, read)
+
+    def read_pages(read, **kwargs):
+        items = []
+        while True:
+            results = read(Limit=3, **kwargs)
+            items.extend(results['Items'])
+            if 'LastEvaluatedKey' not in results:
+                return items
+            kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+    expected = sorted(
+        (ranks[i % len(ranks)], f'item-{i}') for i in range(100)
+    )
+    for forward in [True, False]:
+        items = read_pages(
+            table.query, IndexName='group_idx', KeyConditionExpression=Key('group').eq('a'),
+            ScanIndexForward=forward,
+        )
+        assert [(item['rank'], item['pk']) for item in items] == (
+            expected if forward else expected[::-1]
+        )
+    items = read_pages(table.scan)
+    assert [item['pk'] for item in items] == sorted(f'item-{i}' for i in range(100))
+    # each page reads on from the previous one instead of re-reading the partition
+    assert sum(entries_read) < 2 * 3 * 100
+
+
+def test_conditional_writes(local_dynamodb):
+    table = local_dynamodb.Table('items')
+    table.put_item(Item=dict(pk='x', count=1), ConditionExpression=Attr('pk').not_exists())
+
+    with pytest.raises(table.meta.client.exceptions.ConditionalCheckFailedException):
+        table.put_item(Item=dict(pk='x'), ConditionExpression=Attr('pk').not_exists())
+
+    with pytest.raises(ClientError) as e:
+        table.delete_item(Key={'pk': 'x'}, ConditionExpression=Attr('count').gt(1))
+    assert e.value.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+    table.delete_item(Key={'pk': 'x'}, ConditionExpression=Attr('count').eq(1))
+    assert 'Item' not in table.get_item(Key={'pk': 'x'})
+
+
+def test_update_expressions(local_dynamodb):
+    table = local_dynamodb.Table('items')
+    table.put_item(Item=dict(pk='x', tags=['a'], removed='yes'))
+
+    result = table.update_item(
+        Key={'pk': 'x'},
+        UpdateExpression=(
+            'SET #n = if_not_exists(#n, :zero) + :one, tags = list_append(tags, :tags) '
+            'REMOVE removed ADD total :one'
+        ),
+        ExpressionAttributeNames={'#n': 'n'},
+        ExpressionAttributeValues={':zero': 0, ':one': 1, ':tags': ['b']},
+        ReturnValues='ALL_NEW',
+    )
+    assert result['Attributes'] == dict(
+        pk='x', n=Decimal(1), tags=['a', 'b'], total=Decimal(1)
+    )
+
+    # update creates items which do not exist
+    table.update_item(
+        Key={'pk': 'y'}, UpdateExpression='SET title = :title',
+        ExpressionAttributeValues={':title': 'Y'},
+    )
+    assert table.get_item(Key={'pk': 'y'})['Item'] == dict(pk='y', title='Y')
+
+    # key attributes may not be updated
+    with pytest.raises(ClientError):
+        table.update_item(
+            Key={'pk': 'y'}, UpdateExpression='SET pk = :pk',
+            ExpressionAttributeValues={':pk': 'z'},
+        )
+
+
+def test_index_key_types_are_validated(local_dynamodb):
+    table = local_dynamodb.Table('items')
+    with pytest.raises(ClientError) as e:
+        table.put_item(Item=dict(pk='x', group='a', rank='first'))
+    assert e.value.response['Error']['Code'] == 'ValidationException'
+
+
+def test_returned_items_are_copies(local_dynamodb):
+    table = local_dynamodb.Table('items')
+    table.put_item(Item=dict(pk='x', tags=['a']))
+    table.get_item(Key={'pk': 'x'})['Item']['tags'].append('b')
+
+    assert table.get_item(Key={'pk': 'x'})['Item']['tags'] == ['a']
+
+
+def test_sqlite_backend_persists_data(tmp_path, create_dynamodb_tables):
+    path = str(tmp_path / 'charm_product.db')
+    dynamodb = SQLiteDynamoDB(path)
+    create_dynamodb_tables(dynamodb)
+    dynamodb.Table(get_table_name('product')).put_item(Item=dict(
+        store_product_url='store.com/product', store_domain='store.com', is_available=1,
+    ))
+    dynamodb.close()
+
+    dynamodb = SQLiteDynamoDB(path)
+    item = dynamodb.Table(get_table_name('product')).get_item(
+        Key={'store_product_url': 'store.com/product'}
+    )['Item']
+    assert item['is_available'] == 1
@@ -0,0 +1,91 @@
+import json
+import pytest
+
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.blacklist import BlacklistRules, dry_run_export, dry_run_scan, main
+from charm_product.product import add_store_product
+from charm_product.validation import PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS
+
+
+PRODUCTS = [
+    dict(
+        store_product_url='astore.com/gift-box',
+        title='Gift Box - Large',
+        image_urls=['https://cdn.astore.com/gift-box.jpg'],
+    ),
+    dict(
+        store_product_url='astore.com/box',
+        title='Box, Gift',
+        image_urls=['https://cdn.astore.com/coming_soon.png?gift-box'],
+    ),
+    dict(store_product_url='bstore.com/gift-boxes', title='Gift Boxes'),
+    dict(store_product_url='bstore.com/e-gift-wrap', title='E-Gift Wrap'),
+]
+
+RULES = BlacklistRules(['gift box', 'egift wrap', 'e gift wrap'], ['coming soon', 'gift box'])
+
+
+def test_blacklist_rules():
+    assert RULES.matches(PRODUCTS[0]) == ['title:gift box', 'image_url:gift box']
+    # (image URL queries are not matched)
+    assert RULES.matches(PRODUCTS[1]) == ['image_url:coming soon']
+    assert RULES.matches(PRODUCTS[2]) == []
+    assert RULES.matches(PRODUCTS[3]) == ['title:e gift wrap']
+    assert RULES.matches(dict(store_product_url='cstore.com/no-title')) == []
+
+
+def test_dry_run_scan(dynamodb):
+    for product in PRODUCTS:
+        attrs = {k: v for k, v in product.items() if k != 'store_product_url'}
+        add_store_product(
+            dynamodb,
+            product_url=f'https://{product["store_product_url"]}',
+            store_domain=product['store_product_url'].split('/')[0],
+            **attrs,
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00')
+        )
+
+    report = dry_run_scan(dynamodb, RULES, processes=1, total_segments=1)
+    assert report['checked'] == 4
+    assert report['products_per_sec'] > 0
+    assert report['rules'] == {
+        'title:gift box': dict(count=1, store_product_urls=['astore.com/gift-box']),
+        'title:egift wrap': dict(count=0, store_product_urls=[]),
+        'title:e gift wrap': dict(count=1, store_product_urls=['bstore.com/e-gift-wrap']),
+        'image_url:coming soon': dict(count=1, store_product_urls=['astore.com/box']),
+        'image_url:gift box': dict(count=1, store_product_urls=['astore.com/gift-box']),
+    }
+    # (worker processes cannot use the "dynamodb" resource)
+    with pytest.raises(ValueError):
+        dry_run_scan(dynamodb, RULES, processes=2)
+
+
+def test_dry_run_export(tmp_path):
+    path = tmp_path / 'export.jsonl'
+    path.write_text(''.join(json.dumps(p) + '\n' for p in PRODUCTS * 5) + '\n')
+
+    report = dry_run_export(str(path), RULES, processes=2, chunk_size=3)
+    assert report['checked'] == 20
+    assert report['rules']['title:gift box']['count'] == 5
+    assert report['rules']['image_url:coming soon']['store_product_urls'] == ['astore.com/box'] * 5
+    assert report == dict(
+        dry_run_export(str(path), RULES, processes=1),
+        seconds=report['seconds'], products_per_sec=report['products_per_sec'],
+    )
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / 'export.jsonl'
+    path.write_text(''.join(json.dumps(p) + '\n' for p in PRODUCTS))
+
+    main(['--title', 'gift box', '--existing', '--export', str(path), '--processes', '1'])
+    report = json.loads(capsys.readouterr().out)
+    assert report['checked'] == 4
+    assert len(report['rules']) == (
+        1 + len(PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS) + 5
+    )
+    assert report['rules']['title:egift card']['store_product_urls'] == []
+    assert report['rules']['title:gift box']['count'] == 1
@@ -0,0 +1,168 @@
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.bulk import (
+    FileCheckpoint,
+    merge_product_uuids,
+    set_brand_availability,
+    set_store_availability,
+)
+from charm_product.counter import get_brand_product_count, get_store_product_count
+from charm_product.product import (
+    count_products_by_store,
+    fetch_products_by_product_uuid,
+    fetch_top_products_by_store,
+    get_store_product,
+    update_store_product,
+)
+from charm_product.tag import ProductTag, fetch_product_tags
+
+
+def test_set_store_availability(dynamodb, product_counters, add_products):
+    add_products(dynamodb, 'astore.com', 7)
+    add_products(dynamodb, 'bstore.com', 2)
+    update_store_product(dynamodb, 'https://astore.com/product-0', is_available=False)
+
+    progress = []
+    report = set_store_availability(
+        dynamodb, 'astore.com', False, max_workers=4, page_size=2,
+        removed_at=parse_dt('2020-06-02T00:00:01+00:00'), progress=progress.append,
+    )
+    assert report == dict(processed=6, updated=6, skipped=0)
+    assert [p['processed'] for p in progress][-1] == 6
+    assert progress[-1]['last_key'] is None
+
+    assert count_products_by_store(dynamodb, 'astore.com') == 0
+    assert count_products_by_store(dynamodb, 'astore.com', is_available=False) == 7
+    assert count_products_by_store(dynamodb, 'bstore.com') == 2
+    assert get_store_product_count(dynamodb, 'astore.com') == 0
+    assert get_store_product_count(dynamodb, 'astore.com', is_available=False) == 7
+
+    product = get_store_product(dynamodb, 'https://astore.com/product-1')
+    assert product['removed_at'] == '2020-06-02T00:00:01+00:00'
+    assert list(fetch_top_products_by_store(dynamodb, 'astore.com')) == []
+
+    report = set_store_availability(dynamodb, 'astore.com', True)
+    assert report == dict(processed=7, updated=7, skipped=0)
+    products = list(fetch_top_products_by_store(dynamodb, 'astore.com', n=3))
+    assert [p['best_selling_position'] for p in products] == [1, 2, 3]
+
+
+def test_set_store_availability_relist(dynamodb, add_products):
+    add_products(dynamodb, 'astore.com', 2)
+    set_store_availability(dynamodb, 'astore.com', False)
+    assert 'removed_at' in get_store_product(dynamodb, 'https://astore.com/product-0')
+
+    report = set_store_availability(dynamodb, 'astore.com', True)
+    assert report == dict(processed=2, updated=2, skipped=0)
+    for i in range(2):
+        product = get_store_product(dynamodb, f'https://astore.com/product-{i}')
+        assert product['is_available']
+        assert 'removed_at' not in product
+
+
+def test_set_store_availability_region(regional_dynamodb, add_products):
+    # (worker threads use resources in the region of "regional_dynamodb")
+    add_products(regional_dynamodb, 'astore.com', 3)
+    report = set_store_availability(regional_dynamodb, 'astore.com', False, max_workers=4)
+    assert report == dict(processed=3, updated=3, skipped=0)
+    assert count_products_by_store(regional_dynamodb, 'astore.com') == 0
+
+
+def test_set_brand_availability(dynamodb, add_products):
+    add_products(dynamodb, 'astore.com', 3, store_product_brand_domain='brand.com')
+    add_products(dynamodb, 'bstore.com', 2)
+
+    report = set_brand_availability(dynamodb, 'brand.com', False)
+    assert report == dict(processed=3, updated=3, skipped=0)
+    assert count_products_by_store(dynamodb, 'astore.com') == 0
+    assert count_products_by_store(dynamodb, 'bstore.com') == 2
+
+
+def test_set_store_availability_resume(dynamodb, tmp_path, add_products):
+    add_products(dynamodb, 'astore.com', 6)
+    checkpoint = FileCheckpoint(str(tmp_path / 'checkpoint.json'))
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(state):
+        if state['processed'] >= 4:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        set_store_availability(
+            dynamodb, 'astore.com', False, page_size=2, checkpoint=checkpoint,
+            progress=interrupt,
+        )
+    assert checkpoint.load()['processed'] == 4
+    assert count_products_by_store(dynamodb, 'astore.com') == 2
+
+    report = set_store_availability(
+        dynamodb, 'astore.com', False, page_size=2, checkpoint=checkpoint
+    )
+    assert report == dict(processed=6, updated=6, skipped=0)
+    assert count_products_by_store(dynamodb, 'astore.com') == 0
+    assert checkpoint.load() is None
+
+
+def test_merge_product_uuids(dynamodb, product_counters, add_products):
+    add_products(dynamodb, 'astore.com', 3)
+    add_products(dynamodb, 'bstore.com', 2)
+    # existing product with the merged UUID
+    uuid_a = get_store_product(dynamodb, 'https://bstore.com/product-1')['product_uuid']
+    uuid_b = 'b' * 32
+
+    product_uuids = {
+        'https://astore.com/product-0': uuid_a,
+        'astore.com/product-1': uuid_a,
+        'bstore.com/product-0': uuid_b,
+        'cstore.com/missing': uuid_b,
+    }
+    brand_domains = {uuid_a: 'brand.com'}
+
+    progress = []
+    report = merge_product_uuids(
+        dynamodb, product_uuids, brand_domains, max_workers=4, progress=progress.append
+    )
+    # (3 merged products, 1 missing, 1 other product with "uuid_a")
+    assert report == dict(updated=4, missing=1)
+    assert progress[-1] == report
+
+    products = list(fetch_products_by_product_uuid(dynamodb, uuid_a))
+    assert sorted(p['store_product_url'] for p in products) == [
+        'astore.com/product-0', 'astore.com/product-1', 'bstore.com/product-1',
+    ]
+    assert {p['brand_domain'] for p in products} == {'brand.com'}
+    assert get_store_product(dynamodb, 'bstore.com/product-0')['product_uuid'] == uuid_b
+    assert 'brand_domain' not in get_store_product(dynamodb, 'bstore.com/product-0')
+
+    # "update_product_meta" tags cleared for updated products
+    assert sorted(
+        t['store_product_url'] for t in fetch_product_tags(
+            dynamodb,
+            [f'astore.com/product-{i}' for i in range(3)] +
+            [f'bstore.com/product-{i}' for i in range(2)],
+            ProductTag.update_product_meta,
+        )
+    ) == ['astore.com/product-2']
+
+    assert get_brand_product_count(dynamodb, 'brand.com') == 3
+    assert get_store_product_count(dynamodb, 'astore.com') == 3
+
+    # re-running is idempotent
+    report = merge_product_uuids(dynamodb, product_uuids, brand_domains)
+    assert report == dict(updated=3, missing=1)
+    assert get_brand_product_count(dynamodb, 'brand.com') == 3
+
+
+def test_merge_product_uuids_region(regional_dynamodb, add_products):
+    # (worker threads use resources in the region of "regional_dynamodb")
+    add_products(regional_dynamodb, 'astore.com', 2)
+    uuid_a = 'a' * 32
+    report = merge_product_uuids(
+        regional_dynamodb, {'astore.com/product-0': uuid_a, 'astore.com/product-1': uuid_a},
+        {uuid_a: 'brand.com'}, max_workers=4,
+    )
+    assert report == dict(updated=2, missing=0)
+    assert len(list(fetch_products_by_product_uuid(regional_dynamodb, uuid_a))) == 2
@@ -0,0 +1,131 @@
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.backends import MemoryDynamoDB
+from charm_product.capacity import (
+    CapacityBudget,
+    CapacityBudgetExceeded,
+    capacity_account,
+    disable_capacity_accounting,
+    enable_capacity_accounting,
+)
+from charm_product.compression import CompressionConfig, backfill_compression
+from charm_product.product import (
+    add_store_product,
+    delete_store_products,
+    fetch_products_by_store,
+    get_store_product,
+)
+from charm_product.util import get_table_name
+
+
+@pytest.fixture()
+def local_dynamodb(create_dynamodb_tables):
+    dynamodb = MemoryDynamoDB()
+    create_dynamodb_tables(dynamodb)
+    return dynamodb
+
+
+@pytest.fixture()
+def capacity_accounting():
+    capacity_account.reset()
+    enable_capacity_accounting()
+    yield capacity_account
+    disable_capacity_accounting()
+    capacity_account.reset()
+
+
+def add_product(dynamodb, i, **attrs):
+    add_store_product(
+        dynamodb,
+        product_url=f'https://store.com/product-{i}',
+        store_domain='store.com',
+        title=f'Product {i}',
+        image_urls=[f'https://store.com/images/product-{i}'],
+        scraper_type='generic_scraper',
+        first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        **attrs
+    )
+
+
+def test_capacity_accounting(local_dynamodb, capacity_accounting):
+    for i in range(3):
+        add_product(local_dynamodb, i)
+    get_store_product(local_dynamodb, 'store.com/product-0')
+    # (only "list view" attributes are read from the index)
+    list(fetch_products_by_store(local_dynamodb, 'store.com', only_attributes=['title']))
+    delete_store_products(local_dynamodb, ['store.com/product-0'])
+
+    totals = capacity_accounting.totals()
+    # product item + "store_domain_hash_idx", "product_uuid_list_idx" and "modified_idx"
+    # entries per product
+    assert totals['add_store_product'] == {'read': 0, 'write': 12}
+    assert totals['set_product_tag']['write'] > 0
+    assert totals['get_store_product'] == {'read': 0.5, 'write': 0}
+    assert totals['fetch_products_by_store'] == {'read': 0.5, 'write': 0}
+    assert totals['delete_store_products']['write'] > 0
+
+    report = capacity_accounting.report()
+    assert {
+        (r['table_name'], r['index_name']): (r['write_units'], r['requests'])
+        for r in report['add_store_product']
+    } == {
+        (get_table_name('product'), None): (3, 3),
+        (get_table_name('product'), 'product_uuid_list_idx'): (3, 0),
+        (get_table_name('product'), 'store_domain_hash_idx'): (3, 0),
+        (get_table_name('product'), 'modified_idx'): (3, 0),
+    }
+    assert [
+        (r['index_name'], r['read_units']) for r in report['fetch_products_by_store']
+    ] == [(None, 0), ('store_domain_hash_idx', 0.5)]
+
+
+def test_capacity_accounting_hydrated_fetch(local_dynamodb, capacity_accounting):
+    for i in range(3):
+        add_product(local_dynamodb, i)
+    list(fetch_products_by_store(local_dynamodb, 'store.com'))
+
+    # keys from the index + a get per product from the table
+    report = capacity_accounting.report()
+    assert [
+        (r['index_name'], r['read_units']) for r in report['fetch_products_by_store']
+    ] == [(None, 1.5), ('store_domain_hash_idx', 0.5)]
+
+
+def test_capacity_accounting_backfill_compression(local_dynamodb, capacity_accounting):
+    add_product(local_dynamodb, 0, description='A long product description. ' * 50)
+    capacity_accounting.reset()
+
+    report = backfill_compression(local_dynamodb, CompressionConfig('zlib'))
+    assert report['items_compressed'] == 1
+    usage = capacity_accounting.totals()['backfill_compression']
+    assert usage['read'] > 0
+    assert usage['write'] > 0
+
+
+def test_capacity_accounting_disabled(local_dynamodb):
+    capacity_account.reset()
+    add_product(local_dynamodb, 0)
+    assert capacity_account.totals() == {}
+
+
+def test_capacity_budget_limits(local_dynamodb, capacity_accounting):
+    enable_capacity_accounting(CapacityBudget(max_write_units=12))
+
+    add_product(local_dynamodb, 0)
+    with pytest.raises(CapacityBudgetExceeded):
+        for i in range(1, 10):
+            add_product(local_dynamodb, i)
+
+
+def test_capacity_budget_rate(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('charm_product.capacity.time.sleep', sleeps.append)
+
+    budget = CapacityBudget(read_units_per_second=10)
+    budget.consume(read_units=5)
+    assert sleeps == []
+    budget.consume(read_units=10)
+    assert len(sleeps) == 1
+    assert 0.4 < sleeps[0] <= 0.5
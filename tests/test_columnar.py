@@ -0,0 +1,101 @@
+import math
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.columnar import (
+    INT64_NULL,
+    ProductColumns,
+    fetch_product_columns_by_brand,
+    fetch_product_columns_by_store,
+    scan_product_columns,
+)
+from charm_product.product import add_store_product
+
+
+@pytest.fixture()
+def products(dynamodb):
+    for i in range(6):
+        attrs = {}
+        if i % 2 == 0:
+            attrs['primary_price'] = f'{i + 1}.50'
+            attrs['best_selling_position'] = i
+        add_store_product(
+            dynamodb,
+            product_url=f'https://store-{i % 2}.com/product-{i}',
+            store_domain=f'store-{i % 2}.com',
+            title=f'Product {i}',
+            store_product_brand_domain='brand.com',
+            primary_currency='USD',
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt(f'2020-06-0{i + 1}T00:00:00+00:00'),
+            **attrs
+        )
+    return dynamodb
+
+
+def test_fetch_product_columns_by_store(products):
+    columns = fetch_product_columns_by_store(
+        products, 'store-0.com',
+        columns=['store_product_url', 'primary_price', 'best_selling_position'],
+    )
+    assert len(columns) == 3
+    rows = sorted(zip(
+        columns['store_product_url'].values,
+        columns['primary_price'].values,
+        columns['best_selling_position'].values,
+    ))
+    assert rows == [
+        ('store-0.com/product-0', 1.5, 0),
+        ('store-0.com/product-2', 3.5, 2),
+        ('store-0.com/product-4', 5.5, 4),
+    ]
+
+
+def test_fetch_product_columns_missing_values(products):
+    columns = fetch_product_columns_by_store(
+        products, 'store-1.com', columns=['primary_price', 'best_selling_position'],
+    )
+    assert len(columns) == 3
+    assert all(math.isnan(v) for v in columns['primary_price'].values)
+    assert list(columns['best_selling_position'].values) == [INT64_NULL] * 3
+    assert list(columns['best_selling_position'].valid) == [0] * 3
+
+
+def test_fetch_product_columns_by_brand(products):
+    columns = fetch_product_columns_by_brand(products, 'brand.com')
+    assert len(columns) == 6
+    store_domain = columns['store_domain']
+    assert sorted(store_domain.categories) == ['store-0.com', 'store-1.com']
+    assert sorted(store_domain.values) == [0, 0, 0, 1, 1, 1]
+    assert columns['primary_currency'].categories == ['USD']
+    assert list(columns['is_available'].values) == [1] * 6
+    assert sorted(columns['last_scraped_at'].values) == [
+        1590969600000000 + i * 86400 * 1000000 for i in range(6)
+    ]
+
+
+def test_scan_product_columns(products):
+    columns = scan_product_columns(products, columns=['store_product_url'])
+    assert len(columns) == 6
+
+
+def test_invalid_columns():
+    with pytest.raises(ValueError):
+        ProductColumns(['not_an_attribute'])
+
+
+def test_to_numpy(products):
+    np = pytest.importorskip('numpy')
+    columns = fetch_product_columns_by_store(products, 'store-0.com').to_numpy()
+    assert columns['primary_price'].dtype == np.float64
+    assert columns['last_scraped_at'].dtype == np.dtype('datetime64[us]')
+    codes, categories = columns['store_domain']
+    assert list(categories[codes]) == ['store-0.com'] * 3
+
+
+def test_to_arrow(products):
+    pytest.importorskip('pyarrow')
+    table = fetch_product_columns_by_store(products, 'store-1.com').to_arrow()
+    assert table.num_rows == 3
+    assert table.column('primary_price').null_count == 3
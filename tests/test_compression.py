@@ -0,0 +1,117 @@
+import json
+import pytest
+
+from charm_product import compression, lowlevel
+from charm_product.compression import (
+    CompressionConfig,
+    backfill_compression,
+    compress_value,
+    decompress_value,
+    disable_compression,
+    enable_compression,
+    get_compression,
+)
+from charm_product.product import (
+    fetch_products_by_store,
+    get_store_product,
+    update_store_product,
+)
+from charm_product.util import get_table_name
+
+
+DESCRIPTION = ' '.join(['A very comfortable organic cotton shirt.'] * 50)
+JSON_DATA = json.dumps({'variants': [{'sku': f'sku-{i}', 'price': '9.99'} for i in range(50)]})
+# (product 0 has a description below the minimum compressed size)
+PRODUCT_DATA = dict(
+    description=lambda i: DESCRIPTION if i else 'Short description',
+    json_data=JSON_DATA,
+)
+
+
+@pytest.fixture()
+def compression_disabled():
+    disable_compression()
+    yield
+    disable_compression()
+
+
+@pytest.fixture()
+def zlib_compression():
+    enable_compression('zlib')
+    yield get_compression()
+    disable_compression()
+
+
+def raw_item(dynamodb, store_product_url):
+    return dynamodb.Table(get_table_name('product')).get_item(
+        Key={'store_product_url': store_product_url}
+    )['Item']
+
+
+def test_compress_value():
+    compressed = compress_value(DESCRIPTION)
+    assert len(compressed) < len(DESCRIPTION) / 10
+    assert decompress_value(compressed) == DESCRIPTION
+    with pytest.raises(ValueError):
+        decompress_value(b'\x00abc')
+
+
+def test_compress_value_zstd():
+    pytest.importorskip('zstandard')
+    assert decompress_value(compress_value(DESCRIPTION, 'zstd')) == DESCRIPTION
+
+
+def test_compression_config_from_env(monkeypatch, compression_disabled):
+    monkeypatch.setattr(compression, '_config', compression._UNSET)
+    monkeypatch.setenv('CHARM_PRODUCT_COMPRESSION', 'zlib')
+    assert get_compression().codec == 'zlib'
+
+    monkeypatch.setattr(compression, '_config', compression._UNSET)
+    monkeypatch.delenv('CHARM_PRODUCT_COMPRESSION')
+    assert get_compression() is None
+
+
+def test_compressed_writes(dynamodb, zlib_compression, add_products):
+    add_products(dynamodb, 'store.com', 3, **PRODUCT_DATA)
+
+    item = raw_item(dynamodb, 'store.com/product-1')
+    assert not isinstance(item['description'], str)
+    assert not isinstance(item['json_data'], str)
+    # below minimum size
+    assert raw_item(dynamodb, 'store.com/product-0')['description'] == 'Short description'
+
+    product = get_store_product(dynamodb, 'store.com/product-1')
+    assert product['description'] == DESCRIPTION
+    assert product['json_data'] == JSON_DATA
+
+    products = list(fetch_products_by_store(dynamodb, 'store.com'))
+    assert {p['json_data'] for p in products} == {JSON_DATA}
+    records = list(fetch_products_by_store(dynamodb, 'store.com', as_records=True))
+    assert {r.json_data for r in records} == {JSON_DATA}
+    products = list(lowlevel.fetch_products_by_store(dynamodb, 'store.com'))
+    assert {p['json_data'] for p in products} == {JSON_DATA}
+
+    update_store_product(dynamodb, 'store.com/product-0', description=DESCRIPTION + '!')
+    assert not isinstance(raw_item(dynamodb, 'store.com/product-0')['description'], str)
+    product = get_store_product(dynamodb, 'store.com/product-0')
+    assert product['description'] == DESCRIPTION + '!'
+
+
+def test_backfill_compression(dynamodb, compression_disabled, add_products):
+    add_products(dynamodb, 'store.com', 3, **PRODUCT_DATA)
+    assert isinstance(raw_item(dynamodb, 'store.com/product-1')['description'], str)
+
+    report = backfill_compression(dynamodb, CompressionConfig('zlib'), dry_run=True)
+    assert report['items_scanned'] == 3
+    assert report['items_compressed'] == 3
+    assert report['bytes_after'] < report['bytes_before']
+    assert report['saved_write_units_per_item'] > 0
+    assert isinstance(raw_item(dynamodb, 'store.com/product-1')['description'], str)
+
+    report = backfill_compression(dynamodb, CompressionConfig('zlib'))
+    assert report['items_compressed'] == 3
+    assert not isinstance(raw_item(dynamodb, 'store.com/product-1')['description'], str)
+    assert get_store_product(dynamodb, 'store.com/product-1')['description'] == DESCRIPTION
+
+    report = backfill_compression(dynamodb, CompressionConfig('zlib'))
+    assert report['items_compressed'] == 0
@@ -0,0 +1,75 @@
+from charm_product import counter
+from charm_product.counter import (
+    get_brand_product_count,
+    get_store_product_count,
+    product_counters_enabled,
+    rebuild_product_counters,
+)
+from charm_product.product import (
+    count_products_by_brand,
+    count_products_by_store,
+    delete_store_products,
+    update_store_product,
+)
+
+
+def test_product_counters_from_env(monkeypatch):
+    monkeypatch.setattr(counter, '_enabled', counter._UNSET)
+    monkeypatch.setenv('CHARM_PRODUCT_COUNTERS', '1')
+    assert product_counters_enabled()
+    monkeypatch.setattr(counter, '_enabled', counter._UNSET)
+    monkeypatch.delenv('CHARM_PRODUCT_COUNTERS')
+    assert not product_counters_enabled()
+
+
+def test_count_products(dynamodb, add_products):
+    add_products(dynamodb, 'astore.com', 4, store_product_brand_domain='brand.com')
+    add_products(dynamodb, 'bstore.com', 2)
+    update_store_product(dynamodb, 'https://astore.com/product-0', is_available=False)
+
+    assert count_products_by_store(dynamodb, 'astore.com') == 3
+    assert count_products_by_store(dynamodb, 'astore.com', is_available=False) == 1
+    assert count_products_by_store(dynamodb, 'astore.com', is_available=None) == 4
+    assert count_products_by_store(dynamodb, 'bstore.com') == 2
+    assert count_products_by_store(dynamodb, 'cstore.com') == 0
+    assert count_products_by_brand(dynamodb, 'brand.com') == 3
+
+
+def test_product_counters(dynamodb, product_counters, add_products):
+    add_products(dynamodb, 'astore.com', 4, store_product_brand_domain='brand.com')
+    add_products(dynamodb, 'bstore.com', 2)
+
+    assert get_store_product_count(dynamodb, 'astore.com') == 4
+    assert get_store_product_count(dynamodb, 'bstore.com') == 2
+    assert get_brand_product_count(dynamodb, 'brand.com') == 4
+    assert get_store_product_count(dynamodb, 'cstore.com') == 0
+
+    update_store_product(dynamodb, 'https://astore.com/product-0', is_available=False)
+    # availability unchanged
+    update_store_product(dynamodb, 'https://astore.com/product-1', is_available=True)
+    assert get_store_product_count(dynamodb, 'astore.com') == 3
+    assert get_store_product_count(dynamodb, 'astore.com', is_available=False) == 1
+    assert get_store_product_count(dynamodb, 'astore.com', is_available=None) == 4
+    assert get_brand_product_count(dynamodb, 'brand.com', is_available=False) == 1
+
+    delete_store_products(dynamodb, [
+        'astore.com/product-0', 'astore.com/product-1', 'astore.com/missing',
+    ])
+    assert get_store_product_count(dynamodb, 'astore.com') == 2
+    assert get_store_product_count(dynamodb, 'astore.com', is_available=False) == 0
+    assert get_brand_product_count(dynamodb, 'brand.com') == 2
+
+    for store_domain in ['astore.com', 'bstore.com']:
+        assert get_store_product_count(dynamodb, store_domain) == \
+            count_products_by_store(dynamodb, store_domain)
+
+
+def test_rebuild_product_counters(dynamodb, add_products):
+    add_products(dynamodb, 'astore.com', 3, store_product_brand_domain='brand.com')
+    update_store_product(dynamodb, 'https://astore.com/product-0', is_available=False)
+    assert get_store_product_count(dynamodb, 'astore.com') == 0
+
+    rebuild_product_counters(dynamodb, store_domains=['astore.com'], brand_domains=['brand.com'])
+    assert get_store_product_count(dynamodb, 'astore.com') == 2
+    assert get_store_product_count(dynamodb, 'astore.com', is_available=False) == 1
+    assert get_brand_product_count(dynamodb, 'brand.com', is_available=None) == 3
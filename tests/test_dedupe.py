@@ -0,0 +1,124 @@
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product import dedupe
+from charm_product.dedupe import (
+    LSHIndex,
+    MinHasher,
+    fetch_brand_duplicate_candidates,
+    find_duplicate_candidates,
+    lsh_parameters,
+    title_tokens,
+)
+from charm_product.product import add_store_product
+
+
+pytest.importorskip('numpy')
+
+
+TITLES = [
+    ('astore.com/shirt', 'Organic Cotton Shirt - Blue', 'brand.com'),
+    ('bstore.com/shirt', 'organic cotton shirt (blue)', 'brand.com'),
+    ('cstore.com/shirt', 'Organic Cotton Shirt, Blue', 'other.com'),
+    ('astore.com/wallet', 'Leather Wallet', 'brand.com'),
+    ('bstore.com/tote', 'Blue Canvas Tote Bag', 'brand.com'),
+    ('cstore.com/no-title', '---', 'brand.com'),
+    ('cstore.com/no-brand', 'Organic Cotton Shirt', None),
+]
+
+
+def test_title_tokens():
+    assert title_tokens('Organic Cotton-Shirt (Blue)') == {'organic', 'cotton', 'shirt', 'blue'}
+    assert title_tokens('--') == set()
+
+
+def test_lsh_parameters():
+    bands, rows = lsh_parameters(0.5, 64)
+    assert bands * rows == 64
+    assert abs((1 / bands) ** (1 / rows) - 0.5) < 0.1
+
+
+def test_minhash_similarity():
+    hasher = MinHasher(num_perm=256)
+    signatures = hasher.signatures([
+        {'a', 'b', 'c', 'd'},
+        {'a', 'b', 'c'},
+        {'w', 'x', 'y', 'z'},
+        {'a', 'b', 'c', 'd'},
+    ])
+    assert signatures.shape == (4, 256)
+    assert (signatures[0] == signatures[3]).all()
+    assert abs((signatures[0] == signatures[1]).mean() - 0.75) < 0.1
+    assert (signatures[0] == signatures[2]).mean() < 0.1
+
+    pairs = LSHIndex(*lsh_parameters(0.5, 256)).candidate_pairs(signatures)
+    assert {(0, 1), (0, 3), (1, 3)} <= pairs
+    assert not {(0, 2), (1, 2), (2, 3)} & pairs
+
+
+def test_minhash_no_overflow():
+    hasher = MinHasher(num_perm=16)
+    tokens = ['organic', 'cotton', 'shirt']
+    # (exact arithmetic with python ints)
+    expected = [
+        min((int(a) * hasher._token_hash(t) + int(b)) % dedupe._HASH_PRIME for t in tokens)
+        for a, b in zip(hasher._a[:, 0], hasher._b[:, 0])
+    ]
+    assert hasher.signatures([set(tokens)])[0].tolist() == expected
+
+
+def test_find_duplicate_candidates():
+    products = [
+        dict(store_product_url=url, title=title, brand_domain=brand)
+        for url, title, brand in TITLES
+    ]
+    candidates = list(find_duplicate_candidates(products))
+    assert [(a, b) for a, b, _ in candidates] == [('astore.com/shirt', 'bstore.com/shirt')]
+    assert candidates[0][2] == 1.0
+
+    # group by store instead of brand
+    for product in products:
+        product['store_domain'] = product['store_product_url'].split('/')[0]
+    candidates = list(find_duplicate_candidates(products, group_by='store_domain'))
+    assert [(a, b) for a, b, _ in candidates] == [('cstore.com/shirt', 'cstore.com/no-brand')]
+
+
+def test_find_duplicate_candidates_variants():
+    # identical titles are paired with the first product only
+    products = [
+        dict(store_product_url=f'store.com/shirt-{i}', title='Classic Cotton T-Shirt',
+             brand_domain='brand.com')
+        for i in range(4000)
+    ]
+    candidates = list(find_duplicate_candidates(products))
+    assert len(candidates) == 3999
+    assert {a for a, _, _ in candidates} == {'store.com/shirt-0'}
+    assert {s for _, _, s in candidates} == {1.0}
+
+
+def test_candidate_pairs_bucket_cap(monkeypatch):
+    # near-identical titles share large buckets (pairs are capped per bucket)
+    monkeypatch.setattr(dedupe, 'MAX_BUCKET_NEIGHBOURS', 5)
+    signatures = MinHasher().signatures(
+        title_tokens(f'Classic Cotton T-Shirt {i}') for i in range(2000)
+    )
+    bands, rows = lsh_parameters(0.5, 64)
+    pairs = LSHIndex(bands, rows).candidate_pairs(signatures)
+    assert 0 < len(pairs) <= 2000 * 5 * bands
+
+
+def test_fetch_brand_duplicate_candidates(dynamodb):
+    for url, title, brand in TITLES[:5]:
+        add_store_product(
+            dynamodb,
+            product_url=f'https://{url}',
+            store_domain=url.split('/')[0],
+            title=title,
+            store_product_brand_domain=brand,
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+
+    candidates = list(fetch_brand_duplicate_candidates(dynamodb, 'brand.com'))
+    assert [(a, b) for a, b, _ in candidates] == [('astore.com/shirt', 'bstore.com/shirt')]
@@ -0,0 +1,93 @@
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.backends import MemoryDynamoDB
+from charm_product.instrument import (
+    Histogram,
+    LatencyRecorder,
+    get_tracer,
+    set_tracer,
+    span,
+)
+from charm_product.product import (
+    add_store_product,
+    fetch_products_by_store,
+    update_store_product,
+)
+
+
+@pytest.fixture()
+def local_dynamodb(create_dynamodb_tables):
+    dynamodb = MemoryDynamoDB()
+    create_dynamodb_tables(dynamodb)
+    return dynamodb
+
+
+@pytest.fixture()
+def recorder():
+    recorder = LatencyRecorder()
+    set_tracer(recorder)
+    yield recorder
+    set_tracer(None)
+
+
+def test_span_noop_by_default():
+    assert get_tracer() is None
+    with span('noop', a=1) as s:
+        assert s is not None
+
+
+def test_latency_recorder(local_dynamodb, recorder):
+    for i in range(2):
+        add_store_product(
+            local_dynamodb,
+            product_url=f'https://store.com/product-{i}',
+            store_domain='store.com',
+            title=f'Product {i}',
+            image_urls=[f'https://store.com/images/product-{i}'],
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+    update_store_product(
+        local_dynamodb, 'store.com/product-0', title='New title',
+        image_urls=['https://store.com/images/new'],
+    )
+    list(fetch_products_by_store(local_dynamodb, 'store.com'))
+
+    snapshot = recorder.snapshot()
+    for name in [
+        'add_store_product',
+        'add_store_product.validate',
+        'add_store_product.put_item',
+        'add_store_product.tags',
+        'set_product_tag',
+    ]:
+        assert snapshot[name]['count'] >= 2, name
+    for name in [
+        'update_store_product',
+        'update_store_product.get_item',
+        'update_store_product.validate',
+        'update_store_product.update_item',
+        'update_store_product.tags',
+        'fetch_products_by_store.query_page',
+    ]:
+        assert snapshot[name]['count'] == 1, name
+
+    add = snapshot['add_store_product']
+    assert add['min_ms'] <= add['p50_ms'] <= add['max_ms']
+    assert sum(b['count'] for b in add['buckets']) == 2
+
+    recorder.reset()
+    assert recorder.snapshot() == {}
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in [0.05] * 98 + [20, 3000]:
+        histogram.record(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['p50_ms'] == 0.1
+    assert snapshot['p99_ms'] == 25
+    assert histogram.percentile(100) == 3000
@@ -0,0 +1,117 @@
+import json
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from ciso8601 import parse_datetime as parse_dt
+from decimal import Decimal
+
+from charm_product import lowlevel, product
+
+
+@pytest.fixture()
+def products(dynamodb):
+    for i in range(4):
+        product.add_store_product(
+            dynamodb,
+            product_url=f'https://store.com/product-{i}',
+            store_domain='store.com',
+            title=f'Product {i}',
+            image_urls=[f'https://store.com/images/{i}.jpg'],
+            primary_price=f'{i + 1}.25',
+            best_selling_position=i,
+            store_product_brand_domain='brand.com',
+            json_data=json.dumps({'i': i}),
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+    return dynamodb
+
+
+def by_url(products):
+    return sorted(products, key=lambda p: p['store_product_url'])
+
+
+@pytest.mark.parametrize('fetch', ['fetch_products_by_store', 'fetch_products_by_brand'])
+def test_fetch_products_decimal(products, fetch):
+    domain = 'store.com' if fetch == 'fetch_products_by_store' else 'brand.com'
+    expected = by_url(getattr(product, fetch)(products, domain))
+    assert by_url(getattr(lowlevel, fetch)(products, domain, numbers='decimal')) == expected
+
+
+def test_fetch_products_native_numbers(products):
+    results = by_url(lowlevel.fetch_products_by_store(products, 'store.com'))
+    assert len(results) == 4
+    assert results[1]['primary_price'] == 2.25
+    assert isinstance(results[1]['primary_price'], float)
+    assert results[1]['best_selling_position'] == 1
+    assert isinstance(results[1]['best_selling_position'], int)
+    assert results[1]['is_available'] is True
+    assert results[1]['image_urls'] == ['https://store.com/images/1.jpg']
+
+
+def test_fetch_products_only_attributes(products):
+    results = by_url(lowlevel.fetch_products_by_store(
+        products, 'store.com', only_attributes=['store_product_url', 'primary_price'],
+    ))
+    assert results[0] == {'store_product_url': 'store.com/product-0', 'primary_price': 1.25}
+
+    product_uuid = product.get_store_product(products, 'store.com/product-0')['product_uuid']
+    results = list(lowlevel.fetch_products_by_product_uuid(
+        products, product_uuid, only_attributes=['product_uuid'],
+    ))
+    assert results == [{'product_uuid': product_uuid}]
+
+
+def test_fetch_products_limit(products):
+    assert len(list(lowlevel.fetch_products_by_store(products, 'store.com', limit=2))) == 2
+
+
+def test_get_store_product(products):
+    result = lowlevel.get_store_product(products, 'https://store.com/product-2')
+    assert result['primary_price'] == 3.25
+    assert result == {
+        **product.get_store_product(products, 'store.com/product-2'),
+        'primary_price': 3.25,
+        'best_selling_position': 2,
+        'is_available': True,
+    }
+    assert lowlevel.get_store_product(products, 'store.com/missing') is None
+
+
+def test_product_deserializer():
+    item = {
+        'store_product_url': 'store.com/product-1',
+        'primary_price': Decimal('9.99'),
+        'is_available': 0,
+        'image_urls': ['a', 'b'],
+        'extra': {'nested': [Decimal(1), None, True, b'x', {'a', 'b'}]},
+    }
+    serialized = {k: TypeSerializer().serialize(v) for k, v in item.items()}
+
+    deserialize = lowlevel.make_product_deserializer(numbers='decimal')
+    assert deserialize(serialized) == {**item, 'is_available': False}
+
+    deserialize = lowlevel.make_product_deserializer(['primary_price'])
+    assert deserialize(serialized) == {'primary_price': 9.99}
+
+
+def test_client_credentials():
+    import boto3
+
+    session = boto3.session.Session(
+        aws_access_key_id='AKIA1111111111111111',
+        aws_secret_access_key='1' * 40,
+        region_name='eu-west-1',
+    )
+    client = lowlevel.get_client(session.resource('dynamodb'))
+    assert client.meta.region_name == 'eu-west-1'
+    assert client._get_credentials().access_key == 'AKIA1111111111111111'
+
+
+def test_native_decimal_numbers():
+    item = lowlevel._native_product(
+        dict(best_selling_position=Decimal('1E+1'), primary_price=Decimal('2.50')),
+        None, 'native'
+    )
+    assert item == dict(best_selling_position=10, primary_price=2.5)
+    assert isinstance(item['best_selling_position'], int)
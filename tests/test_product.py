@@ -1,6 +1,7 @@
-import boto3
+import time
 import uuid
-import moto
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from ciso8601 import parse_datetime as parse_dt
 
@@ -13,6 +14,16 @@ from charm_product.product import (
     fetch_products_by_brand,
     fetch_products_by_store,
     fetch_products_by_product_uuid,
+    fetch_top_products_by_brand,
+    fetch_top_products_by_store,
+    iter_products_changed_since,
+)
+from charm_product.indexes import (
+    ALL_PRODUCT_INDEX_KEYS,
+    MODIFIED_SHARDS,
+    modified_keys,
+    modified_shards,
+    non_key_attributes,
 )
 from charm_product.tag import ProductTag, delete_product_tags, fetch_product_tags
 from charm_product.util import get_table_name
@@ -26,10 +37,11 @@ def update_product_attribute(dynamodb, product_url, attr, value):
     """
     product_table = dynamodb.Table(get_table_name('product'))
     store_product_url = clean_product_url(product_url)
-    update_expression = f'SET {attr} = {value}'
+    update_expression = f'SET {attr} = :value'
     product_table.update_item(
         Key={'store_product_url': store_product_url},
         UpdateExpression=update_expression,
+        ExpressionAttributeValues={':value': value},
     )
 
 
@@ -118,12 +130,9 @@ def expected_dynamodb_data():
     ]
 
 
-@moto.mock_dynamodb2
 def test_add_store_product(
-    create_dynamodb_tables, input_product_data, expected_dynamodb_data
+    dynamodb, input_product_data, expected_dynamodb_data
 ):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
 
     for product in input_product_data:
         add_store_product(dynamodb, **product)
@@ -145,6 +154,16 @@ def test_add_store_product(
     for product_uuid in product_uuids.values():
         uuid.UUID(product_uuid)
 
+    # assert content hashes assigned to distinct values
+    content_hashes = [p.pop('content_hash') for p in actual_output]
+    assert len(set(content_hashes)) == 3
+    assert all(len(h) == 32 for h in content_hashes)
+
+    # assert modified products index keys assigned
+    for p in actual_output:
+        modified_at = p.pop('modified_at')
+        assert p.pop('modified_shard').startswith(modified_at[:13] + '#')
+
     def sort_items(items):
         return sorted(items, key=lambda s: s['store_product_url'])
 
@@ -174,12 +193,9 @@ def test_add_store_product(
             add_store_product(dynamodb, **product)
 
 
-@moto.mock_dynamodb2
 def test_update_store_product_tags(
-    create_dynamodb_tables, input_product_data, expected_dynamodb_data
+    dynamodb, input_product_data, expected_dynamodb_data
 ):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
 
     for product in input_product_data:
         add_store_product(dynamodb, **product)
@@ -234,10 +250,7 @@ def test_update_store_product_tags(
     ]
 
 
-@moto.mock_dynamodb2
-def test_write_store_product_update(create_dynamodb_tables, input_product_data):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
+def test_write_store_product_update(dynamodb, input_product_data):
 
     # update non-existing products should result in errors
     for product in input_product_data:
@@ -272,15 +285,16 @@ def test_write_store_product_update(create_dynamodb_tables, input_product_data):
         'http://waffles.food/product/waffles?waffle=rofl'
     assert new_item_data.pop('product_type') == 'food'
     assert new_item_data.pop('vendor_name') == 'waffles 4 all'
+    assert new_item_data.pop('content_hash') != old_item_data.pop('content_hash')
+    assert new_item_data.pop('modified_at') > old_item_data.pop('modified_at')
+    new_item_data.pop('modified_shard')
+    old_item_data.pop('modified_shard')
 
     # validate all other attributes are unchanged
     assert old_item_data == new_item_data
 
 
-@moto.mock_dynamodb2
-def test_fetch_products_by_brand(create_dynamodb_tables, input_product_data):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
+def test_fetch_products_by_brand(dynamodb, input_product_data):
 
     n_products = 20
     brand_domains = ['abrand.com', 'bbrand.com']
@@ -309,10 +323,7 @@ def test_fetch_products_by_brand(create_dynamodb_tables, input_product_data):
         assert {p['brand_domain'] for p in products} == set([brand_domain])
 
 
-@moto.mock_dynamodb2
-def test_fetch_products_by_store(create_dynamodb_tables, input_product_data):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
+def test_fetch_products_by_store(dynamodb, input_product_data):
 
     n_products = 20
     store_domains = ['astore.com', 'bstore.com']
@@ -336,10 +347,140 @@ def test_fetch_products_by_store(create_dynamodb_tables, input_product_data):
         assert {p['store_domain'] for p in products} == set([store_domain])
 
 
-@moto.mock_dynamodb2
-def test_fetch_products_by_product_uuid(create_dynamodb_tables, input_product_data):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
+def test_fetch_products_hydrates_attributes_not_in_index(dynamodb, input_product_data):
+    for i in range(3):
+        add_store_product(
+            dynamodb,
+            product_url=f'https://astore.com/product-{i}',
+            store_domain='astore.com',
+            title=f'Product {i}',
+            description=f'Description {i}',
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+
+    # list view attributes are read from the index only
+    products = list(fetch_products_by_store(dynamodb, 'astore.com', only_attributes=['title']))
+    assert sorted(p['title'] for p in products) == ['Product 0', 'Product 1', 'Product 2']
+    assert all(set(p) == {'title'} for p in products)
+
+    products = list(fetch_products_by_store(
+        dynamodb, 'astore.com', only_attributes=['title', 'description']
+    ))
+    assert sorted((p['title'], p['description']) for p in products) == [
+        (f'Product {i}', f'Description {i}') for i in range(3)
+    ]
+    assert all(set(p) == {'title', 'description'} for p in products)
+
+    products = list(fetch_products_by_store(dynamodb, 'astore.com'))
+    assert all(p['scraper_type'] == 'generic_scraper' for p in products)
+
+
+def test_fetch_top_products(dynamodb, input_product_data):
+    positions = [5, 3, None, 12, 1, 8]
+    for i, position in enumerate(positions):
+        attrs = {} if position is None else {'best_selling_position': position}
+        add_store_product(
+            dynamodb,
+            product_url=f'https://astore.com/product-{i}',
+            store_domain='astore.com',
+            store_product_brand_domain='brand.com',
+            title=f'Product {i}',
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            **attrs
+        )
+
+    products = list(fetch_top_products_by_store(dynamodb, 'astore.com', n=3))
+    assert [p['best_selling_position'] for p in products] == [1, 3, 5]
+    assert products[0]['title'] == 'Product 4'
+
+    products = list(fetch_top_products_by_brand(
+        dynamodb, 'brand.com', n=10, only_attributes=['title', 'best_selling_position']
+    ))
+    assert [p['best_selling_position'] for p in products] == [1, 3, 5, 8, 12]
+
+    # ranks follow availability and position updates
+    update_store_product(dynamodb, 'https://astore.com/product-4', is_available=False)
+    update_store_product(dynamodb, 'https://astore.com/product-3', best_selling_position=2)
+    update_store_product(dynamodb, 'https://astore.com/product-2', best_selling_position=4)
+
+    products = list(fetch_top_products_by_store(dynamodb, 'astore.com', n=4))
+    assert [p['title'] for p in products] == ['Product 3', 'Product 1', 'Product 2', 'Product 0']
+
+    products = list(fetch_top_products_by_store(dynamodb, 'astore.com', is_available=False))
+    assert [p['title'] for p in products] == ['Product 4']
+
+
+def test_modified_keys():
+    keys = modified_keys('store.com/product', parse_dt('2020-06-01T05:30:00+02:00'))
+    assert keys['modified_at'] == '2020-06-01T03:30:00.000000+00:00'
+    assert keys['modified_shard'].startswith('2020-06-01T03#')
+    assert keys == modified_keys('store.com/product', parse_dt('2020-06-01T03:30:00'))
+
+    shards = modified_shards(
+        parse_dt('2020-06-01T03:59:00+00:00'), parse_dt('2020-06-01T05:00:00+00:00')
+    )
+    assert len(shards) == 3 * MODIFIED_SHARDS
+    assert keys['modified_shard'] in shards
+    assert shards[-1] == f'2020-06-01T05#{MODIFIED_SHARDS - 1:02d}'
+
+
+def test_iter_products_changed_since(dynamodb):
+    def changed_urls(since, until=None, **kwargs):
+        return sorted(
+            p['store_product_url'] for p in iter_products_changed_since(
+                dynamodb, since, until, overlap=timedelta(0), max_workers=4, **kwargs
+            )
+        )
+
+    start = datetime.now(timezone.utc)
+    for i in range(20):
+        add_store_product(
+            dynamodb,
+            product_url=f'https://astore.com/product-{i}',
+            store_domain='astore.com',
+            title=f'Product {i}',
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+    time.sleep(0.01)
+    added = datetime.now(timezone.utc)
+    time.sleep(0.01)
+    update_store_product(dynamodb, 'https://astore.com/product-3', vendor_name='vendor')
+    update_store_product(dynamodb, 'https://astore.com/product-7', is_available=False)
+
+    assert changed_urls(start) == sorted(f'astore.com/product-{i}' for i in range(20))
+    assert changed_urls(added) == ['astore.com/product-3', 'astore.com/product-7']
+    # (updated products are only reported at their last modified time)
+    assert len(changed_urls(start, added)) == 18
+    assert changed_urls(added + timedelta(hours=1)) == []
+    # (by default products modified shortly before "since" are read again)
+    assert len(list(iter_products_changed_since(dynamodb, added, max_workers=4))) == 20
+
+    products = list(iter_products_changed_since(
+        dynamodb, added, overlap=timedelta(0), only_attributes=['is_available', 'vendor_name']
+    ))
+    assert sorted(products, key=lambda p: p['is_available']) == [
+        dict(is_available=0), dict(is_available=1, vendor_name='vendor'),
+    ]
+
+
+def test_iter_products_changed_since_region(regional_dynamodb, add_products):
+    # (worker threads use resources in the region of "regional_dynamodb")
+    start = datetime.now(timezone.utc)
+    add_products(regional_dynamodb, 'astore.com', 3)
+    assert sorted(
+        p['store_product_url'] for p in iter_products_changed_since(
+            regional_dynamodb, start, overlap=timedelta(0), max_workers=4
+        )
+    ) == [f'astore.com/product-{i}' for i in range(3)]
+
+
+def test_fetch_products_by_product_uuid(dynamodb, input_product_data):
 
     n_products = 20
     store_domain = 'store.com'
@@ -368,12 +509,9 @@ def test_fetch_products_by_product_uuid(create_dynamodb_tables, input_product_da
         assert {p['product_uuid'] for p in products} == set([product_uuid.hex])
 
 
-@moto.mock_dynamodb2
 def test_delete_store_products(
-    create_dynamodb_tables, input_product_data, expected_dynamodb_data
+    dynamodb, input_product_data, expected_dynamodb_data
 ):
-    dynamodb = boto3.resource('dynamodb')
-    create_dynamodb_tables()
     to_delete = [
         'waffles.food/product/extra-waffles',
         'waffles.food/product/waffles',
@@ -391,3 +529,24 @@ def test_delete_store_products(
     for store_product_url in to_delete:
         assert get_store_product(dynamodb, store_product_url) is None
         assert len(list(fetch_product_tags(dynamodb, [store_product_url]))) == 0
+
+
+def test_migrated_index_projections(dynamodb):
+    # (migrations hard-code their index projections, the current ones must
+    # match "indexes")
+    table = dynamodb.meta.client.describe_table(TableName=get_table_name('product'))['Table']
+    projections = {
+        index['IndexName']: index['Projection'].get('NonKeyAttributes', [])
+        for index in table['GlobalSecondaryIndexes']
+    }
+    # (replaced indexes are deleted)
+    assert not {
+        'product_uuid_idx', 'brand_domain_idx', 'store_domain_idx', 'store_domain_list_idx'
+    } & set(projections)
+    for index_name in ALL_PRODUCT_INDEX_KEYS:
+        assert sorted(projections[index_name]) == sorted(non_key_attributes(index_name))
+
+    table = dynamodb.meta.client.describe_table(TableName=get_table_name('product_tag'))['Table']
+    assert sorted(index['IndexName'] for index in table['GlobalSecondaryIndexes']) == [
+        'image_not_indexed_list_idx', 'tag_queue_idx', 'update_product_meta_list_idx',
+    ]
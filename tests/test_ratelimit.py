@@ -0,0 +1,151 @@
+import botocore.exceptions
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product import batch, ratelimit
+from charm_product.backends import MemoryDynamoDB
+from charm_product.batch import BatchWriter
+from charm_product.product import (
+    add_store_product,
+    count_products_by_store,
+    fetch_products_by_store,
+)
+from charm_product.tag import ProductTag, fetch_product_tags, set_product_tag
+from charm_product.ratelimit import (
+    AdaptiveRateLimiter,
+    rate_limited,
+    set_rate_limiter,
+)
+
+
+@pytest.fixture()
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ratelimit.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(batch.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+@pytest.fixture()
+def rate_limiter():
+    rate_limiter = AdaptiveRateLimiter(rate=100, min_rate=10, max_rate=102)
+    set_rate_limiter(rate_limiter)
+    yield rate_limiter
+    set_rate_limiter(None)
+
+
+def client_error(code):
+    return botocore.exceptions.ClientError(
+        {'Error': {'Code': code, 'Message': code}}, 'PutItem'
+    )
+
+
+def test_aimd(rate_limiter):
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == 50
+    for _ in range(3):
+        rate_limiter.on_throttle()
+    assert rate_limiter.rate == 10
+    assert rate_limiter.throttle_count == 4
+
+    rate_limiter.rate = 100
+    for _ in range(5):
+        rate_limiter.on_success()
+    assert rate_limiter.rate == 102
+
+
+def test_acquire_paces_requests(rate_limiter, sleeps):
+    rate_limiter.acquire(100)
+    assert not sleeps
+    rate_limiter.acquire(50)
+    assert len(sleeps) == 1 and sleeps[0] == pytest.approx(0.5, abs=0.01)
+
+
+def test_rate_limited_retries_throttling(rate_limiter, sleeps):
+    calls = []
+
+    def put_item(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise client_error('ProvisionedThroughputExceededException')
+        return {}
+
+    assert rate_limited(put_item)(Item={'a': 1}) == {}
+    assert len(calls) == 3
+    # backoff delays (between pacing delays after throttling)
+    assert 0.05 in sleeps and 0.1 in sleeps
+    assert rate_limiter.throttle_count == 2
+
+
+def test_rate_limited_other_errors(sleeps):
+    def put_item(**kwargs):
+        raise client_error('ConditionalCheckFailedException')
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        rate_limited(put_item)(Item={'a': 1})
+    assert not sleeps
+
+
+def test_rate_limited_gives_up(sleeps):
+    def put_item(**kwargs):
+        raise client_error('ThrottlingException')
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        rate_limited(put_item)(Item={'a': 1})
+    assert len(sleeps) == ratelimit.THROTTLE_RETRY_ATTEMPTS - 1
+
+
+def test_batch_writer_unprocessed_items(rate_limiter, sleeps):
+    class DynamoDB:
+        def __init__(self):
+            self.requests = []
+
+        def batch_write_item(self, RequestItems):
+            requests = RequestItems['items']
+            self.requests.append(len(requests))
+            if len(self.requests) == 1:
+                return {'UnprocessedItems': {'items': requests[10:]}}
+            return {}
+
+    dynamodb = DynamoDB()
+    with BatchWriter(dynamodb, 'items', 'test') as writer:
+        for i in range(25):
+            writer.put_item(Item={'id': i})
+
+    assert dynamodb.requests == [25, 15]
+    assert rate_limiter.throttle_count == 1
+    # 100 + 1 (success) -> 50.5 (unprocessed items) + 1 (success)
+    assert rate_limiter.rate == 51.5
+
+
+def test_queries_retry_throttling(create_dynamodb_tables, sleeps):
+    dynamodb = MemoryDynamoDB()
+    create_dynamodb_tables(dynamodb)
+    add_store_product(
+        dynamodb,
+        product_url='https://store.com/product',
+        store_domain='store.com',
+        title='Product',
+        scraper_type='generic_scraper',
+        first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+    )
+    set_product_tag(dynamodb, 'store.com/product', ProductTag.update_product_meta)
+
+    client = dynamodb.meta.client
+    query = client.query
+    calls = []
+
+    def throttled_query(**kwargs):
+        calls.append(kwargs)
+        if len(calls) % 2:
+            raise client.exceptions.ProvisionedThroughputExceededException(
+                {'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'Query'
+            )
+        return query(**kwargs)
+
+    client.query = throttled_query
+    assert count_products_by_store(dynamodb, 'store.com') == 1
+    assert len(list(fetch_products_by_store(dynamodb, 'store.com'))) == 1
+    assert len(list(fetch_product_tags(dynamodb, ['store.com/product']))) == 1
+    assert len(calls) == 6
@@ -0,0 +1,73 @@
+import json
+import pickle
+import pytest
+import sys
+from ciso8601 import parse_datetime as parse_dt
+from decimal import Decimal
+
+from charm_product.product import add_store_product, fetch_products_by_store
+from charm_product.record import StoreProduct
+
+
+def test_store_product_record():
+    product = StoreProduct.from_item({
+        'store_product_url': 'store.com/product-1',
+        'store_domain': ''.join(['store', '.com']),
+        'is_available': Decimal(1),
+        'title': 'Product 1',
+        'description': 'A product ✓',
+        'json_data': json.dumps({'a': 1}),
+        'best_selling_position': Decimal(3),
+        'primary_price': Decimal('9.99'),
+        'custom_attribute': 'x',
+    })
+
+    assert product.is_available is True
+    assert product.best_selling_position == 3
+    assert product.primary_price == Decimal('9.99')
+    assert product.description == 'A product ✓'
+    assert json.loads(product['json_data']) == {'a': 1}
+    assert product.store_domain is sys.intern('store.com')
+    assert product.custom_attribute == 'x'
+    assert product['custom_attribute'] == 'x'
+    assert 'description' in product
+    assert 'custom_attribute' in product
+    assert 'not_an_attribute' not in product
+
+    # unset attributes
+    assert product.brand_domain is None
+    assert 'brand_domain' not in product
+    assert product.get('brand_domain', 'default') == 'default'
+    with pytest.raises(KeyError):
+        product['brand_domain']
+    with pytest.raises(AttributeError):
+        product.not_an_attribute
+
+    assert product.to_dict() == dict(product)
+    assert pickle.loads(pickle.dumps(product)) == product
+    assert not hasattr(product, '__dict__')
+
+
+def test_fetch_products_as_records(dynamodb):
+    for i in range(3):
+        add_store_product(
+            dynamodb,
+            product_url=f'https://store.com/product-{i}',
+            store_domain='store.com',
+            title=f'Product {i}',
+            description=f'Description {i}',
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+
+    items = sorted(
+        fetch_products_by_store(dynamodb, 'store.com'),
+        key=lambda p: p['store_product_url'],
+    )
+    records = sorted(
+        fetch_products_by_store(dynamodb, 'store.com', as_records=True),
+        key=lambda p: p.store_product_url,
+    )
+    assert all(isinstance(r, StoreProduct) for r in records)
+    assert [r.to_dict() for r in records] == items
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import pytest
+
+from charm_product.backends import MemoryDynamoDB, SQLiteDynamoDB
+from charm_product.product import (
+    delete_store_products,
+    fetch_products_by_store,
+    get_store_product,
+    update_store_product,
+)
+from charm_product.replica import ProductReplica
+
+
+def test_replica(dynamodb, tmp_path, monkeypatch, add_products):
+    add_products(dynamodb, 'astore.com', 5, store_product_brand_domain='brand.com')
+    add_products(dynamodb, 'bstore.com', 3)
+
+    path = str(tmp_path / 'replica.db')
+    replica = ProductReplica(SQLiteDynamoDB(path))
+    assert replica.synced_until is None
+    with pytest.raises(ValueError):
+        replica.sync(dynamodb)
+
+    assert replica.bootstrap(dynamodb, total_segments=1) == dict(copied=8, removed=0)
+    assert replica.get_store_product('https://astore.com/product-1') == \
+        get_store_product(dynamodb, 'https://astore.com/product-1')
+    assert replica.get_store_product('https://astore.com/missing') is None
+    assert sorted(p['title'] for p in replica.fetch_products_by_store('bstore.com')) == [
+        'Product 0', 'Product 1', 'Product 2',
+    ]
+    assert len(list(replica.fetch_products_by_brand('brand.com'))) == 5
+    product_uuid = replica.get_store_product('bstore.com/product-0')['product_uuid']
+    assert [
+        p['store_product_url'] for p in replica.fetch_products_by_product_uuid(product_uuid)
+    ] == ['bstore.com/product-0']
+    assert [
+        p['title'] for p in replica.fetch_top_products_by_store('astore.com', n=2)
+    ] == ['Product 0', 'Product 1']
+    assert replica.count_products_by_brand('brand.com') == 5
+
+    update_store_product(dynamodb, 'https://astore.com/product-0', is_available=False)
+    update_store_product(dynamodb, 'https://bstore.com/product-1', vendor_name='vendor')
+    add_products(dynamodb, 'cstore.com', 2)
+
+    # (reopened from the database file)
+    replica = ProductReplica(SQLiteDynamoDB(path))
+    synced_until = replica.synced_until
+    # (all products were written within the default overlap)
+    monkeypatch.setattr('charm_product.replica.SYNC_OVERLAP', timedelta(0))
+    assert replica.sync(dynamodb, max_workers=4) == dict(copied=4)
+    assert replica.synced_until > synced_until
+    assert replica.count_products_by_store('astore.com') == 4
+    assert replica.count_products_by_store('cstore.com') == 2
+    assert replica.get_store_product('bstore.com/product-1')['vendor_name'] == 'vendor'
+    assert [
+        p['title'] for p in replica.fetch_top_products_by_store('astore.com', n=1)
+    ] == ['Product 1']
+    assert sorted(
+        p['store_product_url'] for p in replica.fetch_products_by_store('bstore.com')
+    ) == sorted(p['store_product_url'] for p in fetch_products_by_store(dynamodb, 'bstore.com'))
+
+    # deleted products are removed by bootstrapping again
+    delete_store_products(dynamodb, ['astore.com/product-4'])
+    assert replica.bootstrap(dynamodb, total_segments=1) == dict(copied=9, removed=1)
+    assert replica.get_store_product('astore.com/product-4') is None
+
+
+def test_replica_memory_backend(dynamodb, add_products):
+    add_products(dynamodb, 'astore.com', 3)
+    replica = ProductReplica(MemoryDynamoDB())
+    replica.bootstrap(dynamodb, total_segments=1)
+    assert replica.count_products_by_store('astore.com') == 3
+    assert replica.count_products_by_store('astore.com', is_available=False) == 0
+
+
+def test_replica_bootstrap_region(regional_dynamodb, add_products):
+    # (worker threads use resources in the region of "regional_dynamodb")
+    add_products(regional_dynamodb, 'astore.com', 3)
+    replica = ProductReplica(MemoryDynamoDB())
+    assert replica.bootstrap(regional_dynamodb, total_segments=1) == dict(copied=3, removed=0)
@@ -0,0 +1,110 @@
+import json
+
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product.product import add_store_product
+from charm_product.search import SearchIndex, main, tokenize
+from charm_product.validation import contains_blacklist_tokens, format_token_group_regexes
+
+
+PRODUCTS = [
+    dict(store_product_url='astore.com/gift-card', title='$50 Gift Card', vendor_name='A Store'),
+    dict(store_product_url='astore.com/card-gift', title='Card - Gift Wrap', vendor_name='A'),
+    dict(store_product_url='bstore.com/egift', title='eGift_Card', vendor_name='Gift Co'),
+    dict(store_product_url='bstore.com/shirt', title='Cotton Shirt', vendor_name='B Store'),
+    dict(store_product_url='cstore.com/no-vendor', title='GIFT CARD (digital)'),
+]
+
+
+def test_tokenize():
+    assert tokenize('$50 Gift-Card_(Blue)') == '50 gift card blue'
+    assert tokenize(None) == ''
+
+
+def test_search():
+    with SearchIndex() as index:
+        assert index.update(PRODUCTS) == dict(added=5, updated=0, unchanged=0, removed=0)
+        assert len(index) == 5
+
+        assert index.search('gift card') == ['astore.com/gift-card', 'cstore.com/no-vendor']
+        assert index.search('Gift  CARD') == index.search('gift card')
+        assert index.search('card gift') == ['astore.com/card-gift']
+        assert index.search('egift card') == ['bstore.com/egift']
+        assert index.search('gift') == [
+            'astore.com/card-gift', 'astore.com/gift-card', 'cstore.com/no-vendor',
+        ]
+        assert index.search('gift', limit=1) == ['astore.com/card-gift']
+        assert index.search('missing token') == []
+        assert index.search('--') == []
+        assert index.search('gift', field='vendor_name') == ['bstore.com/egift']
+
+        assert index.search_token_groups(['gift card', 'cotton shirt']) == {
+            'gift card': ['astore.com/gift-card', 'cstore.com/no-vendor'],
+            'cotton shirt': ['bstore.com/shirt'],
+        }
+
+
+def test_search_matches_blacklist_tokens():
+    token_groups = ['gift card', 'egift card', 'card', 'gift wrap', 'cotton']
+    regexes = format_token_group_regexes(token_groups)
+    with SearchIndex() as index:
+        index.update(PRODUCTS)
+        for token_group, regex in zip(token_groups, regexes):
+            assert index.search(token_group) == sorted(
+                p['store_product_url'] for p in PRODUCTS
+                if contains_blacklist_tokens(p['title'], [regex])[0]
+            )
+
+
+def test_update_incremental(tmp_path):
+    path = str(tmp_path / 'search.db')
+    with SearchIndex(path) as index:
+        index.update(PRODUCTS)
+
+    products = [dict(p) for p in PRODUCTS[1:]]
+    products[0]['title'] = 'Gift Card Holder'
+    with SearchIndex(path) as index:
+        report = index.update(products, complete=True)
+        assert report == dict(added=0, updated=1, unchanged=3, removed=1)
+        assert len(index) == 4
+        assert index.search('gift card') == ['astore.com/card-gift', 'cstore.com/no-vendor']
+        assert index.search('wrap') == []
+
+        assert index.update([dict(store_product_url='dstore.com/card', title='Card')]) == dict(
+            added=1, updated=0, unchanged=0, removed=0
+        )
+        assert index.remove(['dstore.com/card', 'dstore.com/missing']) == 1
+        assert index.search('card') == [
+            'astore.com/card-gift', 'bstore.com/egift', 'cstore.com/no-vendor',
+        ]
+
+
+def test_main(dynamodb, tmp_path, monkeypatch, capsys):
+    export_path = tmp_path / 'export.jsonl'
+    export_path.write_text(''.join(json.dumps(p) + '\n' for p in PRODUCTS))
+    path = str(tmp_path / 'search.db')
+
+    main([path, 'build', '--export', str(export_path)])
+    assert json.loads(capsys.readouterr().out)['added'] == 5
+    main([path, 'query', 'gift card', 'b store', '--field', 'vendor_name'])
+    assert json.loads(capsys.readouterr().out) == {
+        'gift card': [], 'b store': ['bstore.com/shirt'],
+    }
+
+    # build from a table scan
+    add_store_product(
+        dynamodb,
+        product_url='https://dstore.com/gift-box',
+        store_domain='dstore.com',
+        title='Gift Box',
+        scraper_type='generic_scraper',
+        first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+    )
+    monkeypatch.setattr('boto3.resource', lambda *args, **kwargs: dynamodb)
+    main([path, 'build'])
+    assert json.loads(capsys.readouterr().out) == dict(
+        added=1, updated=0, unchanged=0, removed=5
+    )
+    main([path, 'query', 'gift box'])
+    assert json.loads(capsys.readouterr().out) == {'gift box': ['dstore.com/gift-box']}
@@ -0,0 +1,117 @@
+import boto3
+import moto
+import os
+import threading
+
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product import session
+from charm_product.backends import MemoryDynamoDB
+from charm_product.product import add_store_product, get_store_product
+from charm_product.session import (
+    ResourceFactory,
+    get_resource,
+    parallel_map,
+    parallel_resources,
+    process_map,
+)
+
+
+def add_product(dynamodb, i):
+    add_store_product(
+        dynamodb,
+        product_url=f'https://store.com/product-{i}',
+        store_domain='store.com',
+        title=f'Product {i}',
+        scraper_type='generic_scraper',
+        first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+    )
+    return i
+
+
+def get_client_type(dynamodb, item):
+    return type(dynamodb.meta.client).__name__, item
+
+
+def test_resource_per_thread():
+    factory = ResourceFactory(max_pool_connections=64)
+    resources = []
+
+    def get():
+        resources.append(factory.resource())
+        resources.append(factory.resource())
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(r) for r in resources}) == 3
+    assert all(r.meta.client is factory.client() for r in resources)
+    assert factory.client().meta.config.max_pool_connections == 64
+
+
+def test_resource_after_fork(monkeypatch):
+    factory = ResourceFactory()
+    client = factory.client()
+    dynamodb = factory.resource()
+
+    pid = os.getpid()
+    monkeypatch.setattr(session.os, 'getpid', lambda: pid + 1)
+    assert factory.client() is not client
+    assert factory.resource() is not dynamodb
+    assert factory.resource().meta.client is factory.client()
+
+
+def test_parallel_map(create_dynamodb_tables):
+    with moto.mock_dynamodb2():
+        create_dynamodb_tables(get_resource())
+        assert parallel_map(add_product, range(20), max_workers=8) == list(range(20))
+        for i in range(20):
+            assert get_store_product(get_resource(), f'store.com/product-{i}')
+
+
+def test_parallel_map_shared_dynamodb(create_dynamodb_tables):
+    dynamodb = MemoryDynamoDB()
+    create_dynamodb_tables(dynamodb)
+    parallel_map(add_product, range(10), max_workers=4, dynamodb=dynamodb)
+    assert get_store_product(dynamodb, 'store.com/product-9')
+
+
+def test_parallel_resources():
+    local_dynamodb = MemoryDynamoDB()
+    assert parallel_resources(local_dynamodb) == dict(factory=None, dynamodb=local_dynamodb)
+
+    with moto.mock_dynamodb2():
+        resources = parallel_resources(get_resource(), max_workers=64)
+    assert resources['dynamodb'] is None
+    assert resources['factory'].max_pool_connections == 64
+
+    factory = ResourceFactory()
+    assert parallel_resources(local_dynamodb, factory) == dict(factory=factory, dynamodb=None)
+
+
+def test_factory_from_resource():
+    with moto.mock_dynamodb2():
+        dynamodb = boto3.resource(
+            'dynamodb', region_name='eu-west-1', endpoint_url='http://localhost:8000',
+            aws_access_key_id='AKIA1111111111111111', aws_secret_access_key='secret',
+        )
+        factory = ResourceFactory.from_resource(dynamodb, max_pool_connections=64)
+        client = factory.resource().meta.client
+        assert client.meta.region_name == 'eu-west-1'
+        assert client.meta.endpoint_url == 'http://localhost:8000'
+        assert client.meta.config.max_pool_connections == 64
+        assert client._get_credentials().access_key == 'AKIA1111111111111111'
+
+        resources = parallel_resources(dynamodb)
+        assert resources['factory'].region_name == 'eu-west-1'
+        assert resources['factory'].credentials.access_key == 'AKIA1111111111111111'
+
+
+def test_process_map():
+    assert process_map(get_client_type, range(4), processes=2) == [
+        ('DynamoDB', i) for i in range(4)
+    ]
@@ -0,0 +1,169 @@
+import concurrent.futures
+import pickle
+import struct
+from decimal import Decimal
+
+import pytest
+from ciso8601 import parse_datetime as parse_dt
+
+from charm_product import snapshot as snapshot_module
+from charm_product.product import add_store_product, get_store_product, scan_products
+from charm_product.record import StoreProduct
+from charm_product.snapshot import SECTIONS, ProductSnapshot, write_snapshot
+
+
+PRODUCTS = [
+    dict(
+        store_product_url=f'{store}/product-{i}',
+        store_domain=store,
+        title=f'Product {i} ü',
+        primary_price=Decimal('9.99') + i,
+        is_available=True,
+        **({'brand_domain': 'brand.com'} if i % 2 else {})
+    )
+    for store in ['bstore.com', 'astore.com', 'cstore.com']
+    for i in range(5)
+]
+
+
+def snapshot_titles(products):
+    return [p['title'] for p in products]
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / 'products.snap')
+    assert write_snapshot(path, PRODUCTS) == 15
+
+    with ProductSnapshot(path) as snapshot:
+        assert len(snapshot) == 15
+        assert snapshot.get_store_product('https://astore.com/product-3') == PRODUCTS[8]
+        assert snapshot.get_store_product('bstore.com/product-0') == PRODUCTS[0]
+        assert snapshot.get_store_product('astore.com/missing') is None
+        assert snapshot.get_store_product('zstore.com/product-0') is None
+        assert 'http://cstore.com/product-4?q=1' in snapshot
+        assert 'aastore.com/product-0' not in snapshot
+
+        record = snapshot.get_store_product('cstore.com/product-1', as_records=True)
+        assert isinstance(record, StoreProduct)
+        assert record.brand_domain == 'brand.com'
+
+        assert list(snapshot.store_product_urls()) == sorted(
+            p['store_product_url'] for p in PRODUCTS
+        )
+        assert len(list(snapshot.scan_products())) == 15
+        assert snapshot.store_domains() == ['astore.com', 'bstore.com', 'cstore.com']
+        assert snapshot.brand_domains() == ['brand.com']
+        assert snapshot_titles(snapshot.fetch_products_by_store('bstore.com')) == [
+            f'Product {i} ü' for i in range(5)
+        ]
+        assert [
+            p['store_product_url'] for p in snapshot.fetch_products_by_brand('brand.com')
+        ] == [
+            f'{store}/product-{i}'
+            for store in ['astore.com', 'bstore.com', 'cstore.com'] for i in [1, 3]
+        ]
+        assert list(snapshot.fetch_products_by_store('missing.com')) == []
+        assert list(snapshot.fetch_products_by_brand('a.com')) == []
+
+
+def test_snapshot_availability(tmp_path):
+    path = str(tmp_path / 'products.snap')
+    products = [
+        dict(product, is_available=product['title'] != 'Product 1 ü') for product in PRODUCTS
+    ]
+    write_snapshot(path, products)
+
+    with ProductSnapshot(path) as snapshot:
+        assert len(list(snapshot.fetch_products_by_store('astore.com'))) == 4
+        assert [
+            p['store_product_url']
+            for p in snapshot.fetch_products_by_store('astore.com', is_available=False)
+        ] == ['astore.com/product-1']
+        assert len(list(snapshot.fetch_products_by_store('astore.com', is_available=None))) == 5
+        assert len(list(snapshot.fetch_products_by_brand('brand.com'))) == 3
+        assert snapshot.get_store_product('astore.com/product-1')['is_available'] is False
+
+
+def test_snapshot_byte_order(tmp_path, monkeypatch):
+    path = str(tmp_path / 'products.snap')
+    write_snapshot(path, PRODUCTS)
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = struct.unpack_from('<8sIQ' + 'QQ' * len(SECTIONS), data)
+    n = SECTIONS.index('key_offsets')
+    offset, length = header[3 + 2 * n:5 + 2 * n]
+    key_offsets = struct.unpack_from(f'<{length // 8}Q', data, offset)
+    assert key_offsets[0] == 0
+    assert list(key_offsets) == sorted(key_offsets)
+
+    # (arrays are byte swapped on big-endian hosts)
+    monkeypatch.setattr(snapshot_module.sys, 'byteorder', 'big')
+    write_snapshot(path, PRODUCTS)
+    with open(path, 'rb') as f:
+        assert f.read() != data
+    with ProductSnapshot(path) as snapshot:
+        assert snapshot.get_store_product('https://astore.com/product-3') == PRODUCTS[8]
+        assert snapshot_titles(snapshot.fetch_products_by_store('bstore.com')) == [
+            f'Product {i} ü' for i in range(5)
+        ]
+
+
+def test_snapshot_empty(tmp_path):
+    path = str(tmp_path / 'products.snap')
+    assert write_snapshot(path, []) == 0
+    with ProductSnapshot(path) as snapshot:
+        assert len(snapshot) == 0
+        assert snapshot.get_store_product('astore.com/product-0') is None
+        assert snapshot.store_domains() == []
+        assert list(snapshot.fetch_products_by_store('astore.com')) == []
+
+
+def test_snapshot_errors(tmp_path):
+    path = str(tmp_path / 'products.snap')
+    with pytest.raises(ValueError):
+        write_snapshot(path, PRODUCTS + PRODUCTS[:1])
+    assert list(tmp_path.iterdir()) == []
+
+    (tmp_path / 'other.snap').write_bytes(b'not a snapshot' * 100)
+    with pytest.raises(ValueError):
+        ProductSnapshot(str(tmp_path / 'other.snap'))
+
+
+def _worker_lookup(snapshot, url):
+    return snapshot.get_store_product(url)['title']
+
+
+def test_snapshot_worker_processes(tmp_path):
+    path = str(tmp_path / 'products.snap')
+    write_snapshot(path, PRODUCTS)
+
+    with ProductSnapshot(path) as snapshot:
+        assert pickle.loads(pickle.dumps(snapshot)).path == path
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            titles = list(executor.map(
+                _worker_lookup, [snapshot] * 3,
+                ['astore.com/product-0', 'bstore.com/product-1', 'cstore.com/product-2'],
+            ))
+    assert titles == ['Product 0 ü', 'Product 1 ü', 'Product 2 ü']
+
+
+def test_snapshot_from_scan(dynamodb, tmp_path):
+    for i in range(3):
+        add_store_product(
+            dynamodb,
+            product_url=f'https://astore.com/product-{i}',
+            store_domain='astore.com',
+            title=f'Product {i}',
+            description='description ' * 100,
+            scraper_type='generic_scraper',
+            first_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+            last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+        )
+
+    path = str(tmp_path / 'products.snap')
+    write_snapshot(path, scan_products(dynamodb, as_records=True))
+    with ProductSnapshot(path) as snapshot:
+        product = snapshot.get_store_product('astore.com/product-1')
+        expected = get_store_product(dynamodb, 'astore.com/product-1')
+        expected['is_available'] = bool(expected['is_available'])
+        assert product == expected
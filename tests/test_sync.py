@@ -0,0 +1,148 @@
+from ciso8601 import parse_datetime as parse_dt
+from decimal import Decimal
+
+from charm_product.product import add_store_product, get_store_product, update_store_product
+from charm_product.counter import get_store_product_count
+from charm_product.sync import sync_store
+from charm_product.validation import content_hash, parse_store_product_data
+
+
+def scraped_product(i, **attrs):
+    product = dict(
+        product_url=f'https://store.com/product-{i}?ref=scrape',
+        title=f'Product {i}',
+        primary_price='10.00',
+        best_selling_position=i + 1,
+        image_urls=[f'https://store.com/images/product-{i}'],
+        scraper_type='generic_scraper',
+        first_scraped_at=parse_dt('2020-06-02T00:00:01+00:00'),
+        last_scraped_at=parse_dt('2020-06-02T00:00:01+00:00'),
+    )
+    product.update(attrs)
+    return product
+
+
+# "scraped_product" as stored by the scrape of the previous day
+PREVIOUS_SCRAPE = dict(
+    product_url=lambda i: f'https://store.com/product-{i}?ref=scrape',
+    primary_price='10.00',
+)
+
+
+def test_content_hash():
+    item_data = parse_store_product_data(dict(
+        store_product_url='store.com/product',
+        full_store_product_url='https://store.com/product',
+        store_domain='store.com',
+        title='Product',
+        primary_price='10.00',
+        best_selling_position=3,
+        last_scraped_at=parse_dt('2020-06-01T00:00:01+00:00'),
+    ), new_item=False)
+    stored = dict(
+        item_data,
+        primary_price=Decimal('10'),
+        best_selling_position=Decimal('3'),
+        last_scraped_at='2020-06-02T00:00:01+00:00',
+        is_available=Decimal('0'),
+    )
+    assert content_hash(item_data) == content_hash(stored)
+    assert content_hash(item_data) != content_hash(dict(item_data, title='Other'))
+
+
+def test_sync_store(dynamodb, add_products):
+    add_products(dynamodb, 'store.com', 4, **PREVIOUS_SCRAPE)
+    update_store_product(
+        dynamodb, 'https://store.com/product-3?ref=scrape', is_available=False
+    )
+
+    report = sync_store(dynamodb, 'store.com', [
+        # unchanged
+        scraped_product(0),
+        # changed
+        scraped_product(1, primary_price='12.00'),
+        # unavailable
+        scraped_product(3),
+        # new
+        scraped_product(4),
+        # invalid
+        dict(scraped_product(5), title='Gift Card'),
+    ], removed_at=parse_dt('2020-06-02T00:00:01+00:00'))
+    # (product 2 removed)
+
+    assert report['added'] == 1
+    assert report['updated'] == 2
+    assert report['removed'] == 1
+    assert report['unchanged'] == 1
+    assert list(report['errors']) == ['https://store.com/product-5?ref=scrape']
+
+    product = get_store_product(dynamodb, 'https://store.com/product-0')
+    assert product['last_scraped_at'] == '2020-06-01T00:00:01+00:00'
+
+    product = get_store_product(dynamodb, 'https://store.com/product-1')
+    assert product['primary_price'] == Decimal('12')
+    assert product['first_scraped_at'] == '2020-06-01T00:00:01+00:00'
+    assert product['last_scraped_at'] == '2020-06-02T00:00:01+00:00'
+
+    product = get_store_product(dynamodb, 'https://store.com/product-2')
+    assert product['is_available'] == 0
+    assert product['removed_at'] == '2020-06-02T00:00:01+00:00'
+    assert product['full_store_product_url'] == 'https://store.com/product-2?ref=scrape'
+
+    assert get_store_product(dynamodb, 'https://store.com/product-3')['is_available'] == 1
+    assert get_store_product(dynamodb, 'https://store.com/product-4')['is_available'] == 1
+    assert get_store_product(dynamodb, 'https://store.com/product-5') is None
+
+    # a repeated sync does not write
+    report = sync_store(dynamodb, 'store.com', [
+        scraped_product(0),
+        scraped_product(1, primary_price='12.00'),
+        scraped_product(3),
+        scraped_product(4),
+    ])
+    assert report == dict(added=0, updated=0, removed=0, unchanged=4, errors={})
+
+
+def test_sync_store_missing_attributes(dynamodb):
+    for i in range(3):
+        add_store_product(
+            dynamodb, store_domain='store.com', description='Description',
+            **scraped_product(i)
+        )
+
+    # (the stored description is kept, and not compared by later syncs)
+    report = sync_store(dynamodb, 'store.com', [scraped_product(i) for i in range(3)])
+    assert report['updated'] == 3
+    report = sync_store(dynamodb, 'store.com', [scraped_product(i) for i in range(3)])
+    assert report == dict(added=0, updated=0, removed=0, unchanged=3, errors={})
+    assert get_store_product(dynamodb, 'store.com/product-0')['description'] == 'Description'
+
+
+def test_sync_store_relisted(dynamodb, add_products):
+    add_products(dynamodb, 'store.com', 2, **PREVIOUS_SCRAPE)
+
+    report = sync_store(dynamodb, 'store.com', [scraped_product(0)])
+    assert report['removed'] == 1
+    assert get_store_product(dynamodb, 'store.com/product-1')['removed_at']
+
+    report = sync_store(dynamodb, 'store.com', [scraped_product(0), scraped_product(1)])
+    assert report['updated'] == 1
+    product = get_store_product(dynamodb, 'store.com/product-1')
+    assert product['is_available'] == 1
+    assert 'removed_at' not in product
+
+
+def test_sync_store_existing_product(dynamodb, product_counters):
+    # (missing from the store index read, e.g. stored with another store domain)
+    add_store_product(dynamodb, store_domain='www.store.com', **scraped_product(0))
+    product_uuid = get_store_product(dynamodb, 'store.com/product-0')['product_uuid']
+
+    report = sync_store(dynamodb, 'store.com', [scraped_product(0), scraped_product(1)])
+    assert report['added'] == 1
+    assert report['updated'] == 1
+    assert get_store_product(dynamodb, 'store.com/product-0')['product_uuid'] == product_uuid
+    assert get_store_product_count(dynamodb, 'store.com') == 1
+    assert get_store_product_count(dynamodb, 'www.store.com') == 1
+
+    report = sync_store(dynamodb, 'store.com', [scraped_product(0), scraped_product(1)])
+    assert report == dict(added=0, updated=0, removed=0, unchanged=2, errors={})
@@ -0,0 +1,130 @@
+from charm_product.product import (
+    delete_store_products,
+    get_store_product,
+    update_store_product,
+)
+from charm_product.tag import (
+    TAG_QUEUE_SHARDS,
+    ProductTag,
+    ProductTagBuffer,
+    claim_product_tags,
+    delete_product_tags,
+    fetch_product_tags,
+    release_product_tags,
+    worker_tag_shards,
+)
+
+
+def test_worker_tag_shards():
+    n_workers = 3
+    shards = [worker_tag_shards(i, n_workers) for i in range(n_workers)]
+
+    assert sorted(s for worker_shards in shards for s in worker_shards) == \
+        list(range(TAG_QUEUE_SHARDS))
+
+
+def test_claim_product_tags(dynamodb, add_products):
+
+    n_products = 20
+    add_products(dynamodb, 'store.com', n_products)
+
+    claimed = [
+        claim_product_tags(
+            dynamodb, ProductTag.image_not_indexed, f'worker-{i}',
+            shards=worker_tag_shards(i, 2),
+        )
+        for i in range(2)
+    ]
+    claimed_urls = [{t['store_product_url'] for t in c} for c in claimed]
+
+    # workers claim disjoint sets of products covering all tagged products
+    assert claimed_urls[0].isdisjoint(claimed_urls[1])
+    assert len(claimed_urls[0] | claimed_urls[1]) == n_products
+    assert {t['lease_owner'] for t in claimed[0]} == {'worker-0'}
+    assert all('image_url' in t for c in claimed for t in c)
+
+    # leased tags cannot be claimed by other workers
+    assert claim_product_tags(dynamodb, ProductTag.image_not_indexed, 'worker-2') == []
+
+    # released tags can be claimed again
+    release_product_tags(
+        dynamodb, ProductTag.image_not_indexed, claimed_urls[0], 'worker-0'
+    )
+    reclaimed = claim_product_tags(dynamodb, ProductTag.image_not_indexed, 'worker-2')
+    assert {t['store_product_url'] for t in reclaimed} == claimed_urls[0]
+
+    # acknowledged (deleted) tags are removed from the queue
+    delete_product_tags(dynamodb, ProductTag.image_not_indexed, claimed_urls[1])
+    release_product_tags(
+        dynamodb, ProductTag.image_not_indexed, claimed_urls[0], 'worker-2'
+    )
+    remaining = claim_product_tags(dynamodb, ProductTag.image_not_indexed, 'worker-3')
+    assert {t['store_product_url'] for t in remaining} == claimed_urls[0]
+
+
+def test_claim_product_tags_limit_and_lease_expiry(dynamodb, add_products):
+
+    add_products(dynamodb, 'store.com', 10)
+
+    first = claim_product_tags(
+        dynamodb, ProductTag.update_product_meta, 'worker-0', limit=4, lease_seconds=-1,
+    )
+    assert len(first) == 4
+
+    # expired leases may be claimed by any worker
+    second = claim_product_tags(dynamodb, ProductTag.update_product_meta, 'worker-1')
+    assert len(second) == 10
+    assert {t['lease_owner'] for t in second} == {'worker-1'}
+
+
+def test_product_tag_buffer(dynamodb, add_products):
+
+    with ProductTagBuffer(dynamodb) as tag_buffer:
+        product_urls = add_products(dynamodb, 'store.com', 5, tag_buffer=tag_buffer)
+
+        # re-tagging the same product is de-duplicated (last write wins)
+        update_store_product(
+            dynamodb, product_urls[0],
+            image_urls=['https://store.com/images/new-image'],
+            tag_buffer=tag_buffer,
+        )
+        assert len(tag_buffer) == 10
+
+        # tags are not written until the buffer is flushed
+        assert list(fetch_product_tags(dynamodb, product_urls)) == []
+
+    assert len(tag_buffer) == 0
+    tags = list(fetch_product_tags(dynamodb, product_urls, ProductTag.image_not_indexed))
+    assert len(tags) == 5
+    assert [t['image_url'] for t in tags if t['store_product_url'] == 'store.com/product-0'] == \
+        ['https://store.com/images/new-image']
+    assert len(list(fetch_product_tags(dynamodb, product_urls))) == 10
+
+
+def test_product_tag_buffer_flush_thresholds(dynamodb, add_products):
+
+    tag_buffer = ProductTagBuffer(dynamodb, max_items=4)
+    product_urls = add_products(dynamodb, 'store.com', 3, tag_buffer=tag_buffer)
+    # 2 tags per product, flushed after the first 4
+    assert len(tag_buffer) == 2
+    assert len(list(fetch_product_tags(dynamodb, product_urls))) == 4
+
+    tag_buffer = ProductTagBuffer(dynamodb, max_delay=0)
+    product_urls = add_products(dynamodb, 'other.com', 1, tag_buffer=tag_buffer)
+    assert len(tag_buffer) == 0
+    assert len(list(fetch_product_tags(dynamodb, product_urls))) == 2
+
+
+def test_product_tag_buffer_delete_products(dynamodb, add_products):
+
+    with ProductTagBuffer(dynamodb) as tag_buffer:
+        product_urls = add_products(dynamodb, 'store.com', 3, tag_buffer=tag_buffer)
+        delete_store_products(
+            dynamodb, ['store.com/product-0', 'store.com/product-1'], tag_buffer=tag_buffer
+        )
+        # the deleted products' buffered tags are dropped, not flushed later
+        assert len(tag_buffer) == 2
+
+    assert get_store_product(dynamodb, product_urls[0]) is None
+    assert list(fetch_product_tags(dynamodb, product_urls[:2])) == []
+    assert len(list(fetch_product_tags(dynamodb, product_urls[2:]))) == 2
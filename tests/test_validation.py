@@ -1,13 +1,16 @@
 import json
 import pytest
 import pytz
+import subprocess
+import sys
 import warnings
 from datetime import datetime
 from decimal import Decimal
 
 from charm_product.validation import (
-    MINIMUM_PRICE, REQUIRED_ATTRIBUTES, ValidationError, ValidationWarning,
-    parse_store_product_data
+    MINIMUM_PRICE, PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS, REQUIRED_ATTRIBUTES,
+    ValidationError, ValidationWarning,
+    contains_blacklist_tokens, iso_date_string, parse_store_product_data, string_list
 )
 
 
@@ -127,3 +130,39 @@ def test_parse_store_product_data_invalid_price(
         parse_store_product_data(
             invalid_store_product, warn_invalid_attributes=True
         )
+
+
+@pytest.mark.parametrize('value', [[], ['a', 1], 'abc', ('a', 'b'), None])
+def test_string_list_invalid(value):
+    with pytest.raises(ValidationError):
+        string_list(value)
+
+
+def test_token_group_regexes():
+    assert PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS[:2] == [
+        '(^| )test product($| )', '(^| )gift card($| )',
+    ]
+    assert json.loads(json.dumps(PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS)) == \
+        PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS
+    assert contains_blacklist_tokens('A Gift-Card', PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS) == \
+        (True, 'gift card')
+    assert contains_blacklist_tokens('A gift', PRODUCT_TITLE_BLACKLIST_TOKEN_GROUPS) == \
+        (False, None)
+
+
+def test_iso_date_string():
+    assert iso_date_string(datetime(2020, 6, 1)) == '2020-06-01T00:00:00+00:00'
+    assert iso_date_string(
+        pytz.timezone('US/Eastern').localize(datetime(2020, 6, 1))
+    ) == '2020-06-01T04:00:00+00:00'
+
+
+def test_validation_does_not_import_boto3():
+    output = subprocess.run(
+        [
+            sys.executable, '-c',
+            'import sys, charm_product.product; print("boto3" in sys.modules)'
+        ],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip() == 'False'